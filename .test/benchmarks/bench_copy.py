@@ -0,0 +1,53 @@
+#! /usr/bin/env python3
+
+import json
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from dotfiles import copy_tree  # noqa: E402
+from synthetic import generate_tree  # noqa: E402
+
+
+def measure(func, src: Path, dst: Path, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        shutil.rmtree(dst, ignore_errors=True)
+        start = time.perf_counter()
+        func(src, dst)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(dirs: int, files: int, size: int, depth: int, repeat: int, base: Path | None) -> dict:
+    with tempfile.TemporaryDirectory(dir=base) as temp:
+        src = Path(temp) / "src"
+        dst = Path(temp) / "dst"
+        generate_tree(src, dirs, files, size, depth)
+        result = {
+            "dirs": dirs,
+            "files": dirs * files,
+            "bytes": dirs * files * size,
+            "shutil.copytree": measure(lambda s, d: shutil.copytree(s, d, symlinks=True), src, dst, repeat),
+            "copy_tree": measure(copy_tree, src, dst, repeat),
+        }
+    result["speedup"] = result["shutil.copytree"] / result["copy_tree"]
+    return result
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Compare copy_tree with shutil.copytree on a synthetic tree.")
+    parser.add_argument("--dirs", type=int, default=50, help="Number of directories.")
+    parser.add_argument("--files", type=int, default=40, help="Number of files per directory.")
+    parser.add_argument("--size", type=int, default=64 * 1024, help="Size of each file in bytes.")
+    parser.add_argument("--depth", type=int, default=2, help="Depth of each directory.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs. The best one is reported.")
+    parser.add_argument("--base", type=Path, default=None, help="Directory to create the tree in (filesystem under test).")
+    args = parser.parse_args()
+
+    print(json.dumps(main(args.dirs, args.files, args.size, args.depth, args.repeat, args.base), indent=2))
@@ -0,0 +1,121 @@
+#! /usr/bin/env python3
+
+import json
+import logging
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from dotfiles import LOGGER, backup_dst, load_check_convert_json, \
+    main_install, swap_link  # noqa: E402
+from synthetic import generate_home, generate_package_base  # noqa: E402
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(runs: list[float]) -> dict:
+    return {"best": min(runs), "median": statistics.median(runs), "runs": runs}
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(params: dict, repeat: int, jobs: int, base: Path | None) -> dict:
+    results = {name: [] for name in ["backup_dst", "swap_link", "main_install", "main_install (no-op)"]}
+    with tempfile.TemporaryDirectory(dir=base) as temp:
+        package_base = Path(temp) / "base"
+        generate_package_base(package_base, **params)
+        packages = sorted(p for p in package_base.iterdir())
+
+        for _ in range(repeat):
+            home_dir = Path(temp) / "home"
+            shutil.rmtree(home_dir, ignore_errors=True)
+            generate_home(home_dir, **params)
+            confs = [conf for p in packages for conf in load_check_convert_json(p, home_dir)]
+
+            backup_dir = Path(temp) / "backup"
+            results["backup_dst"].append(timed(
+                lambda: [backup_dst(conf.dst, backup_dir / conf.dst.parent.name, dry_run=False) for conf in confs]))
+            results["swap_link"].append(timed(lambda: [swap_link(conf) for conf in confs]))
+            shutil.rmtree(backup_dir)
+
+            shutil.rmtree(home_dir)
+            generate_home(home_dir, **params)
+            results["main_install"].append(timed(lambda: main_install(package_base, home_dir, False, jobs)))
+            results["main_install (no-op)"].append(timed(lambda: main_install(package_base, home_dir, False, jobs)))
+
+    return {name: summarize(runs) for name, runs in results.items()}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> bool:
+    ok = True
+    print(f"{'benchmark':<24}  {'baseline[s]':>12}  {'current[s]':>12}  {'ratio':>6}")
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old = baseline["results"][name]["best"]
+        new = result["best"]
+        ratio = new / old if old else float("inf")
+        mark = "  REGRESSION" if ratio > threshold else ""
+        ok = ok and not mark
+        print(f"{name:<24}  {old:>12.6f}  {new:>12.6f}  {ratio:>6.2f}{mark}")
+    return ok
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Time main_install, backup_dst, swap_link and a no-op re-run "
+                                        "on a synthetic package base.")
+    parser.add_argument("--packages", type=int, default=20, help="Number of packages.")
+    parser.add_argument("--entries", type=int, default=5, help="Number of entries per path.json.")
+    parser.add_argument("--files", type=int, default=10, help="Number of files per directory entry.")
+    parser.add_argument("--size", type=int, default=4096, help="Size of each file in bytes.")
+    parser.add_argument("--depth", type=int, default=2, help="Directory depth of each entry. 0 makes file entries.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each benchmark.")
+    parser.add_argument("--jobs", type=int, default=1, help="--jobs passed to main_install.")
+    parser.add_argument("--base", type=Path, default=None, help="Directory to create the temporary files in.")
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this file.")
+    parser.add_argument("--compare", type=Path, default=None, help="Compare with results JSON of another commit.")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Ratio to the compared result regarded as a regression.")
+    args = parser.parse_args()
+
+    LOGGER.setLevel(logging.WARNING)
+    params = {"packages": args.packages, "entries": args.entries, "files": args.files, "size": args.size,
+              "depth": args.depth}
+    current = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "params": {**params, "repeat": args.repeat, "jobs": args.jobs},
+        "results": run(params, args.repeat, args.jobs, args.base),
+    }
+
+    text = json.dumps(current, indent=2)
+    if args.output is not None:
+        args.output.write_text(text)
+    else:
+        print(text)
+
+    if args.compare is not None and not compare(current, json.loads(args.compare.read_text()), args.threshold):
+        sys.exit(1)
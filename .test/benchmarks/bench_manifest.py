@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from dotfiles import LOGGER, main  # noqa: E402
+
+
+def generate_package(package: Path, entries: int) -> None:
+    package.mkdir(parents=True)
+    with (package / "path.json").open("w") as f:
+        f.write("[\n")
+        for e in range(entries):
+            f.write(",\n" if e else "")
+            json.dump({"src": f"entry{e // 1000}/f{e % 1000}",
+                       "dst": f".local/share/image/d{e // 1000}/f{e % 1000}"}, f)
+        f.write("\n]\n")
+    for e in range(entries):
+        src = package / f"entry{e // 1000}" / f"f{e % 1000}"
+        if e % 1000 == 0:
+            src.parent.mkdir()
+        src.touch()
+    for path in [package / "path.json", package, package.parent]:
+        os.utime(path, ns=(0, 0))
+
+
+def measured(func) -> dict:
+    gc.collect()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak": peak}
+
+
+def run(sizes: list[int]) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as temp:
+        for entries in sizes:
+            package_base = Path(temp) / f"base{entries}"
+            home = Path(temp) / f"home{entries}"
+            home.mkdir()
+            generate_package(package_base / "pack", entries)
+            start = time.perf_counter()
+            main(package_base, home)
+            results[entries] = {"install": {"seconds": time.perf_counter() - start, "peak": None},
+                                "no-op": measured(lambda: main(package_base, home))}
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description="Time main() on a generated path.json and trace the peak memory of a no-op run.")
+    parser.add_argument("--entries", type=int, default=20000, help="Number of entries of the largest path.json.")
+    parser.add_argument("--steps", type=int, default=3,
+                        help="Number of sizes measured, each ten times smaller than the next.")
+    parser.add_argument("--budget", type=int, default=None,
+                        help="Exit with 1 when the peak memory per entry of a no-op run on the largest path.json "
+                             "exceeds this number of bytes.")
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this file.")
+    args = parser.parse_args()
+
+    LOGGER.setLevel(logging.WARNING)
+    sizes = sorted({max(1, args.entries // 10 ** i) for i in range(args.steps)})
+    results = run(sizes)
+
+    print(f"{'entries':>8}  {'run':<8}  {'time[s]':>8}  {'peak[MiB]':>9}  {'peak/entry[B]':>13}")
+    for entries, runs in results.items():
+        for name, result in runs.items():
+            peak = "" if result["peak"] is None else \
+                f"  {result['peak'] / 2 ** 20:>9.1f}  {result['peak'] / entries:>13.0f}"
+            print(f"{entries:>8}  {name:<8}  {result['seconds']:>8.3f}{peak}")
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    if args.budget is not None and results[sizes[-1]]["no-op"]["peak"] / sizes[-1] > args.budget:
+        sys.exit(1)
@@ -0,0 +1,51 @@
+#! /usr/bin/env python3
+
+import json
+import logging
+import sys
+import timeit
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from dotfiles import recording  # noqa: E402
+
+class FormatOnlyHandler(logging.Handler):
+    def emit(self, record):
+        self.format(record)
+
+
+LOG = logging.getLogger("bench_recording")
+LOG.addHandler(FormatOnlyHandler())
+LOG.propagate = False
+
+
+def target(json_obj, home_dir: Path, flag: bool = True):
+    return json_obj
+
+
+def main(entries: int, number: int) -> dict:
+    payload = [{"is_home": True, "src": f"file{i}", "dst": f".config/file{i}"} for i in range(entries)]
+    variants = {
+        "plain": target,
+        "recording": recording(LOG)(target),
+        "recording(compact=True)": recording(LOG, compact=True)(target),
+    }
+
+    result = {"entries": entries, "number": number}
+    for level in ["DEBUG", "INFO"]:
+        LOG.setLevel(level)
+        for name, func in variants.items():
+            seconds = timeit.timeit(lambda: func(payload, Path("home")), number=number)
+            result[f"{name} [{level}] us/call"] = seconds / number * 1e6
+    return result
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Measure the per-call overhead of the recording decorator.")
+    parser.add_argument("--entries", type=int, default=1000, help="Number of entries in the JSON argument.")
+    parser.add_argument("--number", type=int, default=2000, help="Number of calls per variant.")
+    args = parser.parse_args()
+
+    print(json.dumps(main(args.entries, args.number), indent=2))
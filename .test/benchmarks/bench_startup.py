@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from synthetic import generate_package_base  # noqa: E402
+
+
+def age(root: Path) -> None:
+    for parent, dirs, files in os.walk(root):
+        for name in dirs + files:
+            os.utime(os.path.join(parent, name), ns=(0, 0), follow_symlinks=False)
+    os.utime(root, ns=(0, 0))
+
+
+def timed(args: list[str], cwd: Path, env: dict, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL)
+        runs.append((time.perf_counter() - start) * 1000)
+    return {"best": min(runs), "median": statistics.median(runs)}
+
+
+def import_times(env: dict, repeat: int) -> dict:
+    totals = []
+    modules = {}
+    for _ in range(repeat):
+        stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import dotfiles"], env=env, check=True,
+                                capture_output=True, text=True).stderr
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            name = name.strip()
+            if depth == 1:
+                modules[name] = min(modules.get(name, float("inf")), int(cumulative) / 1000)
+            elif name == "dotfiles":
+                totals.append(int(cumulative) / 1000)
+    top = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:10]
+    return {"best": min(totals), "median": statistics.median(totals), "top": dict(top)}
+
+
+def run(packages: int, entries: int, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory() as temp:
+        package_base = Path(temp) / "base"
+        home = Path(temp) / "home"
+        home.mkdir()
+        generate_package_base(package_base, packages, entries, files=1, size=64, depth=0)
+        age(package_base)
+        env = {**os.environ, "PYTHONPATH": str(ROOT), "HOME": str(home)}
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        fast = [sys.executable, "-m", "dotfiles", "--log-level", "ERROR"]
+        subprocess.run(fast, cwd=package_base, env=env, check=True)
+        if not (home / ".dotbackup" / "fingerprint.json").exists():
+            sys.exit("fingerprint.json was not written; the no-op runs below would not be measured.")
+
+        results = {
+            "python": timed([sys.executable, "-c", "pass"], package_base, env, repeat),
+            "import": import_times(env, repeat),
+            "no-op": timed(fast, package_base, env, repeat),
+            "status": timed(fast + ["--status"], package_base, env, repeat),
+            "no-op (script)": timed([sys.executable, str(ROOT / "dotfiles.py"), "--log-level", "ERROR"],
+                                    package_base, env, repeat),
+        }
+        runs = []
+        for _ in range(repeat):
+            (home / ".dotbackup" / "fingerprint.json").unlink(missing_ok=True)
+            runs.append(timed(fast, package_base, env, 1)["best"])
+        results["no-op (full check)"] = {"best": min(runs), "median": statistics.median(runs)}
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Time cold starts of a no-op install and --status with -X importtime, "
+                                        "and fail when importing dotfiles, a no-op run or --status exceeds the "
+                                        "budget.")
+    parser.add_argument("--packages", type=int, default=20, help="Number of packages.")
+    parser.add_argument("--entries", type=int, default=5, help="Number of entries per path.json.")
+    parser.add_argument("--repeat", type=int, default=10, help="Number of runs of each benchmark.")
+    parser.add_argument("--budget", type=float, default=50.0,
+                        help="Milliseconds the median import of dotfiles, no-op run and --status run may each take.")
+    args = parser.parse_args()
+
+    results = run(args.packages, args.entries, args.repeat)
+    print(json.dumps(results, indent=2))
+    over = [name for name in ["import", "no-op", "status"] if results[name]["median"] > args.budget]
+    for name in over:
+        print(f"{name} took {results[name]['median']:.1f} ms, over the budget of {args.budget} ms.", file=sys.stderr)
+    if over:
+        sys.exit(1)
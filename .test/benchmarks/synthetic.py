@@ -0,0 +1,36 @@
+import json
+import os
+from pathlib import Path
+
+
+def generate_tree(root: Path, dirs: int, files: int, size: int, depth: int) -> None:
+    for d in range(dirs):
+        parent = root.joinpath(*[f"d{d}_{i}" for i in range(depth)])
+        parent.mkdir(parents=True, exist_ok=True)
+        for f in range(files):
+            (parent / f"f{f}").write_bytes(os.urandom(size))
+
+
+def generate_entry(path: Path, files: int, size: int, depth: int) -> None:
+    if depth == 0:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(size))
+        return
+    generate_tree(path, 1, files, size, depth)
+
+
+def generate_package_base(package_base: Path, packages: int, entries: int, files: int, size: int,
+                          depth: int, ) -> None:
+    for p in range(packages):
+        package = package_base / f"pack{p}"
+        json_obj = []
+        for e in range(entries):
+            generate_entry(package / f"entry{e}", files, size, depth)
+            json_obj.append({"src": f"entry{e}", "dst": f".config/pack{p}/entry{e}"})
+        (package / "path.json").write_text(json.dumps(json_obj))
+
+
+def generate_home(home_dir: Path, packages: int, entries: int, files: int, size: int, depth: int) -> None:
+    for p in range(packages):
+        for e in range(entries):
+            generate_entry(home_dir / ".config" / f"pack{p}" / f"entry{e}", files, size, depth)
@@ -0,0 +1,97 @@
+import json
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import dotfiles
+from dotfiles import backup_to_archive, extract_archived, index_path, list_archives, main_install, main_restore
+from dotfiles import PathConfig, BACKUP_ARCHIVES
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.copy_templates()
+        self.temp = tempfile.TemporaryDirectory()
+        (self.home_dir / "file1_1").write_text("file1_1")
+        (self.home_dir / "dir2_1" / "file2_1_1").write_text("file2_1_1" * 1000)
+        (self.home_dir / "dir2_1" / "link").symlink_to("file2_1_1")
+        self.confs = [
+            PathConfig(Path("unused"), self.home_dir / "file1_1"),
+            PathConfig(Path("unused"), self.home_dir / "dir2_1"),
+            PathConfig(Path("unused"), self.home_dir / "symlink10_1"),
+            PathConfig(Path("unused"), self.home_dir / "not_exist"),
+        ]
+
+    def test_readable_by_tarfile(self):
+        for backup_format in BACKUP_ARCHIVES:
+            with self.subTest(backup_format=backup_format):
+                archive = backup_to_archive(self.confs, self.backup_dir / "pack", backup_format)
+                self.assertTrue(archive.name.endswith(backup_format))
+                with tarfile.open(archive) as tar:
+                    self.assertListEqual(["file1_1", "dir2_1", "dir2_1/file2_1_1", "dir2_1/link"], tar.getnames())
+                    self.assertEqual(b"file1_1", tar.extractfile("file1_1").read())
+
+                index = json.loads(index_path(archive).read_text())
+                self.assertListEqual(
+                    [str((self.home_dir / name).absolute()) for name in ["file1_1", "dir2_1"]],
+                    [entry["dst"] for entry in index["entries"]],
+                )
+
+    def test_extract_one_stream(self):
+        with mock.patch("dotfiles.ARCHIVE_CHUNK", 1):
+            archive = backup_to_archive(self.confs, self.backup_dir / "pack", "tar.gz", jobs=4)
+        self.assertEqual(4, len({m["stream"] for m in json.loads(index_path(archive).read_text())["members"]}))
+
+        to = Path(self.temp.name)
+        with mock.patch("dotfiles._decompress", wraps=dotfiles._decompress) as decompress:
+            extract_archived(archive, "file1_1", to / "file1_1")
+        self.assertEqual(1, decompress.call_count)
+        self.assertEqual("file1_1", (to / "file1_1").read_text())
+
+        extract_archived(archive, "dir2_1", to / "dir2_1")
+        self.assertEqual("file2_1_1" * 1000, (to / "dir2_1" / "file2_1_1").read_text())
+        self.assertEqual("file2_1_1", str((to / "dir2_1" / "link").readlink()))
+
+    def test_install_and_restore(self):
+        package_base = Path(self.temp.name) / "packages"
+        self.copy_packages(Path("package_bases/normal"), ["pack1", "pack2"], package_base)
+
+        main_install(package_base, self.home_dir, is_dry_run=False, backup_format="tar.xz")
+        self.assertTrue((self.home_dir / "file1_1").is_symlink())
+        for pack in ["pack1", "pack2"]:
+            with self.subTest(pack=pack):
+                names = sorted(p.name.split(".", 1)[1] for p in (self.backup_dir / pack).iterdir())
+                self.assertListEqual(["tar.xz", "tar.xz.json"], names)
+
+        main_restore(package_base, self.home_dir, is_dry_run=False)
+        self.assertEqual("file1_1", (self.home_dir / "file1_1").read_text())
+        self.assertEqual("file2_1_1" * 1000, (self.home_dir / "dir2_1" / "file2_1_1").read_text())
+
+    def test_restore_from_every_archive(self):
+        package_base = Path(self.temp.name) / "packages"
+        self.copy_packages(Path("package_bases/normal"), ["pack3"], package_base)
+        (self.home_dir / "dir3_1").rename(Path(self.temp.name) / "dir3_1")
+        (self.home_dir / "file3_1").write_text("first")
+        main_install(package_base, self.home_dir, is_dry_run=False, backup_format="tar.gz")
+
+        (self.home_dir / "dir3_1").unlink()
+        (Path(self.temp.name) / "dir3_1").rename(self.home_dir / "dir3_1")
+        main_install(package_base, self.home_dir, is_dry_run=False, backup_format="tar.gz")
+        self.assertEqual(2, len(list_archives(self.backup_dir / "pack3")))
+
+        main_restore(package_base, self.home_dir, is_dry_run=False)
+        self.assertEqual("first", (self.home_dir / "file3_1").read_text())
+        self.assertFalse((self.home_dir / "dir3_1").is_symlink())
+        self.assertTrue((self.home_dir / "dir3_1" / "file3_1_1").exists())
+
+    def tearDown(self):
+        self.temp.cleanup()
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from dotfiles import backup_to_store, prune_store, object_path, list_generations, main_install, main_restore
+from dotfiles import PathConfig, BACKUP_STORE
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.copy_templates()
+        self.store_dir = self.backup_dir / ".store"
+        (self.home_dir / "file1_1").write_text("file1_1")
+        (self.home_dir / "dir2_1" / "file2_1_1").write_text("file2_1_1")
+        self.confs = [
+            PathConfig(Path("unused"), self.home_dir / "file1_1"),
+            PathConfig(Path("unused"), self.home_dir / "dir2_1"),
+            PathConfig(Path("unused"), self.home_dir / "symlink10_1"),
+            PathConfig(Path("unused"), self.home_dir / "not_exist"),
+        ]
+
+    def test_normal(self):
+        generation = backup_to_store(self.confs, self.store_dir, "pack")
+        entries = json.loads(generation.read_text())["entries"]
+        self.assertListEqual(
+            [str((self.home_dir / name).absolute()) for name in ["file1_1", "dir2_1"]],
+            [entry["dst"] for entry in entries],
+        )
+        self.assertEqual("file1_1", object_path(self.store_dir, entries[0]["object"]).read_text())
+        tree = entries[1]["tree"]
+        self.assertListEqual(["file2_1_1"], [child["path"] for child in tree])
+        self.assertEqual("file2_1_1", object_path(self.store_dir, tree[0]["object"]).read_text())
+
+    def test_dedup(self):
+        first = json.loads(backup_to_store(self.confs, self.store_dir, "pack").read_text())
+        second = json.loads(backup_to_store(self.confs, self.store_dir, "pack").read_text())
+        self.assertEqual(7, first["entries"][0]["stored"])
+        self.assertEqual(0, second["entries"][0]["stored"])
+        self.assertEqual(0, second["entries"][1]["tree"][0]["stored"])
+        self.assertEqual(first["entries"][0]["object"], second["entries"][0]["object"])
+
+    def test_prune(self):
+        first = json.loads(backup_to_store(self.confs, self.store_dir, "pack").read_text())
+        (self.home_dir / "file1_1").write_text("changed")
+        second = json.loads(backup_to_store(self.confs, self.store_dir, "pack").read_text())
+        self.assertEqual(2, len(list_generations(self.store_dir, "pack")))
+
+        self.assertTupleEqual((1, 1), prune_store(self.store_dir, keep=1, keep_days=None, dry_run=False))
+        self.assertEqual(1, len(list_generations(self.store_dir, "pack")))
+        self.assertFalse(object_path(self.store_dir, first["entries"][0]["object"]).exists())
+        self.assertTrue(object_path(self.store_dir, second["entries"][0]["object"]).exists())
+        self.assertTrue(object_path(self.store_dir, second["entries"][1]["tree"][0]["object"]).exists())
+
+    def test_prune_keep_days(self):
+        backup_to_store(self.confs, self.store_dir, "pack")
+        backup_to_store(self.confs, self.store_dir, "pack")
+        self.assertTupleEqual((0, 0), prune_store(self.store_dir, keep=0, keep_days=1, dry_run=False))
+        self.assertTupleEqual((2, 2), prune_store(self.store_dir, keep=0, keep_days=None, dry_run=False))
+
+    def test_install_and_restore(self):
+        with tempfile.TemporaryDirectory() as temp:
+            package_base = Path(temp)
+            self.copy_packages(Path("package_bases/normal"), ["pack1", "pack2"], package_base)
+            main_install(package_base, self.home_dir, is_dry_run=False, backup_format=BACKUP_STORE)
+            self.assertTrue((self.home_dir / "dir2_1").is_symlink())
+            (self.home_dir / "file1_1").unlink()
+            (self.home_dir / "file1_1").write_text("second")
+            main_install(package_base, self.home_dir, is_dry_run=False, backup_format=BACKUP_STORE)
+            self.assertEqual(2, len(list_generations(self.store_dir, "pack1")))
+
+            main_restore(package_base, self.home_dir, is_dry_run=False)
+        self.assertEqual("second", (self.home_dir / "file1_1").read_text())
+        self.assertEqual("file2_1_1", (self.home_dir / "dir2_1" / "file2_1_1").read_text())
+
+    def tearDown(self):
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,9 @@
+import json
 import unittest
 
 from pathlib import Path
 
-from dotfiles import check_json, cache_load_json
+from dotfiles import check_json
 from util import TestUtil
 
 
@@ -20,9 +21,9 @@ class MyTestCase(TestUtil.BaseTest):
             TypeError,
         ]
         for pack, e in zip(packs, expected_errors):
-            json = cache_load_json(dotfile / pack / "path.json")
+            json_obj = json.loads((dotfile / pack / "path.json").read_text())
             with self.subTest(package=pack, error=e), self.assertRaises(e):
-                check_json(json)
+                check_json(json_obj)
 
 
 if __name__ == '__main__':
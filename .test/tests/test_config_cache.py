@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import dotfiles
+from dotfiles import ConfigCache, LOGGER, load_check_convert_json, main
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.temp = tempfile.TemporaryDirectory()
+        self.package_base = Path(self.temp.name)
+        self.copy_packages(Path("package_bases/normal"), ["pack1", "pack3"], self.package_base)
+        self.copy_packages(Path("package_bases/negative"), ["pack1"], self.package_base / "negative")
+        self.cache_path = self.package_base / "cache.json"
+        for pack in ["pack1", "pack3"]:
+            os.utime(self.package_base / pack / "path.json", ns=(0, 0))
+
+    def load(self, cache: ConfigCache, pack: str) -> tuple[list, str, list[str]]:
+        with self.assertLogs(LOGGER, level=logging.DEBUG) as cm:
+            json_obj, digest = cache.load(self.package_base / pack / "path.json")
+        return json_obj, digest, [m for m in cm.output if " is " in m and "path.json" in m]
+
+    def test_hit(self):
+        cache = ConfigCache.open(self.cache_path)
+        json_obj, digest, messages = self.load(cache, "pack3")
+        self.assertEqual(2, len(json_obj))
+        self.assertTrue(messages[0].endswith("is new or changed."))
+        cache.save(dry_run=False)
+
+        cache = ConfigCache.open(self.cache_path)
+        cached, cached_digest, messages = self.load(cache, "pack3")
+        self.assertTrue(messages[0].endswith("is unchanged."))
+        self.assertListEqual(json_obj, cached)
+        self.assertEqual(digest, cached_digest)
+
+    def test_touched_and_changed(self):
+        cache = ConfigCache.open(self.cache_path)
+        self.load(cache, "pack1")
+        cache.save(dry_run=False)
+
+        json_path = self.package_base / "pack1" / "path.json"
+        json_path.touch()
+        _, _, messages = self.load(ConfigCache.open(self.cache_path), "pack1")
+        self.assertTrue(messages[0].endswith("is touched but unchanged."))
+
+        json_path.write_text('{"src": "file1_1", "dst": "other"}')
+        json_obj, _, messages = self.load(ConfigCache.open(self.cache_path), "pack1")
+        self.assertTrue(messages[0].endswith("is new or changed."))
+        self.assertListEqual([{"src": "file1_1", "dst": "other", "is_home": True}], json_obj)
+
+    def test_removed(self):
+        cache = ConfigCache.open(self.cache_path)
+        self.load(cache, "pack1")
+        self.load(cache, "pack3")
+        cache.save(dry_run=False)
+
+        cache = ConfigCache.open(self.cache_path)
+        self.load(cache, "pack1")
+        cache.save(dry_run=False)
+        records = json.loads(self.cache_path.read_text())["records"]
+        self.assertListEqual([str((self.package_base / "pack1" / "path.json").absolute())], list(records))
+
+    def test_invalid(self):
+        cache = ConfigCache.open(self.cache_path)
+        with self.assertRaises(TypeError):
+            cache.load(self.package_base / "negative" / "pack1" / "path.json")
+
+    def test_dry_run(self):
+        cache = ConfigCache.open(self.cache_path)
+        self.load(cache, "pack1")
+        cache.save(dry_run=True)
+        self.assertFalse(self.cache_path.exists())
+
+    def test_large(self):
+        cache = ConfigCache.open(self.cache_path)
+        with mock.patch("dotfiles.CONFIG_CACHE_MAX_ENTRIES", 1):
+            json_obj, _, _ = self.load(cache, "pack3")
+        self.assertIsNone(json_obj)
+        cache.save(dry_run=False)
+        records = json.loads(self.cache_path.read_text())["records"]
+        self.assertIsNone(records[str((self.package_base / "pack3" / "path.json").absolute())]["json"])
+
+        home = self.package_base / "home"
+        pack = self.package_base / "pack3"
+        self.assertListEqual(load_check_convert_json(pack, home), ConfigCache.open(self.cache_path).configs(pack, home))
+
+    def test_convert_once(self):
+        package_base = self.package_base / "base"
+        self.copy_packages(Path("package_bases/normal"), ["pack1", "pack3"], package_base)
+        home = self.package_base / "home"
+        home.mkdir()
+        with mock.patch("dotfiles.list_json_to_config", wraps=dotfiles.list_json_to_config) as convert:
+            main(package_base, home)
+        self.assertEqual(2, convert.call_count)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
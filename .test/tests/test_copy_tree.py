@@ -0,0 +1,51 @@
+import os
+import unittest
+from filecmp import dircmp
+from pathlib import Path
+
+from dotfiles import copy_file, copy_tree, CopyStats
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.src = self.extra_dst / "tree"
+        (self.src / "sub" / "deep").mkdir(parents=True)
+        (self.src / "a").write_bytes(b"a" * 100)
+        (self.src / "sub" / "b").write_bytes(os.urandom(3 * 1024 * 1024 + 7))
+        (self.src / "sub" / "deep" / "c").write_text("c")
+        (self.src / "link").symlink_to("sub/b")
+
+    def test_copy_file(self):
+        to = self.home_dir / "a"
+        self.assertEqual(100, copy_file(self.src / "a", to))
+        self.assertEqual(b"a" * 100, to.read_bytes())
+        self.assertEqual((self.src / "a").stat().st_mtime_ns, to.stat().st_mtime_ns)
+
+    def test_copy_tree(self):
+        to = self.home_dir / "tree"
+        stats = copy_tree(self.src, to, jobs=4)
+        self.assertEqual(CopyStats(files=3, bytes=100 + 3 * 1024 * 1024 + 7 + 1), stats)
+        self.assertTrue((to / "link").is_symlink())
+        self.assertEqual("sub/b", os.readlink(to / "link"))
+
+        cmp = dircmp(self.src, to)
+        self.assertFalse(cmp.diff_files)
+        self.assertFalse(cmp.subdirs["sub"].diff_files)
+        self.assertFalse(cmp.subdirs["sub"].subdirs["deep"].diff_files)
+        self.assertEqual((self.src / "sub").stat().st_mtime_ns, (to / "sub").stat().st_mtime_ns)
+
+    def test_copy_tree_exist_ok(self):
+        to = self.home_dir / "tree"
+        copy_tree(self.src, to)
+        (self.src / "a").write_text("changed")
+        copy_tree(self.src, to)
+        self.assertEqual("changed", (to / "a").read_text())
+
+    def tearDown(self):
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
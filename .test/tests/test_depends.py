@@ -0,0 +1,111 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from dotfiles import DestinationIndex, build_dst_index, main_install, run_per_package, topological_order, check_json
+from dotfiles import ConfigCache, PathConfig, MODE_FILES
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        root = Path(self.temp.name)
+        self.package_base = root / "packages"
+        self.home = root / "home"
+        self.home.mkdir()
+
+    def add_package(self, name: str, depends: list[str], files: list[str] = ()):
+        (self.package_base / name).mkdir(parents=True)
+        for file in files:
+            (self.package_base / name / file).write_text(file)
+        entries = [{"src": file, "dst": f"{name}/{file}"} for file in files]
+        (self.package_base / name / "path.json").write_text(json.dumps({"depends": depends, "entries": entries}))
+
+    def test_order(self):
+        depends = {"a": ["c"], "b": [], "c": ["d", "e"], "d": [], "e": ["b"]}
+        self.assertListEqual(["b", "d", "e", "c", "a"], topological_order(depends))
+
+    def test_overlaps_are_ordered(self):
+        index = DestinationIndex()
+        index.add("b", [PathConfig(Path("b"), self.home / ".config" / "nvim")])
+        index.add("a", [PathConfig(Path("a"), self.home / ".config", MODE_FILES)], ["c"])
+        index.add("c", [PathConfig(Path("c"), self.home / ".zshrc")])
+        index.check()
+        self.assertDictEqual({"a": ["c"], "b": ["a"], "c": []}, index.depends())
+        self.assertListEqual(["c", "a", "b"], topological_order(index.depends()))
+
+    def test_cycle(self):
+        with self.assertLogs("dotfiles", "ERROR") as cm, self.assertRaises(RuntimeError):
+            topological_order({"a": ["b"], "b": ["c"], "c": ["b"], "d": []})
+        self.assertIn("ERROR:dotfiles:Packages depend on each other: b -> c -> b.", cm.output)
+
+        self.add_package("x", ["y"])
+        self.add_package("y", ["x"])
+        with self.assertLogs("dotfiles", "ERROR"), self.assertRaises(RuntimeError):
+            main_install(self.package_base, self.home, is_dry_run=False)
+
+    def test_unknown(self):
+        self.add_package("x", ["y"])
+        with self.assertLogs("dotfiles", "ERROR"), self.assertRaises(KeyError):
+            build_dst_index(self.package_base, self.home, ConfigCache())
+        with self.assertLogs("dotfiles", "WARNING"):
+            build_dst_index(self.package_base, self.home, ConfigCache(), skip_broken=True)
+
+    def test_invalid(self):
+        for json_obj in [{"depends": "x", "entries": []}, {"depends": [1], "entries": []}, {"entries": 1}]:
+            with self.subTest(json_obj=json_obj), self.assertLogs("dotfiles", "ERROR"), self.assertRaises(TypeError):
+                check_json(json_obj)
+
+    def test_schedule(self):
+        depends = {"base": [], "nvim": ["base"], "zsh": ["base"], "git": [], "tmux": ["zsh", "git"]}
+        packages = [self.package_base / name for name in sorted(depends)]
+        spans = {}
+        lock = threading.Lock()
+
+        def run(path: Path) -> str:
+            start = time.monotonic()
+            time.sleep(0.05)
+            with lock:
+                spans[path.name] = (start, time.monotonic())
+            return path.name
+
+        self.assertListEqual([path.name for path in packages], run_per_package(run, packages, 4, depends))
+        for name, required in depends.items():
+            for other in required:
+                self.assertLessEqual(spans[other][1], spans[name][0])
+        self.assertLess(spans["base"][0], spans["git"][1])
+        self.assertLess(spans["nvim"][0], spans["zsh"][1])
+
+    def test_failure_skips_dependents(self):
+        depends = {"a": [], "b": ["a"], "c": []}
+        packages = [self.package_base / name for name in sorted(depends)]
+        called = []
+
+        def run(path: Path):
+            called.append(path.name)
+            if path.name == "a":
+                raise OSError(path.name)
+
+        for jobs in [1, 4]:
+            called.clear()
+            with self.subTest(jobs=jobs), self.assertRaises(OSError):
+                run_per_package(run, packages, jobs, depends)
+            self.assertNotIn("b", called)
+
+    def test_install(self):
+        self.add_package("zsh", ["base"], [".zshrc"])
+        self.add_package("base", [], [".profile"])
+        main_install(self.package_base, self.home, is_dry_run=False, jobs=4)
+        self.assertTrue((self.home / "zsh" / ".zshrc").is_symlink())
+        self.assertTrue((self.home / "base" / ".profile").is_symlink())
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from dotfiles import DestinationIndex, build_dst_index, main_install, main_status, ConfigCache, PathConfig
+from dotfiles import DUPLICATE, NESTED, LINKED, MODE_FILES
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        root = Path(self.temp.name)
+        self.package_base = root / "packages"
+        self.home = root / "home"
+        self.home.mkdir()
+
+    def add_package(self, name: str, entries: list[dict], files: list[str]):
+        for file in files:
+            path = self.package_base / name / file
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(file)
+        (self.package_base / name / "path.json").write_text(json.dumps(entries))
+
+    def test_overlaps(self):
+        index = DestinationIndex()
+        index.add("a", [PathConfig(Path("a"), self.home / ".config"), PathConfig(Path("a"), self.home / ".zshrc")])
+        index.add("b", [PathConfig(Path("b"), self.home / ".config" / "nvim" / "init.lua")])
+        index.add("c", [PathConfig(Path("c"), self.home / ".zshrc")])
+        index.add("d", [PathConfig(Path("d"), self.home / ".vimrc")])
+
+        errors = index.check()
+        self.assertEqual({(DUPLICATE, "a", "c"), (NESTED, "a", "b")},
+                         {(overlap.kind, overlap.outer[0], overlap.inner[0]) for overlap in errors})
+        self.assertListEqual([["a", "b", "c"], ["d"]], index.groups())
+
+    def test_files_mode_may_hold_other_destinations(self):
+        index = DestinationIndex()
+        index.add("b", [PathConfig(Path("b"), self.home / ".config" / "nvim")])
+        index.add("a", [PathConfig(Path("a"), self.home / ".config", MODE_FILES)])
+        self.assertListEqual([], index.check())
+        self.assertEqual(frozenset([str(self.home / ".config" / "nvim")]), index.reserved(self.home / ".config"))
+        self.assertListEqual([["a", "b"]], index.groups())
+
+    def test_build_raises(self):
+        self.add_package("a", [{"src": "nvim", "dst": ".config/nvim"}], ["nvim/init.lua"])
+        self.add_package("b", [{"src": "init.lua", "dst": ".config/nvim/init.lua"}], ["init.lua"])
+        with self.assertLogs("dotfiles", "ERROR"), self.assertRaises(RuntimeError):
+            build_dst_index(self.package_base, self.home, ConfigCache())
+        with self.assertRaises(RuntimeError):
+            main_install(self.package_base, self.home, is_dry_run=False)
+        self.assertFalse((self.home / ".config").exists())
+
+    def test_install_nested(self):
+        self.add_package("a", [{"src": "config", "dst": ".config", "mode": MODE_FILES}],
+                         ["config/git/config", "config/nvim/init.lua"])
+        self.add_package("b", [{"src": "nvim", "dst": ".config/nvim"}], ["nvim/init.lua"])
+        main_install(self.package_base, self.home, is_dry_run=False, jobs=4)
+
+        config = self.home / ".config"
+        self.assertFalse(config.is_symlink())
+        self.assertEqual(str(self.package_base / "a" / "config" / "git"), os.readlink(config / "git"))
+        self.assertEqual(str(self.package_base / "b" / "nvim"), os.readlink(config / "nvim"))
+        report = main_status(self.package_base, self.home)
+        self.assertEqual(2, report["summary"][LINKED])
+
+    def test_many_entries(self):
+        index = DestinationIndex()
+        for i in range(200):
+            index.add(f"pack{i}", [PathConfig(Path("src"), self.home / f"dir{i}" / f"file{j}") for j in range(100)])
+        self.assertListEqual([], index.check())
+        self.assertEqual(200, len(index.groups()))
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from dotfiles import ConfigCache, LOGGER, check_json, list_json_to_config, normalize_json
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        root = Path(self.temp.name)
+        self.package = root / "pack"
+        self.home = root / "home"
+        for file in ["bin/tool", "bin/tool.orig", "config/a/b/c.toml", "config/a/d.toml", "config/a/e.txt",
+                     ".zshrc", ".bashrc", "skip/me"]:
+            path = self.package / file
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(file)
+        self.json_obj = normalize_json([
+            {"src": "bin/*", "exclude": ["*.orig"], "dst": ".local/bin/{name}"},
+            {"src": "config/**/*.toml", "dst": ".config/{path}"},
+            {"src": ".*rc", "dst": "{stem}{suffix}"},
+            {"src": "bin", "dst": "bin"},
+        ])
+        check_json(self.json_obj)
+
+    def age(self):
+        for root, dirs, _ in os.walk(self.package):
+            os.utime(root, ns=(0, 0))
+
+    def expand(self, cache: ConfigCache) -> tuple[list, list[str]]:
+        with self.assertLogs(LOGGER, level=logging.DEBUG) as cm:
+            confs = list_json_to_config(self.json_obj, self.home, self.package, cache)
+        return confs, [m for m in cm.output if m.endswith("start---------- [walk]")]
+
+    def test_expand(self):
+        confs = list_json_to_config(self.json_obj, self.home, self.package)
+        self.assertListEqual([
+            ("bin/tool", ".local/bin/tool"),
+            ("config/a/b/c.toml", ".config/a/b/c.toml"),
+            ("config/a/d.toml", ".config/a/d.toml"),
+            (".bashrc", ".bashrc"),
+            (".zshrc", ".zshrc"),
+            ("bin", "bin"),
+        ], [(str(conf.src.relative_to(self.package)), str(conf.dst.relative_to(self.home))) for conf in confs])
+
+    def test_excluded_by_earlier_glob(self):
+        (self.package / "bin" / "b.md").write_text("b")
+        json_obj = normalize_json([
+            {"src": "bin/*", "exclude": ["*.md"], "dst": ".local/bin/{name}"},
+            {"src": "bin/*.md", "dst": "docs/{name}"},
+        ])
+        confs = list_json_to_config(json_obj, self.home, self.package)
+        self.assertListEqual([
+            ("bin/tool", ".local/bin/tool"),
+            ("bin/tool.orig", ".local/bin/tool.orig"),
+            ("bin/b.md", "docs/b.md"),
+        ], [(str(conf.src.relative_to(self.package)), str(conf.dst.relative_to(self.home))) for conf in confs])
+
+    def test_invalid(self):
+        for entry, e in [
+            ({"src": "*", "dst": ".config"}, KeyError),
+            ({"src": "*", "dst": ".config/{nope}"}, KeyError),
+            ({"src": "*", "dst": ".config/{name"}, ValueError),
+            ({"src": "*", "dst": "{name}", "exclude": "*.orig"}, TypeError),
+        ]:
+            with self.subTest(entry=entry), self.assertLogs(LOGGER, "ERROR"), self.assertRaises(e):
+                check_json(entry)
+
+    def test_cache(self):
+        cache_path = Path(self.temp.name) / "cache.json"
+        self.age()
+        cache = ConfigCache.open(cache_path)
+        expected, walks = self.expand(cache)
+        self.assertEqual(1, len(walks))
+        cache.save(dry_run=False)
+
+        cached, walks = self.expand(ConfigCache.open(cache_path))
+        self.assertListEqual([], walks)
+        self.assertListEqual(expected, cached)
+
+        (self.package / "skip" / "new").write_text("new")
+        _, walks = self.expand(ConfigCache.open(cache_path))
+        self.assertListEqual([], walks, "directories no glob can match are not watched")
+
+        (self.package / "config" / "a" / "b" / "f.toml").write_text("f")
+        confs, walks = self.expand(ConfigCache.open(cache_path))
+        self.assertEqual(1, len(walks))
+        self.assertIn(self.package / "config/a/b/f.toml", [conf.src for conf in confs])
+
+    def test_many_files(self):
+        for i in range(100):
+            directory = self.package / "config" / f"dir{i}"
+            directory.mkdir()
+            for j in range(50):
+                (directory / f"file{j}.toml").write_text("")
+        confs = list_json_to_config(self.json_obj, self.home, self.package)
+        self.assertEqual(5006, len(confs))
+        self.assertEqual(len(confs), len({conf.dst for conf in confs}))
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
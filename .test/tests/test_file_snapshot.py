@@ -0,0 +1,49 @@
+import unittest
+from pathlib import Path
+
+from dotfiles import FileSnapshot, install_package, read_file_state, BACKUP, LINK
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.copy_templates()
+        self.src = Path("package_bases/normal/pack1/file1_1").absolute()
+
+    def test_read_file_state(self):
+        self.assertTrue(read_file_state(self.home_dir / "not_exist").missing)
+        self.assertTrue(read_file_state(self.home_dir / "file1_1" / "child").missing)
+        self.assertTrue(read_file_state(self.home_dir / "file1_1").is_file)
+        self.assertTrue(read_file_state(self.home_dir / "dir2_1").is_dir)
+
+        state = read_file_state(self.home_dir / "symlink10_1")
+        self.assertTrue(state.is_symlink)
+        self.assertIsNotNone(state.target)
+        self.assertTrue(read_file_state(self.home_dir / "symlink10_1", follow_symlinks=True).missing)
+
+    def test_cached_until_invalidated(self):
+        snapshot = FileSnapshot()
+        path = self.home_dir / "file1_1"
+        self.assertIs(snapshot.get(path), snapshot.get(path))
+        self.assertEqual(1, snapshot.misses)
+
+        snapshot.invalidate(self.home_dir, recursive=True)
+        path.unlink()
+        self.assertTrue(snapshot.get(path).missing)
+        self.assertEqual(2, snapshot.misses)
+
+    def test_install_stats_each_path_once(self):
+        snapshot = FileSnapshot()
+        plan = install_package(Path("package_bases/normal/pack1").absolute(), self.home_dir, is_dry_run=False,
+                               snapshot=snapshot)
+        # One lstat per dst while planning, one per backup copy and one stat per src while linking.
+        links = plan.actions(LINK)
+        self.assertEqual(2 * len(links) + len(plan.actions(BACKUP)), snapshot.misses)
+
+    def tearDown(self):
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
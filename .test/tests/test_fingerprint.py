@@ -0,0 +1,85 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest import mock
+
+from dotfiles import main, main_status, check_fingerprint, fingerprint_status, FINGERPRINT_FILE, MODE_FILES
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.temp = tempfile.TemporaryDirectory()
+        root = Path(self.temp.name)
+        self.package_base = root / "packages"
+        self.copy_packages(Path("package_bases/normal"), ["pack1", "pack2", "pack3"], self.package_base)
+        self.home = root / "home"
+        shutil.copytree(self.temp_dir / "home", self.home, symlinks=True)
+        self.fingerprint_path = self.home / ".dotbackup" / FINGERPRINT_FILE
+        self.age()
+
+    def age(self):
+        for root, dirs, files in os.walk(self.package_base):
+            for name in dirs + files:
+                os.utime(os.path.join(root, name), ns=(0, 0), follow_symlinks=False)
+        os.utime(self.package_base, ns=(0, 0))
+
+    def install(self):
+        with mock.patch("dotfiles.CONFIG_CACHE_RACY_NS", 0):
+            main(self.package_base, self.home)
+
+    def test_up_to_date(self):
+        self.assertIsNone(check_fingerprint(self.package_base, self.home))
+        self.install()
+        packages = check_fingerprint(self.package_base, self.home)
+        self.assertListEqual(["pack1", "pack2", "pack3"], list(packages))
+        self.assertEqual(main_status(self.package_base, self.home), fingerprint_status(packages))
+
+    def test_changes(self):
+        self.install()
+        for change in [
+            lambda: (self.package_base / "pack1" / "path.json").write_text('{"src": "file1_1", "dst": "other"}'),
+            lambda: (self.package_base / "pack4").mkdir(),
+            lambda: (self.home / "file1_1").unlink(),
+        ]:
+            with self.subTest(change=change):
+                self.assertIsNotNone(check_fingerprint(self.package_base, self.home))
+                change()
+                self.assertIsNone(check_fingerprint(self.package_base, self.home))
+                shutil.rmtree(self.package_base / "pack4", ignore_errors=True)
+                (self.package_base / "pack1" / "path.json").write_text('{"src": "file1_1", "dst": "file1_1"}')
+                self.age()
+                self.install()
+
+    def test_other_package_base(self):
+        self.install()
+        self.assertIsNone(check_fingerprint(self.package_base / "pack1", self.home))
+
+    def test_files_mode(self):
+        (self.package_base / "pack3" / "path.json").write_text(json.dumps({"src": "dir3_1", "dst": "dir3_1",
+                                                                           "mode": MODE_FILES}))
+        self.age()
+        self.install()
+        self.assertFalse(self.fingerprint_path.exists())
+
+    def test_forgotten(self):
+        self.install()
+        self.assertTrue(self.fingerprint_path.exists())
+        with redirect_stdout(io.StringIO()):
+            main(self.package_base, self.home, is_dry_run=True)
+        self.assertTrue(self.fingerprint_path.exists())
+        main(self.package_base, self.home, is_restore=True)
+        self.assertFalse(self.fingerprint_path.exists())
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
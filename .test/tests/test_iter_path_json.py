@@ -0,0 +1,87 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import dotfiles
+from dotfiles import main, iter_path_json, load_check_convert_json, PathConfig
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        root = Path(self.temp.name)
+        self.package = root / "pack"
+        self.home = root / "home"
+        self.package.mkdir()
+        self.json_path = self.package / "path.json"
+
+    def load(self, text: str) -> list:
+        self.json_path.write_text(text)
+        return list(iter_path_json(self.json_path))
+
+    def test_forms(self):
+        entries = [{"src": "a", "dst": "a"}, {"src": "b", "dst": "/b", "is_home": False}]
+        expected = [{"src": "a", "dst": "a", "is_home": True}, {"src": "b", "dst": "/b", "is_home": False}]
+        for text in [json.dumps(entries), json.dumps(entries, indent=4),
+                     "\n [" + " ,\n".join(map(json.dumps, entries)) + "]\n",
+                     json.dumps({"depends": [], "entries": entries})]:
+            with self.subTest(text=text):
+                self.assertListEqual(expected, self.load(text))
+        self.assertListEqual(expected[:1], self.load(json.dumps(entries[0])))
+        self.assertListEqual([], self.load(" [ ] "))
+
+    def test_invalid(self):
+        for text in ['[{"src": "a", "dst": "a"},]', '[{"src": "a", "dst": "a"} {"src": "b", "dst": "b"}]',
+                     '[{"src": "a", "dst": "a"}] []', '[{"src": "a", "dst": "a"}', ""]:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                self.load(text)
+        for text in ['[1]', '[{"src": 1, "dst": "a"}]', '[{"src": "a", "dst": "a", "mode": "copy"}]']:
+            with self.subTest(text=text), self.assertLogs("dotfiles", "ERROR"), self.assertRaises(TypeError):
+                self.load(text)
+
+    def test_lazy(self):
+        self.json_path.write_text('[{"src": "a", "dst": "a"}, {"dst": "b"}]')
+        entries = iter_path_json(self.json_path)
+        self.assertEqual("a", next(entries)["src"])
+        with self.assertLogs("dotfiles", "ERROR"), self.assertRaises(KeyError):
+            next(entries)
+
+    def test_convert(self):
+        (self.package / "bin").mkdir()
+        for name in ["y", "x"]:
+            (self.package / "bin" / name).write_text(name)
+        self.json_path.write_text(json.dumps([{"src": "a", "dst": "a"}, {"src": "bin/*", "dst": "bin/{name}"},
+                                              {"src": "b", "dst": "b", "mode": "files"}]))
+        self.assertListEqual([
+            PathConfig(self.package / "a", self.home / "a"),
+            PathConfig(self.package / "bin" / "x", self.home / "bin" / "x"),
+            PathConfig(self.package / "bin" / "y", self.home / "bin" / "y"),
+            PathConfig(self.package / "b", self.home / "b", "files"),
+        ], load_check_convert_json(self.package, self.home))
+
+    def test_compact(self):
+        self.assertFalse(hasattr(PathConfig(self.package, self.home), "__dict__"))
+
+    def test_main(self):
+        package = Path(self.temp.name) / "base" / "pack"
+        package.mkdir(parents=True)
+        self.home.mkdir()
+        for name in ["a", "b"]:
+            (package / name).write_text(name)
+        (package / "path.json").write_text(
+            "[\n" + ",\n".join(json.dumps({"src": name, "dst": name}) for name in "ab") + "\n]")
+        with mock.patch("dotfiles.iter_json_array", wraps=dotfiles.iter_json_array) as iter_json_array:
+            main(package.parent, self.home)
+        iter_json_array.assert_called_once()
+        for name in ["a", "b"]:
+            self.assertEqual(package / name, (self.home / name).readlink())
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
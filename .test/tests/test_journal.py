@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import dotfiles
+from dotfiles import Journal, main_install, main_rollback, JOURNAL_DIR, DELETE, LINK
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.temp = tempfile.TemporaryDirectory()
+        self.package_base = Path(self.temp.name)
+        self.copy_packages(Path("package_bases/normal"), ["pack3"], self.package_base)
+        self.copy_templates()
+        self.journal_dir = self.backup_dir / JOURNAL_DIR
+
+    def interrupted_install(self, after: int, **kwargs):
+        calls = []
+
+        def swap_link(*args):
+            calls.append(args)
+            if len(calls) > after:
+                raise RuntimeError("interrupted")
+            return real_swap_link(*args)
+
+        real_swap_link = dotfiles.swap_link
+        with mock.patch("dotfiles.swap_link", side_effect=swap_link):
+            with self.assertRaises(RuntimeError):
+                main_install(self.package_base, self.home_dir, is_dry_run=False, **kwargs)
+
+    def snapshot_dsts(self):
+        res = {}
+        for dirpath, dirnames, filenames in os.walk(self.home_dir):
+            dirnames[:] = [name for name in dirnames if name != ".dotbackup"]
+            for name in dirnames + filenames:
+                path = Path(dirpath) / name
+                if path.is_symlink():
+                    res[str(path)] = os.readlink(path)
+                elif path.is_file():
+                    res[str(path)] = path.read_text()
+        return res
+
+    def test_resume(self):
+        self.interrupted_install(after=1)
+        self.assertEqual(["pack3.jsonl"], [p.name for p in self.journal_dir.iterdir()])
+        journal = Journal.load(self.journal_dir / "pack3.jsonl")
+        self.assertEqual([(DELETE, "dir3_1"), (LINK, "dir3_1")],
+                         [(op.action, op.conf.dst.name) for op in journal.remaining()])
+
+        with mock.patch("dotfiles.swap_link", wraps=dotfiles.swap_link) as swap_link:
+            main_install(self.package_base, self.home_dir, is_dry_run=False)
+        self.assertEqual(1, swap_link.call_count)
+        self.assertEqual([], list(self.journal_dir.iterdir()))
+        resumed = self.snapshot_dsts()
+
+        self.reset_dsts()
+        self.copy_templates()
+        main_install(self.package_base, self.home_dir, is_dry_run=False)
+        self.assertDictEqual(self.snapshot_dsts(), resumed)
+
+    def test_rollback(self):
+        for backup_format in ["copy", "store"]:
+            with self.subTest(backup_format=backup_format):
+                before = self.snapshot_dsts()
+                self.interrupted_install(after=1, backup_format=backup_format)
+                self.assertNotEqual(before, self.snapshot_dsts())
+
+                main_rollback(self.home_dir, is_dry_run=False)
+                self.assertDictEqual(before, self.snapshot_dsts())
+                self.assertEqual([], list(self.journal_dir.iterdir()))
+                self.reset_dsts()
+                self.copy_templates()
+
+    def test_rollback_nested(self):
+        self.package_base = Path(self.temp.name) / "nested"
+        (self.package_base / "nest" / "nvim" / "lua").mkdir(parents=True)
+        (self.package_base / "nest" / "path.json").write_text(
+            '{"src": "nvim", "dst": ".config/nvim", "mode": "files"}')
+        for name in ["x.lua", "y.lua"]:
+            (self.package_base / "nest" / "nvim" / "lua" / name).write_text("new")
+        for backup_format in ["copy", "store", "tar.gz"]:
+            with self.subTest(backup_format=backup_format):
+                (self.home_dir / ".config" / "nvim" / "lua").mkdir(parents=True, exist_ok=True)
+                for name in ["x.lua", "y.lua"]:
+                    (self.home_dir / ".config" / "nvim" / "lua" / name).write_text(name)
+                before = self.snapshot_dsts()
+                self.interrupted_install(after=1, backup_format=backup_format)
+                self.assertNotEqual(before, self.snapshot_dsts())
+
+                main_rollback(self.home_dir, is_dry_run=False)
+                self.assertDictEqual(before, self.snapshot_dsts())
+                self.assertEqual([], list(self.journal_dir.iterdir()))
+                self.reset_dsts()
+                self.copy_templates()
+
+    def test_rollback_without_backup(self):
+        self.interrupted_install(after=1)
+        linked = self.snapshot_dsts()
+        for path in (self.backup_dir / "pack3").iterdir():
+            if path.name != "path.json":
+                dotfiles.remove_path(path)
+
+        with self.assertLogs(dotfiles.LOGGER, "ERROR"), self.assertRaises(FileNotFoundError):
+            main_rollback(self.home_dir, is_dry_run=False)
+        self.assertDictEqual(linked, self.snapshot_dsts())
+        self.assertEqual(["pack3.jsonl"], [p.name for p in self.journal_dir.iterdir()])
+
+    def test_batched_sync(self):
+        path = Path(self.temp.name) / "journal.jsonl"
+        journal = Journal(path, batch=3)
+        plan = dotfiles.plan_package(self.package_base / "pack3", self.home_dir)
+        journal.begin(plan, dotfiles.FileSnapshot())
+        for op in plan.operations:
+            journal.record(op)
+        self.assertEqual(1 + len(plan.operations) // 3, journal.syncs)
+        journal.close()
+
+        with path.open("a") as f:
+            f.write('{"action": "li')
+        self.assertEqual([], Journal.load(path).remaining())
+
+    def tearDown(self):
+        self.temp.cleanup()
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
+import json
 import unittest
 from pathlib import Path
 
-from dotfiles import list_json_to_config, PathConfig, cache_load_json, normalize_json
+from dotfiles import list_json_to_config, PathConfig, normalize_json
 from util import TestUtil
 
 
@@ -44,7 +45,7 @@ class MyTestCase(TestUtil.BaseTest):
         ]
         for pack, ex in zip(packs, expected):
             package_path = package_base / pack
-            json_list = cache_load_json(package_base / pack / "path.json")
+            json_list = json.loads((package_base / pack / "path.json").read_text())
             json_list = normalize_json(json_list)
 
             with self.subTest(package=pack):
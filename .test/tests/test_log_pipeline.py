@@ -0,0 +1,99 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from dotfiles import log_pipeline, main_fleet, ConfigCache, LOGGER, LOG_JSON
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.temp = tempfile.TemporaryDirectory()
+        self.log_path = Path(self.temp.name) / "dotfiles.log"
+        self.handlers = list(LOGGER.handlers)
+
+    def test_text(self):
+        with log_pipeline(self.log_path, "INFO"):
+            LOGGER.debug("hidden")
+            LOGGER.info("Linked: %s", "a")
+            LOGGER.warning("careful")
+        lines = self.log_path.read_text().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].endswith("[INFO    ]: Linked: a"))
+        self.assertListEqual(self.handlers, LOGGER.handlers)
+
+    def test_json(self):
+        with log_pipeline(self.log_path, "DEBUG", LOG_JSON):
+            try:
+                raise ValueError("broken")
+            except ValueError:
+                LOGGER.exception("failed %d", 1)
+        entry = json.loads(self.log_path.read_text())
+        self.assertEqual("ERROR", entry["level"])
+        self.assertEqual("failed 1", entry["message"])
+        self.assertIn("ValueError: broken", entry["exc"])
+        self.assertEqual(threading.current_thread().name, entry["thread"])
+
+    def test_format_in_listener(self):
+        threads = []
+
+        class Arg:
+            def __str__(self):
+                threads.append(threading.current_thread())
+                return "arg"
+
+        with log_pipeline(self.log_path, "INFO"):
+            LOGGER.info("Linked: %s", Arg())
+            self.assertListEqual([], threads)
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertTrue(self.log_path.read_text().rstrip().endswith("Linked: arg"))
+
+    def test_pickled(self):
+        with log_pipeline(self.log_path, "INFO", LOG_JSON, log_queue=multiprocessing.Queue()):
+            LOGGER.info("Locked: %s", threading.Lock())
+            try:
+                raise ValueError("broken")
+            except ValueError:
+                LOGGER.exception("failed %d", 1)
+        entries = [json.loads(line) for line in self.log_path.read_text().splitlines()]
+        self.assertTrue(entries[0]["message"].startswith("Locked: <unlocked _thread.lock"))
+        self.assertEqual("failed 1", entries[1]["message"])
+        self.assertIn("ValueError: broken", entries[1]["exc"])
+
+    def test_rotation(self):
+        with log_pipeline(self.log_path, "DEBUG", max_bytes=1000, backups=2):
+            for i in range(500):
+                LOGGER.info("message %d", i)
+        self.assertListEqual(["dotfiles.log", "dotfiles.log.1", "dotfiles.log.2"],
+                             sorted(p.name for p in Path(self.temp.name).iterdir()))
+        for path in Path(self.temp.name).iterdir():
+            self.assertLessEqual(path.stat().st_size, 1000)
+        self.assertTrue(self.log_path.read_text().rstrip().endswith("message 499"))
+
+    def test_fleet(self):
+        package_base = Path(self.temp.name) / "packages"
+        self.copy_packages(Path("package_bases/normal"), ["pack1"], package_base)
+        home = Path(self.temp.name) / "home"
+        shutil.copytree(self.temp_dir / "home", home, symlinks=True)
+        cache = ConfigCache()
+        cache.load(package_base / "pack1" / "path.json")
+
+        with log_pipeline(self.log_path, "INFO", LOG_JSON, log_queue=multiprocessing.Queue()) as log_queue:
+            report = main_fleet(package_base, [home], cache, processes=1, log_queue=log_queue)
+        self.assertEqual({"ok": 1, "failed": 0}, report["summary"])
+        entries = [json.loads(line) for line in self.log_path.read_text().splitlines()]
+        self.assertTrue(any(e["process"] != os.getpid() and e["message"].startswith("Linked") for e in entries))
+        self.assertEqual(os.getpid(), entries[-1]["process"])
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from dotfiles import main_fleet, install_home, read_homes, format_fleet, ConfigCache
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.temp = tempfile.TemporaryDirectory()
+        root = Path(self.temp.name)
+        self.package_base = root / "packages"
+        self.copy_packages(Path("package_bases/normal"), ["pack1", "pack2", "pack3"], self.package_base)
+        self.homes = [root / f"home{i}" for i in range(3)]
+        for home in self.homes:
+            shutil.copytree(self.temp_dir / "home", home, symlinks=True)
+        self.cache = ConfigCache()
+        for pack in self.package_base.iterdir():
+            self.cache.load(pack / "path.json")
+
+    def test_install(self):
+        report = main_fleet(self.package_base, self.homes, self.cache, processes=2)
+        self.assertEqual({"ok": 3, "failed": 0}, report["summary"])
+        self.assertListEqual([str(home) for home in self.homes], [t["home"] for t in report["targets"]])
+        for home in self.homes:
+            with self.subTest(home=home.name):
+                for name in ["file1_1", "dir2_1", "file3_1", "dir3_1"]:
+                    self.assertTrue((home / name).is_symlink())
+                self.assertTrue((home / ".dotbackup" / "pack3" / "path.json").exists())
+
+    def test_failure_is_reported(self):
+        broken = Path(self.temp.name) / "broken"
+        broken.write_text("not a directory")
+        report = main_fleet(self.package_base, [self.homes[0], broken], self.cache, processes=2)
+        self.assertEqual({"ok": 1, "failed": 1}, report["summary"])
+        self.assertIsNotNone(report["targets"][1]["error"])
+        self.assertEqual("1 succeeded, 1 failed", format_fleet(report)[-1])
+
+    def test_parsed_once(self):
+        with mock.patch("dotfiles.check_json") as check_json:
+            result = install_home(self.package_base, self.homes[0], False, True, 1, "copy", self.cache.records())
+        check_json.assert_not_called()
+        self.assertTrue(result["ok"])
+        self.assertIn("pack1:", result["output"])
+
+    def test_read_homes(self):
+        homes_file = Path(self.temp.name) / "homes.txt"
+        homes_file.write_text("/srv/a\n# comment\n\n/srv/b  # trailing\n")
+        self.assertListEqual([Path("/srv/a"), Path("/srv/b")], read_homes(homes_file))
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import io
+import logging
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from dotfiles import main_install, list_generations, LOGGER
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.temp = tempfile.TemporaryDirectory()
+        self.package_base = Path(self.temp.name)
+        self.packs = [f"pack{i}" for i in range(1, 10)]
+        self.copy_packages(Path("package_bases/normal"), self.packs, self.package_base)
+        self.copy_templates()
+
+    def installed_links(self):
+        links = {}
+        for root in [self.home_dir, self.extra_dst]:
+            for dirpath, dirnames, filenames in os.walk(root):
+                for name in dirnames + filenames:
+                    path = Path(dirpath) / name
+                    if path.is_symlink():
+                        links[str(path)] = os.readlink(path)
+        return links
+
+    def test_serial_and_parallel(self):
+        main_install(self.package_base, self.home_dir, is_dry_run=False, jobs=1)
+        serial = self.installed_links()
+        self.reset_dsts()
+        self.copy_templates()
+
+        main_install(self.package_base, self.home_dir, is_dry_run=False, jobs=4)
+        parallel = self.installed_links()
+
+        self.assertEqual(len(serial), 11)
+        self.assertDictEqual(serial, parallel)
+        for pack in self.packs:
+            with self.subTest(pack=pack):
+                self.assertTrue((self.backup_dir / pack / "path.json").exists())
+
+    def test_backup_store(self):
+        main_install(self.package_base, self.home_dir, is_dry_run=False, backup_format="store")
+        for pack in self.packs:
+            with self.subTest(pack=pack):
+                self.assertFalse((self.backup_dir / pack).exists())
+                self.assertEqual(1, len(list_generations(self.backup_dir / ".store", pack)))
+
+    def test_parallel_log_order(self):
+        with self.assertLogs(LOGGER, level=logging.INFO) as cm:
+            main_install(self.package_base, self.home_dir, is_dry_run=False, jobs=4)
+
+        owners = []
+        for message in cm.output:
+            if "Start process for " in message:
+                owners.append(message.rsplit(" ", 1)[-1])
+            if "End process for " in message:
+                self.assertEqual(owners[-1], message.rsplit(" ", 1)[-1])
+        self.assertListEqual(sorted(self.packs), owners)
+
+    def test_rerun_is_noop(self):
+        main_install(self.package_base, self.home_dir, is_dry_run=False)
+        first = self.installed_links()
+
+        with self.assertLogs(LOGGER, level=logging.INFO) as cm:
+            main_install(self.package_base, self.home_dir, is_dry_run=False)
+        self.assertDictEqual(first, self.installed_links())
+        for pack in self.packs:
+            with self.subTest(pack=pack):
+                self.assertIn(f"INFO:dotfiles:{pack} is up to date.", cm.output)
+        self.assertFalse([m for m in cm.output if "Copied: " in m or "Deleted: " in m])
+
+    def test_rerun_changed_package(self):
+        main_install(self.package_base, self.home_dir, is_dry_run=False)
+        (self.package_base / "pack1" / "file1_1_new").touch()
+        (self.package_base / "pack1" / "path.json").write_text('{"src": "file1_1_new", "dst": "file1_1_new"}')
+
+        with self.assertLogs(LOGGER, level=logging.INFO) as cm:
+            main_install(self.package_base, self.home_dir, is_dry_run=False)
+        self.assertTrue((self.home_dir / "file1_1_new").is_symlink())
+        self.assertNotIn("INFO:dotfiles:pack1 is up to date.", cm.output)
+        self.assertIn("INFO:dotfiles:pack2 is up to date.", cm.output)
+
+    def test_dry_run(self):
+        before = self.installed_links()
+        out = io.StringIO()
+        with redirect_stdout(out):
+            main_install(self.package_base, self.home_dir, is_dry_run=True)
+        self.assertDictEqual(before, self.installed_links())
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual("pack1:", lines[0])
+        self.assertIn(f"  backup  {self.home_dir / 'file1_1'} -> {self.backup_dir / 'pack1' / 'file1_1'}", lines)
+        self.assertIn(f"  write   {self.backup_dir / 'pack1' / 'path.json'}", lines)
+
+        main_install(self.package_base, self.home_dir, is_dry_run=False)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            main_install(self.package_base, self.home_dir, is_dry_run=True)
+        self.assertListEqual([f"{pack}: up to date" for pack in self.packs], out.getvalue().splitlines())
+
+    def tearDown(self):
+        self.temp.cleanup()
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
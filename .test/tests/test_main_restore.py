@@ -0,0 +1,99 @@
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest import mock
+
+import dotfiles
+from dotfiles import main_install, main_restore, move_path
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.temp = tempfile.TemporaryDirectory()
+        self.package_base = Path(self.temp.name)
+        self.packs = ["pack1", "pack2", "pack7"]
+        self.copy_packages(Path("package_bases/normal"), self.packs, self.package_base)
+        self.copy_templates()
+        (self.home_dir / "file1_1").write_text("original")
+        (self.home_dir / "dir2_1" / "file2_1_1").write_text("original")
+        main_install(self.package_base, self.home_dir, is_dry_run=False)
+
+    def test_normal(self):
+        for name in ["file1_1", "dir2_1", "dir/file7_1"]:
+            self.assertTrue((self.home_dir / name).is_symlink())
+
+        main_restore(self.package_base, self.home_dir, is_dry_run=False, jobs=2)
+        for name in ["file1_1", "dir2_1", "dir/file7_1"]:
+            with self.subTest(dst=name):
+                self.assertFalse((self.home_dir / name).is_symlink())
+                self.assertTrue((self.home_dir / name).exists())
+        self.assertEqual("original", (self.home_dir / "file1_1").read_text())
+        self.assertEqual("original", (self.home_dir / "dir2_1" / "file2_1_1").read_text())
+        for pack in self.packs:
+            with self.subTest(pack=pack):
+                self.assertFalse((self.backup_dir / pack).exists())
+
+    def test_dry_run(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            main_restore(self.package_base, self.home_dir, is_dry_run=True)
+        lines = out.getvalue().splitlines()
+        self.assertEqual("pack1:", lines[0])
+        self.assertIn(f"  unlink  {(self.home_dir / 'file1_1').absolute()}", lines)
+        self.assertIn(f"  restore {self.backup_dir / 'pack1' / 'file1_1'} -> {(self.home_dir / 'file1_1').absolute()}",
+                      lines)
+        self.assertTrue((self.home_dir / "file1_1").is_symlink())
+
+        main_restore(self.package_base, self.home_dir, is_dry_run=False)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            main_restore(self.package_base, self.home_dir, is_dry_run=True)
+        self.assertListEqual([f"{pack}: nothing to restore" for pack in self.packs], out.getvalue().splitlines())
+
+    def test_keep_real_file(self):
+        (self.home_dir / "file1_1").unlink()
+        (self.home_dir / "file1_1").write_text("new")
+        main_restore(self.package_base, self.home_dir, is_dry_run=False)
+        self.assertEqual("new", (self.home_dir / "file1_1").read_text())
+        self.assertTrue((self.backup_dir / "pack1" / "file1_1").exists())
+
+    def test_skip_missing_backup(self):
+        original = dotfiles.plan_restore
+
+        def plan_restore(package_path, home_dir):
+            plan = original(package_path, home_dir)
+            if package_path.name == "pack2":
+                (self.backup_dir / "pack2" / "dir2_1").rename(self.backup_dir / "pack2" / "moved")
+            return plan
+
+        with mock.patch("dotfiles.plan_restore", plan_restore), self.assertLogs("dotfiles", "ERROR"):
+            main_restore(self.package_base, self.home_dir, is_dry_run=False)
+        self.assertEqual("original", (self.home_dir / "file1_1").read_text())
+        self.assertTrue((self.home_dir / "dir2_1").is_symlink())
+        self.assertFalse((self.home_dir / "dir/file7_1").is_symlink())
+
+    def test_link_again_on_failure(self):
+        with mock.patch("dotfiles.move_path", side_effect=OSError("full")), self.assertLogs("dotfiles", "ERROR"):
+            main_restore(self.package_base, self.home_dir, is_dry_run=False)
+        for name in ["file1_1", "dir2_1", "dir/file7_1"]:
+            with self.subTest(dst=name):
+                self.assertTrue((self.home_dir / name).is_symlink())
+        self.assertTrue((self.backup_dir / "pack1" / "path.json").exists())
+
+    def test_move_path(self):
+        src = self.home_dir / "dir3_1"
+        move_path(src, self.extra_dst / "moved")
+        self.assertFalse(src.exists())
+        self.assertTrue((self.extra_dst / "moved" / "file3_1_1").exists())
+
+    def tearDown(self):
+        self.temp.cleanup()
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
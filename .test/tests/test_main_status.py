@@ -0,0 +1,56 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from dotfiles import main_install, main_status, link_status, PathConfig, LINKED, WRONG_LINK, BROKEN_LINK, \
+    SHADOWED, MISSING
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.temp = tempfile.TemporaryDirectory()
+        self.package_base = Path(self.temp.name)
+        self.copy_packages(Path("package_bases/normal"), ["pack1", "pack2", "pack3"], self.package_base)
+        self.src = (self.package_base / "pack1" / "file1_1").absolute()
+
+    def test_link_status(self):
+        self.copy_templates()
+        (self.home_dir / "linked").symlink_to(self.src)
+        (self.home_dir / "wrong").symlink_to(self.package_base / "pack2" / "dir2_1")
+        expected = [
+            ("linked", LINKED),
+            ("wrong", WRONG_LINK),
+            ("symlink10_1", BROKEN_LINK),
+            ("file1_1", SHADOWED),
+            ("dir2_1", SHADOWED),
+            ("not_exist", MISSING),
+        ]
+        for name, status in expected:
+            with self.subTest(dst=name):
+                self.assertEqual(status, link_status(PathConfig(self.src, self.home_dir / name))["status"])
+
+    def test_main_status(self):
+        report = main_status(self.package_base, self.home_dir)
+        self.assertListEqual(["pack1", "pack2", "pack3"], list(report["packages"]))
+        self.assertEqual(4, report["summary"][MISSING])
+
+        self.copy_templates()
+        main_install(self.package_base, self.home_dir, is_dry_run=False)
+        (self.home_dir / "file3_1").unlink()
+        report = main_status(self.package_base, self.home_dir, jobs=4)
+        self.assertDictEqual(
+            {LINKED: 3, WRONG_LINK: 0, BROKEN_LINK: 0, SHADOWED: 0, MISSING: 1},
+            report["summary"],
+        )
+        self.assertEqual(str(self.home_dir / "file3_1"), report["packages"]["pack3"][0]["dst"])
+        self.assertEqual(MISSING, report["packages"]["pack3"][0]["status"])
+
+    def tearDown(self):
+        self.temp.cleanup()
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
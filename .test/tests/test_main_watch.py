@@ -0,0 +1,120 @@
+import json
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import dotfiles
+from dotfiles import InotifyWatcher, PollingWatcher, PathConfig, main_watch, wait_changes, MODE_FILES, MODE_TEMPLATE
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.temp = tempfile.TemporaryDirectory()
+        self.package_base = Path(self.temp.name)
+        self.copy_packages(Path("package_bases/normal"), ["pack1", "pack2", "pack3"], self.package_base)
+        self.copy_templates()
+
+    def edit(self):
+        json_path = self.package_base / "pack1" / "path.json"
+        json_path.write_text(json.dumps({"is_home": True, "src": "file1_1", "dst": "renamed1_1"}))
+        (self.package_base / "pack4").mkdir()
+
+    def check_watcher(self, watcher):
+        try:
+            self.assertEqual(set(), watcher.poll(0.01))
+            self.edit()
+            changed = set()
+            deadline = time.monotonic() + 5
+            while changed != {"pack1", "pack4"} and time.monotonic() < deadline:
+                changed |= watcher.poll(0.1)
+            self.assertEqual({"pack1", "pack4"}, changed)
+
+            (self.package_base / "pack4" / "path.json").write_text("{}")
+            self.assertEqual({"pack4"}, watcher.poll(1))
+        finally:
+            watcher.close()
+
+    def test_polling(self):
+        self.check_watcher(PollingWatcher(self.package_base, interval=0.01))
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+    def test_inotify(self):
+        self.check_watcher(InotifyWatcher(self.package_base))
+
+    def check_sources(self, open_watcher):
+        package = self.package_base / "pack4"
+        (package / "tree" / "sub").mkdir(parents=True)
+        (package / "tmpl").mkdir()
+        (package / "tmpl" / "conf").write_text("$user")
+        (package / "path.json").write_text("[]")
+        watcher = open_watcher(self.package_base)
+        try:
+            watcher.watch({"pack4": [PathConfig(package / "tree", self.home_dir / "tree", MODE_FILES),
+                                     PathConfig(package / "tmpl" / "conf", self.home_dir / "conf", MODE_TEMPLATE)]})
+            self.assertEqual(set(), watcher.poll(0.01))
+            for edit in [lambda: (package / "tree" / "sub" / "new").touch(),
+                         lambda: (package / "tmpl" / "conf").write_text("$home")]:
+                time.sleep(0.01)
+                edit()
+                self.assertEqual({"pack4"}, watcher.poll(1))
+
+            watcher.watch({"pack4": []})
+            (package / "tmpl" / "conf").write_text("$user")
+            self.assertEqual(set(), watcher.poll(0.05))
+        finally:
+            watcher.close()
+
+    def test_polling_sources(self):
+        self.check_sources(lambda base: PollingWatcher(base, interval=0.01))
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+    def test_inotify_sources(self):
+        self.check_sources(InotifyWatcher)
+
+    def test_debounce(self):
+        watcher = mock.Mock()
+        watcher.poll.side_effect = [set(), {"pack1"}, {"pack1"}, {"pack2"}, set(), {"pack3"}]
+        self.assertEqual({"pack1", "pack2"}, wait_changes(watcher, 0.1, threading.Event()))
+
+    def test_only_changed_packages(self):
+        stop = threading.Event()
+        installed = []
+        real_install_package = dotfiles.install_package
+
+        def install_package(package_path, **kwargs):
+            installed.append(package_path.name)
+            return real_install_package(package_path, **kwargs)
+
+        with mock.patch("dotfiles.install_package", side_effect=install_package):
+            thread = threading.Thread(target=main_watch, args=(self.package_base, self.home_dir),
+                                      kwargs={"debounce": 0.05, "stop": stop,
+                                              "watcher": PollingWatcher(self.package_base, interval=0.01)})
+            thread.start()
+            try:
+                deadline = time.monotonic() + 5
+                while len(installed) < 3 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.edit()
+                while not (self.home_dir / "renamed1_1").is_symlink() and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            finally:
+                stop.set()
+                thread.join()
+
+        self.assertTrue((self.home_dir / "renamed1_1").is_symlink())
+        self.assertListEqual(["pack1", "pack2", "pack3", "pack1"], installed[:4])
+        self.assertNotIn("pack2", installed[3:])
+
+    def tearDown(self):
+        self.temp.cleanup()
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
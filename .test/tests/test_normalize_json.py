@@ -1,8 +1,9 @@
+import json
 import unittest
 
 from pathlib import Path
 
-from dotfiles import normalize_json, cache_load_json
+from dotfiles import normalize_json
 from util import TestUtil
 
 
@@ -50,9 +51,9 @@ class MyTestCase(TestUtil.BaseTest):
         ]
 
         for pack, ex in zip(packs, expected):
-            json = cache_load_json(dotfile / pack / "path.json")
+            json_obj = json.loads((dotfile / pack / "path.json").read_text())
             with self.subTest(package=pack):
-                self.assertListEqual(normalize_json(json), ex)
+                self.assertListEqual(normalize_json(json_obj), ex)
 
 if __name__ == '__main__':
     unittest.main()
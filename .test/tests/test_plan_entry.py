@@ -0,0 +1,44 @@
+import unittest
+from pathlib import Path
+
+from dotfiles import plan_entry, Operation, PathConfig, BACKUP, DELETE, LINK, UNLINK
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.copy_templates()
+        self.src = Path("package_bases/normal/pack1/file1_1").absolute()
+
+    def test_not_exist(self):
+        conf = PathConfig(self.src, self.home_dir / "not_exist")
+        self.assertListEqual([Operation(LINK, conf)], plan_entry(conf))
+
+    def test_file_and_dir(self):
+        for name in ["file1_1", "dir2_1"]:
+            conf = PathConfig(self.src, self.home_dir / name)
+            with self.subTest(dst=name):
+                self.assertListEqual(
+                    [Operation(BACKUP, conf), Operation(DELETE, conf), Operation(LINK, conf)],
+                    plan_entry(conf),
+                )
+
+    def test_symlink(self):
+        dst = self.home_dir / "link"
+        dst.symlink_to(self.src)
+        self.assertListEqual([], plan_entry(PathConfig(self.src, dst)))
+
+        other = PathConfig(self.src.with_name("other"), dst)
+        self.assertListEqual([Operation(UNLINK, other), Operation(LINK, other)], plan_entry(other))
+
+    def test_broken_symlink(self):
+        conf = PathConfig(self.src, self.home_dir / "symlink10_1")
+        self.assertListEqual([Operation(UNLINK, conf), Operation(LINK, conf)], plan_entry(conf))
+
+    def tearDown(self):
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
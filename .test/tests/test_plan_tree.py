@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from dotfiles import plan_tree, main_install, main_restore, link_status, Operation, PathConfig
+from dotfiles import BACKUP_ARCHIVES, BACKUP_COPY, DELETE, LINK, LINKED, MODE_FILES, PRUNE, UNFOLD
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        root = Path(self.temp.name)
+        self.package_base = root / "packages"
+        self.home = root / "home"
+        self.home.mkdir()
+        self.src = self.package_base / "nvim" / "nvim"
+        (self.src / "lua").mkdir(parents=True)
+        (self.src / "init.lua").write_text("init")
+        (self.src / "lua" / "plugins.lua").write_text("plugins")
+        (self.package_base / "nvim" / "path.json").write_text(
+            json.dumps({"src": "nvim", "dst": "nvim", "mode": MODE_FILES}))
+        self.dst = self.home / "nvim"
+        self.conf = PathConfig(self.src, self.dst, MODE_FILES)
+
+    def install(self):
+        main_install(self.package_base, self.home, is_dry_run=False)
+
+    def test_fold_missing_dir(self):
+        self.assertListEqual([Operation(LINK, PathConfig(self.src, self.dst))], plan_tree(self.conf))
+        self.install()
+        self.assertEqual(str(self.src), os.readlink(self.dst))
+        self.assertListEqual([], plan_tree(self.conf))
+
+    def test_keep_local_files(self):
+        self.dst.mkdir()
+        (self.dst / "local.lua").write_text("local")
+        self.install()
+
+        self.assertEqual("local", (self.dst / "local.lua").read_text())
+        self.assertEqual(str(self.src / "init.lua"), os.readlink(self.dst / "init.lua"))
+        self.assertEqual(str(self.src / "lua"), os.readlink(self.dst / "lua"))
+        self.assertListEqual([], plan_tree(self.conf))
+        self.assertEqual(LINKED, link_status(self.conf)["status"])
+
+        (self.src / "init.lua").unlink()
+        (self.src / "new.lua").write_text("new")
+        self.assertListEqual(
+            [Operation(LINK, PathConfig(self.src / "new.lua", self.dst / "new.lua")),
+             Operation(PRUNE, PathConfig(self.src / "init.lua", self.dst / "init.lua"))],
+            plan_tree(self.conf),
+        )
+        self.install()
+        self.assertFalse(os.path.lexists(self.dst / "init.lua"))
+        self.assertTrue((self.dst / "new.lua").is_symlink())
+
+    def test_refold(self):
+        self.dst.mkdir()
+        for name in ["init.lua", "lua"]:
+            (self.dst / name).symlink_to(self.src / name)
+        self.assertListEqual([Operation(DELETE, PathConfig(self.src, self.dst)),
+                              Operation(LINK, PathConfig(self.src, self.dst))], plan_tree(self.conf))
+        self.install()
+        self.assertEqual(str(self.src), os.readlink(self.dst))
+
+    def test_unfold(self):
+        other = Path(self.temp.name) / "other"
+        (other / "lua").mkdir(parents=True)
+        (other / "other.lua").write_text("other")
+        (other / "lua" / "other.lua").write_text("other")
+        self.dst.symlink_to(other)
+
+        operations = plan_tree(self.conf)
+        self.assertListEqual([UNFOLD, LINK, UNFOLD, LINK], [op.action for op in operations])
+        self.install()
+        self.assertFalse(self.dst.is_symlink())
+        self.assertEqual(str(other / "other.lua"), os.readlink(self.dst / "other.lua"))
+        self.assertEqual(str(other / "lua" / "other.lua"), os.readlink(self.dst / "lua" / "other.lua"))
+        self.assertEqual(str(self.src / "lua" / "plugins.lua"), os.readlink(self.dst / "lua" / "plugins.lua"))
+        self.assertEqual(str(self.src / "init.lua"), os.readlink(self.dst / "init.lua"))
+        self.assertListEqual([], plan_tree(self.conf))
+
+    def test_backup_same_names(self):
+        for name in ["a", "b"]:
+            (self.src / "lua" / name).mkdir()
+            (self.src / "lua" / name / "init.lua").write_text(name)
+        for backup_format in [BACKUP_COPY, *BACKUP_ARCHIVES]:
+            with self.subTest(backup_format=backup_format):
+                for name in ["a", "b"]:
+                    (self.dst / "lua" / name).mkdir(parents=True)
+                    (self.dst / "lua" / name / "init.lua").write_text("OLD-" + name)
+                main_install(self.package_base, self.home, is_dry_run=False, backup_format=backup_format)
+                self.assertTrue((self.dst / "lua" / "a" / "init.lua").is_symlink())
+                if backup_format == BACKUP_COPY:
+                    backup_dir = self.home / ".dotbackup" / "nvim"
+                    self.assertEqual("OLD-a", (backup_dir / "nvim" / "lua" / "a" / "init.lua").read_text())
+                    self.assertEqual({"nvim/lua/a/init.lua", "nvim/lua/b/init.lua"},
+                                     {e["src"] for e in json.loads((backup_dir / "path.json").read_text())})
+
+                main_restore(self.package_base, self.home, is_dry_run=False)
+                for name in ["a", "b"]:
+                    self.assertEqual("OLD-" + name, (self.dst / "lua" / name / "init.lua").read_text())
+                shutil.rmtree(self.dst)
+                shutil.rmtree(self.home / ".dotbackup")
+
+    def test_many_files(self):
+        for i in range(2000):
+            (self.src / "lua" / f"{i}.lua").touch()
+        (self.dst / "lua").mkdir(parents=True)
+        (self.dst / "lua" / "local.lua").touch()
+        self.install()
+        self.assertEqual(2002, len(os.listdir(self.dst / "lua")))
+        self.assertListEqual([], plan_tree(self.conf))
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from dotfiles import Profiler, PROFILER, main_install
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.temp = tempfile.TemporaryDirectory()
+        self.temp_dir = Path(self.temp.name)
+
+    def test_disabled(self):
+        profiler = Profiler()
+        with profiler.span("name", "cat", files=1) as args:
+            args["bytes"] = 1
+        self.assertListEqual(["duration[ms]"], [line.split()[0] for line in profiler.summary()])
+
+    def test_write(self):
+        profiler = Profiler()
+        profiler.enable()
+        with profiler.span("outer", "package"):
+            with profiler.span("inner", "entry", files=1) as args:
+                args["bytes"] = 10
+
+        trace = self.temp_dir / "trace.json"
+        profiler.write(trace)
+        events = json.loads(trace.read_text())["traceEvents"]
+        self.assertListEqual(["inner", "outer"], [e["name"] for e in events])
+        self.assertDictEqual({"files": 1, "bytes": 10}, events[0]["args"])
+        self.assertTrue(all(e["ph"] == "X" for e in events))
+        self.assertLessEqual(events[1]["ts"], events[0]["ts"])
+        self.assertGreaterEqual(events[1]["dur"], events[0]["dur"])
+
+        summary = profiler.summary()
+        self.assertTrue(summary[1].endswith("outer"))
+        self.assertTrue(summary[2].endswith("inner"))
+
+    def test_main_install(self):
+        self.copy_packages(Path("package_bases/normal"), ["pack2", "pack3"], self.temp_dir)
+        self.copy_templates()
+        PROFILER.enable()
+        main_install(self.temp_dir, self.home_dir, is_dry_run=False)
+
+        trace = self.temp_dir / "trace.json"
+        PROFILER.write(trace)
+        events = json.loads(trace.read_text())["traceEvents"]
+        names = {(e["cat"], e["name"]) for e in events}
+        for pack in ["pack2", "pack3"]:
+            with self.subTest(pack=pack):
+                self.assertIn(("package", pack), names)
+                for phase in ["plan", "backup", "link"]:
+                    self.assertIn(("phase", f"{pack}:{phase}"), names)
+        backup = [e for e in events if e["name"] == "pack3:backup"][0]
+        self.assertDictEqual({"files": 2, "bytes": 0}, backup["args"])
+        self.assertIn(("entry", str(self.home_dir / "dir3_1")), names)
+
+    def tearDown(self):
+        PROFILER.enabled = False
+        self.temp.cleanup()
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
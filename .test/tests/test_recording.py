@@ -0,0 +1,52 @@
+import logging
+import unittest
+
+from dotfiles import recording
+from util import TestUtil
+
+LOG = logging.getLogger("test_recording")
+
+
+def target(json_obj, fail: bool = False):
+    if fail:
+        raise ValueError(json_obj)
+    return json_obj
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.payload = [{"src": f"file{i}", "dst": f"file{i}"} for i in range(100)]
+
+    def test_debug(self):
+        func = recording(LOG)(target)
+        with self.assertLogs(LOG, level=logging.DEBUG) as cm:
+            self.assertIs(self.payload, func(self.payload))
+        self.assertEqual(4, len(cm.output))
+        self.assertIn(repr(self.payload), cm.output[1])
+
+    def test_compact(self):
+        func = recording(LOG, compact=True)(target)
+        with self.assertLogs(LOG, level=logging.DEBUG) as cm:
+            func(self.payload)
+        self.assertNotIn("file99", cm.output[1])
+        self.assertIn("...", cm.output[1])
+        self.assertLess(len(cm.output[2]), 1000)
+
+    def test_disabled(self):
+        func = recording(LOG)(target)
+        with self.assertLogs(LOG, level=logging.INFO) as cm:
+            func(self.payload)
+            LOG.info("sentinel")
+        self.assertListEqual(["INFO:test_recording:sentinel"], cm.output)
+
+    def test_error(self):
+        func = recording(LOG)(target)
+        for level in [logging.DEBUG, logging.INFO]:
+            with self.subTest(level=level), self.assertLogs(LOG, level=level) as cm, self.assertRaises(ValueError):
+                func("x", fail=True)
+            self.assertIn("ERROR:test_recording:target failed", cm.output)
+            self.assertIn("ERROR:test_recording:args: {'json_obj': 'x', 'fail': True}", cm.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from dataclasses import replace
+from pathlib import Path
+
+from dotfiles import main_install, main_status, plan_package, apply_plan, check_rendered, host_vars, vars_digest
+from dotfiles import ConfigCache, PathConfig, CONFIG_CACHE_FILE, LOGGER, LINKED, SHADOWED, BACKUP, RENDER, MODE_TEMPLATE
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        root = Path(self.temp.name)
+        self.package_base = root / "packages"
+        self.home = root / "home"
+        self.home.mkdir()
+        self.package = self.package_base / "git"
+        self.package.mkdir(parents=True)
+        self.template = self.package / "gitconfig"
+        self.template.write_text("[user]\n  name = $name\n  host = ${hostname}\n")
+        os.chmod(self.template, 0o600)
+        (self.package / "path.json").write_text(json.dumps({"src": "gitconfig", "dst": ".gitconfig",
+                                                            "mode": MODE_TEMPLATE}))
+        self.write_vars("Alice")
+        self.dst = self.home / ".gitconfig"
+        self.expected = f"[user]\n  name = Alice\n  host = {os.uname().nodename}\n"
+
+    def write_vars(self, name: str):
+        (self.package_base / "vars.json").write_text(json.dumps({"default": {"name": name}}))
+
+    def install(self):
+        main_install(self.package_base, self.home, is_dry_run=False)
+
+    def test_render(self):
+        self.install()
+        self.assertFalse(self.dst.is_symlink())
+        self.assertEqual(self.expected, self.dst.read_text())
+        self.assertEqual(0o600, self.dst.stat().st_mode & 0o777)
+        self.assertListEqual([], plan_package(self.package, self.home).operations)
+        self.assertEqual(LINKED, main_status(self.package_base, self.home)["packages"]["git"][0]["status"])
+
+    def test_rerender_own_output(self):
+        self.install()
+        self.write_vars("Bob")
+        plan = plan_package(self.package, self.home, ConfigCache.open(self.home / ".dotbackup" / CONFIG_CACHE_FILE))
+        self.assertListEqual([RENDER], [op.action for op in plan.operations])
+        self.install()
+        self.assertEqual(self.expected.replace("Alice", "Bob"), self.dst.read_text())
+        self.assertFalse((self.home / ".dotbackup" / "git").exists())
+
+    def test_backup_foreign_file(self):
+        self.dst.write_text("mine")
+        self.assertListEqual([BACKUP, RENDER], [op.action for op in plan_package(self.package, self.home).operations])
+        self.install()
+        self.assertEqual("mine", (self.home / ".dotbackup" / "git" / ".gitconfig").read_text())
+        self.assertEqual(self.expected, self.dst.read_text())
+
+        self.dst.write_text("edited")
+        self.assertEqual(SHADOWED, main_status(self.package_base, self.home)["packages"]["git"][0]["status"])
+
+    def test_cached(self):
+        self.install()
+        for path in [self.template, self.dst]:
+            os.utime(path, ns=(0, 0))
+        cache = ConfigCache()
+        conf = PathConfig(self.template, self.dst, MODE_TEMPLATE)
+        variables = host_vars(self.package_base, self.home)
+        check_rendered(conf, variables, vars_digest(variables), cache)
+        with self.assertLogs(LOGGER, logging.DEBUG) as cm:
+            rendered = check_rendered(conf, variables, vars_digest(variables), cache)
+        self.assertIsNone(rendered.content)
+        self.assertIn(f"DEBUG:dotfiles:{self.dst} is unchanged.", cm.output)
+
+        variables = {**variables, "name": "Bob"}
+        self.assertIsNotNone(check_rendered(conf, variables, vars_digest(variables), cache).content)
+
+    def test_render_again_on_resume(self):
+        plan = plan_package(self.package, self.home)
+        apply_plan(replace(plan, renders={}))
+        self.assertEqual(self.expected, self.dst.read_text())
+
+    def test_undefined(self):
+        self.template.write_text("$undefined")
+        with self.assertLogs(LOGGER, "ERROR"), self.assertRaises(KeyError):
+            self.install()
+        self.assertFalse(self.dst.exists())
+
+    def test_many(self):
+        entries = []
+        for i in range(100):
+            (self.package / f"t{i}").write_text(f"$name {i}")
+            entries.append({"src": f"t{i}", "dst": f"rendered/t{i}", "mode": MODE_TEMPLATE})
+        (self.package / "path.json").write_text(json.dumps(entries))
+        self.install()
+        self.assertListEqual([f"Alice {i}" for i in range(100)],
+                             [(self.home / "rendered" / f"t{i}").read_text() for i in range(100)])
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
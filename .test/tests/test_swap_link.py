@@ -0,0 +1,85 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+from dotfiles import swap_link, Trash, PathConfig
+from util import TestUtil
+
+
+class MyTestCase(TestUtil.BaseTest):
+    def setUp(self):
+        self.set_current_dir_to_test_root()
+        self.copy_templates()
+        self.src = Path("package_bases/normal/pack2/dir2_1").absolute()
+        self.trash = Trash(self.backup_dir / ".trash")
+
+    def assertLinked(self, conf: PathConfig):
+        self.assertTrue(conf.dst.is_symlink())
+        self.assertEqual(str(conf.src), os.readlink(conf.dst))
+
+    def test_replace(self):
+        for name in ["file1_1", "symlink10_1", "not_exist", "new_dir/new_file"]:
+            conf = PathConfig(self.src, self.home_dir / name)
+            with self.subTest(dst=name):
+                swap_link(conf, self.trash)
+                self.assertLinked(conf)
+        self.assertFalse((self.backup_dir / ".trash").exists())
+
+    def test_directory(self):
+        conf = PathConfig(self.src, self.home_dir / "dir2_1")
+        swap_link(conf, self.trash)
+        self.assertLinked(conf)
+        self.trash.wait()
+        self.assertListEqual([], list((self.backup_dir / ".trash").iterdir()))
+
+    def test_directory_without_trash(self):
+        conf = PathConfig(self.src, self.home_dir / "dir2_1")
+        swap_link(conf)
+        self.assertLinked(conf)
+
+    def test_purge(self):
+        left = self.backup_dir / ".trash" / "left"
+        left.mkdir(parents=True)
+        (left / "file").touch()
+        self.trash.purge()
+        self.trash.wait()
+        self.assertFalse(left.exists())
+
+    def test_no_temporary_left(self):
+        swap_link(PathConfig(self.src, self.home_dir / "dir3_1"), self.trash)
+        self.trash.wait()
+        self.assertFalse([p for p in self.home_dir.iterdir() if p.name.endswith(".tmp")])
+
+    def test_first_use_in_threads(self):
+        script = "\n".join([
+            "import sys, threading",
+            "from pathlib import Path",
+            "from dotfiles import swap_link, PathConfig",
+            "home = Path(sys.argv[1])",
+            "errors = []",
+            "def link(i):",
+            "    try:",
+            "        swap_link(PathConfig(Path(sys.argv[2]), home / f'link{i}'))",
+            "    except BaseException as e:",
+            "        errors.append(e)",
+            "threads = [threading.Thread(target=link, args=(i,)) for i in range(32)]",
+            "[thread.start() for thread in threads]",
+            "[thread.join() for thread in threads]",
+            "sys.exit(repr(errors) if errors else 0)",
+        ])
+        root = Path(__file__).resolve().parents[2]
+        result = subprocess.run([sys.executable, "-c", script, str(self.home_dir.absolute()), str(self.src)], cwd=root,
+                                capture_output=True, text=True)
+        self.assertEqual(0, result.returncode, result.stderr)
+        for i in range(32):
+            self.assertLinked(PathConfig(self.src, self.home_dir / f"link{i}"))
+
+    def tearDown(self):
+        self.trash.wait()
+        self.reset_dsts()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,6 +25,11 @@ class TestUtil:
             cls.extra_dst.mkdir(exist_ok=True)
             (cls.extra_dst / ".gitkeep").touch()
 
+        @classmethod
+        def copy_packages(cls, package_base: Path, packs: list[str], copy_to: Path):
+            for pack in packs:
+                shutil.copytree(package_base / pack, copy_to / pack, symlinks=True, )
+
         @classmethod
         def copy_templates(cls):
             shutil.copytree(cls.temp_dir / "home", cls.home_dir, dirs_exist_ok=True, symlinks=True, )
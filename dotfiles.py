@@ -1,38 +1,156 @@
 #! /usr/bin/env python3
 
+from __future__ import annotations
+
+import errno
+import heapq
+import io
 import json
 import logging
-import shutil
+import os
+import queue
+import re
+import reprlib
+import stat
 import sys
-from argparse import ArgumentParser
-from dataclasses import dataclass
-from functools import wraps, cache
-from inspect import signature
-from pathlib import Path
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from dataclasses import dataclass, field, replace
+from collections import deque
+from collections.abc import Iterable
+from functools import wraps
+from pathlib import Path, PurePosixPath
+from string import Formatter, Template
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
+FICLONE = 0x40049409
+COPY_CHUNK = 8 * 1024 * 1024
+COPY_JOBS = min(32, (os.cpu_count() or 1) + 4)
+COPY_FALLBACK_ERRNO = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ETXTBSY}
+HASH_CHUNK = 1024 * 1024
+
+BACKUP_COPY = "copy"
+BACKUP_STORE = "store"
+BACKUP_TAR_GZ = "tar.gz"
+BACKUP_TAR_XZ = "tar.xz"
+BACKUP_ARCHIVES = (BACKUP_TAR_GZ, BACKUP_TAR_XZ)
+BACKUP_FORMATS = (BACKUP_COPY, BACKUP_STORE, *BACKUP_ARCHIVES)
+ARCHIVE_CHUNK = 1024 * 1024
+STORE_DIR = ".store"
+TRASH_DIR = ".trash"
+JOURNAL_DIR = ".journal"
+JOURNAL_BATCH = 64
+
+LOG_FILE = "dotfiles.log"
+LOG_TEXT = "text"
+LOG_JSON = "json"
+LOG_FORMATS = (LOG_TEXT, LOG_JSON)
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 3
+
+COMPACT_REPR = reprlib.Repr()
+COMPACT_REPR.maxlevel = 3
+COMPACT_REPR.maxdict = 8
+COMPACT_REPR.maxlist = 8
+COMPACT_REPR.maxstring = 80
+COMPACT_REPR.maxother = 80
+
+CONFIG_CACHE_FILE = "config_cache.json"
+CONFIG_CACHE_VERSION = 3
+CONFIG_CACHE_RACY_NS = 2 * 10 ** 9
+CONFIG_CACHE_MAX_ENTRIES = 1000
+
+JSON_DECODER = json.JSONDecoder()
+JSON_SPACE = re.compile(r"[ \t\n\r]*")
+
+GLOB_MAGIC = re.compile(r"[*?[]")
+GLOB_FIELDS = ("path", "name", "stem", "suffix")
+
+VARS_FILE = "vars.json"
+
+
+FINGERPRINT_FILE = "fingerprint.json"
+FINGERPRINT_VERSION = 1
+
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = "iIII"
+INOTIFY_BUFFER = 64 * 1024
+WATCH_DEBOUNCE = 0.5
+WATCH_INTERVAL = 2.0
+WATCH_MAX_DELAY = 5.0
+
+
+class _CompactRepr:
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return COMPACT_REPR.repr(self.obj)
+
+
+def _bind(sig, args, kwargs) -> dict:
+    try:
+        bn = sig.bind(*args, **kwargs)
+    except TypeError:
+        return {"args": args, "kwargs": kwargs}
+    bn.apply_defaults()
+    return bn.arguments
+
+
+def recording(log: logging.Logger, compact: bool = False):
+    wrap = _CompactRepr if compact else (lambda obj: obj)
 
-def recording(log: logging.Logger):
     def _decorator(func):
+        name = func.__name__
+        sig = None
+
+        def _arguments(args, kwargs):
+            nonlocal sig
+            if sig is None:
+                from inspect import signature
+                sig = signature(func)
+            return wrap(_bind(sig, args, kwargs))
+
         @wraps(func)
         def _wrapper(*args, **kwargs):
-            name = func.__name__
-            bn = signature(func).bind(*args, **kwargs)
-            bn.apply_defaults()
-
+            if not log.isEnabledFor(logging.DEBUG):
+                try:
+                    return func(*args, **kwargs)
+                except:
+                    log.error("%s failed", name)
+                    log.error("args: %s", _arguments(args, kwargs))
+                    raise
+
+            arguments = _arguments(args, kwargs)
             log.debug("----------start---------- [%s]", name)
-            log.debug("args: %s", bn.arguments)
+            log.debug("args: %s", arguments)
 
             try:
                 result = func(*args, **kwargs)
             except:
                 log.error("%s failed", name)
-                log.error("args: %s", bn.arguments)
+                log.error("args: %s", arguments)
                 raise
 
-            log.debug("returns: %s", result)
+            log.debug("returns: %s", wrap(result))
             log.debug("-----------end----------- [%s]", name)
 
             return result
@@ -42,16 +160,267 @@ def recording(log: logging.Logger):
     return _decorator
 
 
-@dataclass(frozen=True)
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + ".%03d" % record.msecs,
+            "level": record.levelname,
+            "process": record.process,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry)
+
+
+def queue_handler(log_queue, pickled: bool) -> logging.Handler:
+    import copy
+    from logging.handlers import QueueHandler
+
+    class RecordQueueHandler(QueueHandler):
+        def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+            record = copy.copy(record)
+            if pickled:
+                record.msg = record.getMessage()
+                record.args = None
+                if record.exc_info and not record.exc_text:
+                    record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            return record
+
+    return RecordQueueHandler(log_queue)
+
+
+@contextmanager
+def log_pipeline(path: Path, level: str | int, log_format: str = LOG_TEXT, max_bytes: int = LOG_MAX_BYTES,
+                 backups: int = LOG_BACKUPS, log_queue=None):
+    from logging.handlers import QueueListener, RotatingFileHandler
+
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, delay=True)
+    handler.setLevel(level)
+    if log_format == LOG_JSON:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)-8s]: %(message)s"))
+
+    pickled = log_queue is not None
+    log_queue = log_queue if log_queue is not None else queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    enqueue = queue_handler(log_queue, pickled)
+    listener.start()
+    LOGGER.addHandler(enqueue)
+    try:
+        yield log_queue
+    finally:
+        LOGGER.removeHandler(enqueue)
+        listener.stop()
+        handler.close()
+
+
+def attach_log_queue(log_queue, level: int) -> None:
+    for handler in list(LOGGER.handlers):
+        LOGGER.removeHandler(handler)
+    LOGGER.setLevel(level)
+    LOGGER.addHandler(queue_handler(log_queue, True))
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self._origin = time.perf_counter_ns()
+        self._events: list[dict] = []
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self._origin = time.perf_counter_ns()
+        self._events = []
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args):
+        if not self.enabled:
+            yield args
+            return
+
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter_ns()
+            event = {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": (start - self._origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "args": args,
+            }
+            with self._lock:
+                self._events.append(event)
+
+    def write(self, path: Path) -> None:
+        with self._lock:
+            events = list(self._events)
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+        LOGGER.info("Created: %s", path)
+
+    def summary(self, limit: int = 30) -> list[str]:
+        with self._lock:
+            events = sorted(self._events, key=lambda e: e["dur"], reverse=True)[:limit]
+        lines = [f"{'duration[ms]':>12}  {'category':<8}  {'files':>7}  {'bytes':>12}  name"]
+        for e in events:
+            lines.append(f"{e['dur'] / 1000:>12.3f}  {e['cat']:<8}  {e['args'].get('files', ''):>7}  "
+                         f"{e['args'].get('bytes', ''):>12}  {e['name']}")
+        return lines
+
+
+PROFILER = Profiler()
+
+
+MODE_LINK = "link"
+MODE_FILES = "files"
+MODE_TEMPLATE = "template"
+MODES = (MODE_LINK, MODE_FILES, MODE_TEMPLATE)
+
+
+@dataclass(frozen=True, slots=True)
 class PathConfig:
     src: Path
     dst: Path
+    mode: str = MODE_LINK
 
 
 json_scalar = bool | int | float | str
 json_type = json_scalar | list["json_type"] | dict[str, "json_type"]
 
 
+LINKED = "linked"
+WRONG_LINK = "wrong_link"
+BROKEN_LINK = "broken_link"
+SHADOWED = "shadowed"
+MISSING = "missing"
+STATUSES = (LINKED, WRONG_LINK, BROKEN_LINK, SHADOWED, MISSING)
+
+BACKUP = "backup"
+UNLINK = "unlink"
+DELETE = "delete"
+LINK = "link"
+UNFOLD = "unfold"
+RENDER = "render"
+RESTORE = "restore"
+PRUNE = "prune"
+ACTIONS = (BACKUP, UNLINK, DELETE, UNFOLD, LINK, RENDER, RESTORE, PRUNE)
+
+DIR_KIND = "dir"
+FILE_KIND = "file"
+
+
+@dataclass(frozen=True, slots=True)
+class Operation:
+    action: str
+    conf: PathConfig
+
+
+@dataclass(frozen=True)
+class PackagePlan:
+    name: str
+    backup_dir: Path
+    operations: list[Operation]
+    state: dict[str, json_type]
+    backup_format: str = BACKUP_COPY
+    renders: dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def store_dir(self) -> Path:
+        return self.backup_dir.parent / STORE_DIR
+
+    def actions(self, action: str) -> list[Operation]:
+        return [op for op in self.operations if op.action == action]
+
+
+@dataclass(frozen=True, slots=True)
+class FileState:
+    path: Path
+    st: os.stat_result | None = None
+    target: str | None = None
+
+    @property
+    def missing(self) -> bool:
+        return self.st is None
+
+    @property
+    def is_symlink(self) -> bool:
+        return self.st is not None and stat.S_ISLNK(self.st.st_mode)
+
+    @property
+    def is_file(self) -> bool:
+        return self.st is not None and stat.S_ISREG(self.st.st_mode)
+
+    @property
+    def is_dir(self) -> bool:
+        return self.st is not None and stat.S_ISDIR(self.st.st_mode)
+
+
+def read_file_state(path: Path, follow_symlinks: bool = False) -> FileState:
+    try:
+        st = os.stat(path, follow_symlinks=follow_symlinks)
+    except (FileNotFoundError, NotADirectoryError):
+        return FileState(path)
+    target = os.readlink(path) if stat.S_ISLNK(st.st_mode) else None
+    return FileState(path, st, target)
+
+
+class FileSnapshot:
+    def __init__(self):
+        self._states: dict[tuple[Path, bool], FileState] = {}
+        self._realpaths: dict[Path, Path] = {}
+        self._lock = threading.Lock()
+        self.misses = 0
+
+    def get(self, path: Path, follow_symlinks: bool = False) -> FileState:
+        key = (path, follow_symlinks)
+        with self._lock:
+            state = self._states.get(key)
+        if state is not None:
+            return state
+
+        state = read_file_state(path, follow_symlinks)
+        with self._lock:
+            self.misses += 1
+            self._states[key] = state
+        return state
+
+    def realpath(self, path: Path) -> Path:
+        if self.get(path).is_symlink:
+            return path.resolve()
+        parent = path.parent
+        with self._lock:
+            resolved = self._realpaths.get(parent)
+        if resolved is None:
+            resolved = parent.resolve()
+            with self._lock:
+                self._realpaths[parent] = resolved
+        return resolved / path.name
+
+    def invalidate(self, path: Path, recursive: bool = False) -> None:
+        with self._lock:
+            self._states.pop((path, False), None)
+            self._states.pop((path, True), None)
+            self._realpaths.pop(path, None)
+            if not recursive:
+                return
+            prefix = os.path.join(path, "")
+            for key in [key for key in self._states if str(key[0]).startswith(prefix)]:
+                del self._states[key]
+            for key in [key for key in self._realpaths if str(key).startswith(prefix)]:
+                del self._realpaths[key]
+
+
 def iter_package(package_base: Path):
     for p in package_base.iterdir():
         if not p.is_dir():
@@ -63,113 +432,794 @@ def iter_package(package_base: Path):
         yield p
 
 
-@recording(LOGGER)
-@cache
-def cache_load_json(path: Path) -> json_type:
-    with path.open() as f:
-        LOGGER.debug("Opened %s.", path)
-        json_obj = json.load(f)
-        LOGGER.debug("Loaded %s.", json_obj)
-    return json_obj
-
-
-@recording(LOGGER)
+@recording(LOGGER, compact=True)
 def check_json(json_obj: json_type):
     if isinstance(json_obj, json_scalar):
         LOGGER.error("path.json must be JSON object or array of objects. But got %s.", json_obj)
         raise TypeError("%s is invalid." % json_obj)
 
-    json_obj = normalize_json(json_obj)
-    for entry in json_obj:
-        is_home = entry["is_home"]
-        if not isinstance(is_home, bool):
-            LOGGER.error('value of key "is_home" must be boolean. But got %s.', is_home)
-            raise TypeError("%s is invalid." % is_home)
-
-        try:
-            Path(entry["src"])
-            Path(entry["dst"])
-        except KeyError:
-            LOGGER.error('key "src" or "dst" not found in "%s".', entry)
-            raise
-        except TypeError:
-            LOGGER.error('key "src" and "dst" must be valid path. But got "%s".', entry)
-            raise
-        except:
-            LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-            raise
-
-
-@recording(LOGGER)
+    if is_package_json(json_obj):
+        depends = json_obj.get("depends", [])
+        if not isinstance(depends, list) or not all(isinstance(name, str) for name in depends):
+            LOGGER.error('value of key "depends" must be array of package names. But got %s.', depends)
+            raise TypeError("%s is invalid." % depends)
+        if isinstance(json_obj["entries"], json_scalar):
+            LOGGER.error('value of key "entries" must be JSON object or array of objects. But got %s.',
+                         json_obj["entries"])
+            raise TypeError("%s is invalid." % json_obj["entries"])
+
+    for entry in normalize_json(json_obj):
+        check_entry(entry)
+
+
+def check_entry(entry: json_type):
+    is_home = entry["is_home"]
+    if not isinstance(is_home, bool):
+        LOGGER.error('value of key "is_home" must be boolean. But got %s.', is_home)
+        raise TypeError("%s is invalid." % is_home)
+
+    try:
+        os.fspath(entry["src"])
+        os.fspath(entry["dst"])
+    except KeyError:
+        LOGGER.error('key "src" or "dst" not found in "%s".', entry)
+        raise
+    except TypeError:
+        LOGGER.error('key "src" and "dst" must be valid path. But got "%s".', entry)
+        raise
+    except:
+        LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
+        raise
+
+    mode = entry.get("mode", MODE_LINK)
+    if mode not in MODES:
+        LOGGER.error('value of key "mode" must be one of %s. But got %s.', MODES, mode)
+        raise TypeError("%s is invalid." % mode)
+
+    if is_glob(entry):
+        check_glob(entry)
+
+
+@recording(LOGGER, compact=True)
 def normalize_json(json_obj: json_type) -> list[json_type]:
+    if is_package_json(json_obj):
+        json_obj = json_obj["entries"]
     if isinstance(json_obj, dict):
         json_obj = [json_obj]
     for entry in json_obj:
-        entry["is_home"] = entry.get("is_home", True)
+        normalize_entry(entry)
     return json_obj
 
 
-@recording(LOGGER)
-def list_json_to_config(json_obj: list[json_type], home_dir: Path, package_path: Path, ) -> list[PathConfig]:
+def normalize_entry(entry: json_type) -> json_type:
+    entry["is_home"] = entry.get("is_home", True)
+    return entry
+
+
+def decode_json(data: bytes) -> str:
+    return data.decode(json.detect_encoding(data), "surrogatepass")
+
+
+def parse_path_json(text: str) -> tuple[Iterable[json_type], list[str]]:
+    i = JSON_SPACE.match(text).end()
+    if text.startswith("[", i):
+        return iter_json_array(text, i), []
+    json_obj = json.loads(text)
+    check_json(json_obj)
+    return normalize_json(json_obj), json_depends(json_obj)
+
+
+def iter_json_array(text: str, i: int = 0):
+    i = JSON_SPACE.match(text, i + 1).end()
+    count = 0
+    if not text.startswith("]", i):
+        while True:
+            entry, i = JSON_DECODER.raw_decode(text, i)
+            if not isinstance(entry, dict):
+                LOGGER.error("path.json must be JSON object or array of objects. But got %s.", entry)
+                raise TypeError("%s is invalid." % entry)
+            check_entry(normalize_entry(entry))
+            count += 1
+            yield entry
+            i = JSON_SPACE.match(text, i).end()
+            if text.startswith(",", i):
+                i = JSON_SPACE.match(text, i + 1).end()
+            elif text.startswith("]", i):
+                break
+            else:
+                raise json.JSONDecodeError("Expecting ',' delimiter", text, i)
+    end = JSON_SPACE.match(text, i + 1).end()
+    if end != len(text):
+        raise json.JSONDecodeError("Extra data", text, end)
+    LOGGER.debug("Loaded %d entries.", count)
+
+
+def iter_path_json(json_path: Path):
+    entries, _ = parse_path_json(decode_json(json_path.read_bytes()))
+    return iter(entries)
+
+
+def is_package_json(json_obj: json_type) -> bool:
+    return isinstance(json_obj, dict) and "entries" in json_obj
+
+
+def json_depends(json_obj: json_type) -> list[str]:
+    return list(json_obj.get("depends", [])) if is_package_json(json_obj) else []
+
+
+def is_glob(entry: json_type) -> bool:
+    return isinstance(entry["src"], str) and GLOB_MAGIC.search(entry["src"]) is not None
+
+
+def check_glob(entry: json_type):
+    exclude = entry.get("exclude", [])
+    if not isinstance(exclude, list) or not all(isinstance(pattern, str) for pattern in exclude):
+        LOGGER.error('value of key "exclude" must be array of strings. But got %s.', exclude)
+        raise TypeError("%s is invalid." % exclude)
+
+    try:
+        fields = {field for _, field, _, _ in Formatter().parse(entry["dst"]) if field is not None}
+    except ValueError:
+        LOGGER.error('key "dst" must be valid template. But got "%s".', entry["dst"])
+        raise
+    if not fields or not fields <= set(GLOB_FIELDS):
+        LOGGER.error('key "dst" of a glob must use some of %s. But got "%s".', GLOB_FIELDS, entry["dst"])
+        raise KeyError("%s is invalid." % entry["dst"])
+
+
+def translate_glob(pattern: str) -> str:
     res = []
+    segments = pattern.strip("/").split("/")
+    for i, segment in enumerate(segments):
+        is_last = i == len(segments) - 1
+        if segment == "**":
+            res.append(".*" if is_last else "(?:.*/)?")
+            continue
+        j = 0
+        while j < len(segment):
+            c = segment[j]
+            j += 1
+            if c == "*":
+                res.append("[^/]*")
+            elif c == "?":
+                res.append("[^/]")
+            elif c == "[" and (end := segment.find("]", j + 1)) >= 0:
+                body = segment[j:end].replace("\\", "\\\\")
+                res.append("[^" + body[1:] + "]" if body.startswith("!") else "[" + body + "]")
+                j = end + 1
+            else:
+                res.append(re.escape(c))
+        if not is_last:
+            res.append("/")
+    return "".join(res)
+
+
+def compile_excludes(patterns: list[str]) -> re.Pattern | None:
+    if not patterns:
+        return None
+    return re.compile("|".join(
+        "(?:" + ("" if "/" in pattern else "(?:.*/)?") + translate_glob(pattern) + ")" for pattern in patterns))
+
+
+class GlobMatcher:
+    def __init__(self, json_obj: list[json_type]):
+        self.entries = [entry for entry in json_obj if is_glob(entry)]
+        self.include = re.compile("|".join(
+            "(?P<g%d>%s)" % (i, translate_glob(entry["src"])) for i, entry in enumerate(self.entries)))
+        self.patterns = [re.compile(translate_glob(entry["src"])) for entry in self.entries]
+        self.excludes = [compile_excludes(entry.get("exclude", [])) for entry in self.entries]
+        self.bases = []
+        for entry in self.entries:
+            segments = entry["src"].strip("/").split("/")
+            literal = []
+            for segment in segments:
+                if GLOB_MAGIC.search(segment):
+                    break
+                literal.append(segment)
+            self.bases.append(("/".join(literal), None if "**" in segments else len(segments)))
+
+    def _descend(self, path: str) -> bool:
+        depth = path.count("/") + 1
+        for base, max_depth in self.bases:
+            if not base or path == base or path.startswith(base + "/"):
+                if max_depth is None or depth < max_depth:
+                    return True
+            elif base.startswith(path + "/"):
+                return True
+        return False
+
+    def _owner(self, path: str, first: int) -> int | None:
+        for i in range(first, len(self.entries)):
+            if i != first and self.patterns[i].fullmatch(path) is None:
+                continue
+            if self.excludes[i] is None or self.excludes[i].fullmatch(path) is None:
+                return i
+        return None
+
+    @recording(LOGGER, compact=True)
+    def walk(self, package_path: Path) -> tuple[list[list], dict[str, int]]:
+        matches = []
+        dirs = {}
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            top = package_path / rel
+            try:
+                dirs[rel] = os.stat(top).st_mtime_ns
+                it = os.scandir(top)
+            except FileNotFoundError:
+                dirs[rel] = -1
+                continue
+            with it:
+                for e in it:
+                    path = rel + "/" + e.name if rel else e.name
+                    if path == "path.json":
+                        continue
+                    match = self.include.fullmatch(path)
+                    i = None if match is None else self._owner(path, int(match.lastgroup[1:]))
+                    if i is None:
+                        if e.is_dir(follow_symlinks=False) and self._descend(path):
+                            stack.append(path)
+                        continue
+                    matches.append([i, path])
+        matches.sort()
+        return matches, dirs
+
+    def expand(self, matches: list[list]) -> list[list[json_type]]:
+        expanded = [[] for _ in self.entries]
+        for i, path in matches:
+            entry = self.entries[i]
+            base, _ = self.bases[i]
+            rel = PurePosixPath(path[len(base) + 1:] if base else path)
+            dst = entry["dst"].format(path=str(rel), name=rel.name, stem=rel.stem, suffix=rel.suffix)
+            expanded[i].append({**{k: v for k, v in entry.items() if k != "exclude"}, "src": path, "dst": dst})
+        return expanded
+
+
+def entry_to_config(entry: json_type, home_dir: Path, package_path: Path) -> PathConfig:
+    dst = home_dir / entry["dst"] if entry["is_home"] else Path(entry["dst"])
+    return PathConfig(src=package_path / entry["src"], dst=dst, mode=entry.get("mode", MODE_LINK), )
+
+
+@recording(LOGGER, compact=True)
+def list_json_to_config(json_obj: Iterable[json_type], home_dir: Path, package_path: Path,
+                        cache: "ConfigCache | None" = None, ) -> list[PathConfig]:
+    res = []
+    globs = []
     for entry in json_obj:
-        src = package_path / entry["src"]
-        dst = home_dir / entry["dst"] if entry["is_home"] else Path(entry["dst"])
-        res.append(PathConfig(src=src, dst=dst, ))
+        if is_glob(entry):
+            globs.append((len(res), entry))
+        else:
+            res.append(entry_to_config(entry, home_dir, package_path))
+    if not globs:
+        return res
+
+    matcher = GlobMatcher([entry for _, entry in globs])
+    matches = cache.walk(matcher, package_path) if cache is not None else matcher.walk(package_path)[0]
+    for (pos, _), expanded in reversed(list(zip(globs, matcher.expand(matches)))):
+        res[pos:pos] = [entry_to_config(entry, home_dir, package_path) for entry in expanded]
     return res
 
 
 def load_check_convert_json(package_path, home_dir) -> list[PathConfig]:
     json_path = package_path / "path.json"
-    json_obj = cache_load_json(json_path)
-    json_obj = normalize_json(json_obj)
-    confs = list_json_to_config(json_obj, home_dir, package_path)
+    confs = list_json_to_config(iter_path_json(json_path), home_dir, package_path)
     return confs
 
 
+class ConfigCache:
+    def __init__(self, path: Path | None = None, records: dict[str, json_type] | None = None,
+                 globs: dict[str, json_type] | None = None, renders: dict[str, json_type] | None = None, ):
+        self.path = path
+        self._records = records or {}
+        self._used: dict[str, json_type] = {}
+        self._globs = globs or {}
+        self._used_globs: dict[str, json_type] = {}
+        self._renders = renders or {}
+        self._used_renders: dict[str, json_type] = {}
+        self._configs: dict[tuple[str, str], tuple[str, list[PathConfig]]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    @recording(LOGGER)
+    def open(cls, path: Path) -> "ConfigCache":
+        try:
+            cache = json.loads(path.read_text())
+        except FileNotFoundError:
+            LOGGER.debug("%s is not found.", path)
+            return cls(path)
+        except ValueError:
+            LOGGER.warning("%s is broken. Every path.json will be parsed again.", path)
+            return cls(path)
+        if cache.get("version") != CONFIG_CACHE_VERSION:
+            LOGGER.warning("%s has unknown version. Every path.json will be parsed again.", path)
+            return cls(path)
+        return cls(path, cache["records"], cache.get("globs"), cache.get("renders"))
+
+    @recording(LOGGER, compact=True)
+    def load(self, json_path: Path) -> tuple[list[json_type] | None, str]:
+        import hashlib
+
+        key = str(json_path.absolute())
+        st = os.stat(json_path)
+        with self._lock:
+            record = self._used.get(key) or self._records.get(key)
+
+        if record is not None and record["size"] == st.st_size and record["mtime_ns"] == st.st_mtime_ns \
+                and st.st_mtime_ns + CONFIG_CACHE_RACY_NS < record["cached_ns"]:
+            LOGGER.debug("%s is unchanged.", json_path)
+        else:
+            data = json_path.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()
+            if record is not None and record["hash"] == digest:
+                LOGGER.debug("%s is touched but unchanged.", json_path)
+                json_obj = record["json"]
+                depends = record.get("depends", [])
+            else:
+                LOGGER.debug("%s is new or changed.", json_path)
+                entries, depends = parse_path_json(decode_json(data))
+                json_obj = []
+                for entry in entries:
+                    if json_obj is not None:
+                        json_obj.append(entry)
+                        if len(json_obj) > CONFIG_CACHE_MAX_ENTRIES:
+                            json_obj = None
+            record = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "cached_ns": time.time_ns(),
+                      "hash": digest, "json": json_obj, "depends": depends}
+
+        with self._lock:
+            self._used[key] = record
+        return record["json"], record["hash"]
+
+    def configs(self, package_path: Path, home_dir: Path) -> list[PathConfig]:
+        json_path = package_path / "path.json"
+        json_obj, digest = self.load(json_path)
+        key = (str(package_path.absolute()), str(home_dir))
+        with self._lock:
+            memo = self._configs.get(key)
+            globs = self._used_globs.get(key[0])
+        if memo is not None and memo[0] == digest and (globs is None or self._fresh(package_path, globs)):
+            return memo[1]
+
+        confs = list_json_to_config(iter_path_json(json_path) if json_obj is None else json_obj, home_dir,
+                                    package_path, self)
+        with self._lock:
+            self._configs[key] = (digest, confs)
+        return confs
+
+    def depends(self, json_path: Path) -> list[str]:
+        with self._lock:
+            record = self._used.get(str(json_path.absolute()))
+        return record.get("depends", []) if record is not None else []
+
+    def walk(self, matcher: GlobMatcher, package_path: Path) -> list[list]:
+        import hashlib
+
+        key = str(package_path.absolute())
+        spec = hashlib.sha256(json.dumps(matcher.entries, sort_keys=True).encode()).hexdigest()
+        with self._lock:
+            record = self._used_globs.get(key) or self._globs.get(key)
+
+        if record is not None and record["spec"] == spec and self._fresh(package_path, record):
+            LOGGER.debug("Globs of %s are unchanged.", package_path)
+        else:
+            cached_ns = time.time_ns()
+            matches, dirs = matcher.walk(package_path)
+            record = {"spec": spec, "cached_ns": cached_ns, "dirs": dirs, "matches": matches}
+
+        with self._lock:
+            self._used_globs[key] = record
+        return record["matches"]
+
+    @staticmethod
+    def _fresh(package_path: Path, record: json_type) -> bool:
+        for rel, mtime_ns in record["dirs"].items():
+            try:
+                st = os.stat(package_path / rel)
+            except FileNotFoundError:
+                if mtime_ns == -1:
+                    continue
+                return False
+            if st.st_mtime_ns != mtime_ns or st.st_mtime_ns + CONFIG_CACHE_RACY_NS >= record["cached_ns"]:
+                return False
+        return True
+
+    def render_record(self, dst: Path) -> json_type | None:
+        key = str(dst.absolute())
+        with self._lock:
+            return self._used_renders.get(key) or self._renders.get(key)
+
+    def store_render(self, dst: Path, record: json_type) -> None:
+        with self._lock:
+            self._used_renders[str(dst.absolute())] = record
+
+    def fingerprint(self, package_path: Path) -> list[list]:
+        json_path = package_path / "path.json"
+        with self._lock:
+            record = self._used[str(json_path.absolute())]
+            globs = self._used_globs.get(str(package_path.absolute()))
+        res = [[str(json_path), record["mtime_ns"], record["size"]]]
+        if globs is not None:
+            res.extend([str(package_path / rel), mtime_ns, None] for rel, mtime_ns in globs["dirs"].items())
+        return res
+
+    def records(self) -> dict[str, json_type]:
+        with self._lock:
+            return dict(self._used)
+
+    @recording(LOGGER)
+    def save(self, dry_run: bool) -> None:
+        if self.path is None or dry_run:
+            return
+        with self._lock:
+            records = dict(self._used)
+            globs = dict(self._used_globs)
+            renders = dict(self._used_renders)
+        if records == self._records and globs == self._globs and renders == self._renders:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"version": CONFIG_CACHE_VERSION, "records": records, "globs": globs,
+                                   "renders": renders}))
+        os.replace(tmp, self.path)
+        self._records = records
+        self._globs = globs
+        self._renders = renders
+        LOGGER.info("Saved: %s", self.path)
+
+
+DUPLICATE = "duplicate"
+NESTED = "nested"
+
+
+@dataclass(frozen=True)
+class Overlap:
+    kind: str
+    outer: tuple[str, PathConfig]
+    inner: tuple[str, PathConfig]
+
+    @property
+    def is_error(self) -> bool:
+        return self.kind == DUPLICATE or self.outer[1].mode != MODE_FILES
+
+
+def normalize_dst(dst: Path) -> str:
+    return os.path.normpath(os.path.abspath(dst))
+
+
+class _TrieNode:
+    __slots__ = ("children", "owners")
+
+    def __init__(self):
+        self.children: dict[str, _TrieNode] = {}
+        self.owners: list[tuple[str, PathConfig]] = []
+
+
+class DestinationIndex:
+    def __init__(self):
+        self._root = _TrieNode()
+        self._packages: list[str] = []
+        self.overlaps: list[Overlap] = []
+        self._reserved: dict[str, set[str]] = {}
+        self._requires: dict[str, list[str]] = {}
+
+    def add(self, package: str, confs: list[PathConfig], requires: list[str] = ()) -> None:
+        self._packages.append(package)
+        self._requires[package] = list(requires)
+        for conf in confs:
+            node = self._root
+            for part in Path(normalize_dst(conf.dst)).parts:
+                node = node.children.setdefault(part, _TrieNode())
+            node.owners.append((package, conf))
+
+    def check(self) -> list[Overlap]:
+        overlaps = []
+        stack = [(self._root, ())]
+        while stack:
+            node, ancestors = stack.pop()
+            for i, owner in enumerate(node.owners):
+                overlaps += [Overlap(DUPLICATE, other, owner) for other in node.owners[:i]]
+                overlaps += [Overlap(NESTED, outer, owner) for outer in ancestors]
+            if node.owners:
+                ancestors += tuple(node.owners)
+            stack.extend((child, ancestors) for child in node.children.values())
+
+        self.overlaps = overlaps
+        self._reserved = {}
+        for overlap in overlaps:
+            if overlap.kind == NESTED:
+                self._reserved.setdefault(normalize_dst(overlap.outer[1].dst), set()).add(
+                    normalize_dst(overlap.inner[1].dst))
+        return [overlap for overlap in overlaps if overlap.is_error]
+
+    def reserved(self, dst: Path) -> frozenset[str]:
+        return frozenset(self._reserved.get(normalize_dst(dst), ()))
+
+    def groups(self) -> list[list[str]]:
+        parent = {name: name for name in self._packages}
+
+        def find(name: str) -> str:
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        depth = {}
+        for overlap in self.overlaps:
+            a, b = find(overlap.outer[0]), find(overlap.inner[0])
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+            outer_depth = len(Path(normalize_dst(overlap.outer[1].dst)).parts)
+            depth[overlap.outer[0]] = min(depth.get(overlap.outer[0], outer_depth), outer_depth)
+        groups = {}
+        for name in sorted(self._packages, key=lambda name: (depth.get(name, float("inf")), name)):
+            groups.setdefault(find(name), []).append(name)
+        return sorted(groups.values(), key=min)
+
+    def unknown(self) -> list[tuple[str, str]]:
+        names = set(self._packages)
+        return [(package, name) for package in sorted(self._requires) for name in self._requires[package]
+                if name not in names]
+
+    def depends(self) -> dict[str, list[str]]:
+        names = set(self._packages)
+        depends = {package: {name for name in self._requires[package] if name in names} for package in self._packages}
+        for group in self.groups():
+            for before, after in zip(group, group[1:]):
+                depends[after].add(before)
+        return {package: sorted(names) for package, names in sorted(depends.items())}
+
+
+def _dependents(depends: dict[str, list[str]]) -> tuple[dict[str, int], dict[str, list[str]]]:
+    waiting = {name: len(set(names)) for name, names in depends.items()}
+    dependents = {}
+    for name, names in sorted(depends.items()):
+        for required in set(names):
+            dependents.setdefault(required, []).append(name)
+    return waiting, dependents
+
+
+def find_cycle(depends: dict[str, list[str]], names: set[str]) -> list[str]:
+    path = []
+    index = {}
+    name = min(names)
+    while name not in index:
+        index[name] = len(path)
+        path.append(name)
+        name = min(required for required in depends[name] if required in names)
+    return path[index[name]:] + [name]
+
+
+@recording(LOGGER, compact=True)
+def topological_order(depends: dict[str, list[str]]) -> list[str]:
+    waiting, dependents = _dependents(depends)
+    ready = [name for name, count in waiting.items() if count == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        name = heapq.heappop(ready)
+        order.append(name)
+        for dependent in dependents.get(name, ()):
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                heapq.heappush(ready, dependent)
+
+    if len(order) < len(depends):
+        cycle = find_cycle(depends, set(depends) - set(order))
+        LOGGER.error("Packages depend on each other: %s.", " -> ".join(cycle))
+        raise RuntimeError("%s is a dependency cycle." % " -> ".join(cycle))
+    return order
+
+
 @recording(LOGGER)
-def backup_dst(dst: Path, backup_dir: Path, dry_run: bool):
-    if not dst.exists():
+def build_dst_index(package_base: Path, home_dir: Path, cache: ConfigCache,
+                    skip_broken: bool = False, ) -> DestinationIndex:
+    index = DestinationIndex()
+    for path in sorted(iter_package(package_base)):
+        try:
+            confs = cache.configs(path, home_dir)
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            if not skip_broken:
+                raise
+            LOGGER.warning("%s is skipped: %r", path.name, e)
+            continue
+        index.add(path.name, confs, cache.depends(path / "path.json"))
+
+    for package, name in index.unknown():
+        if skip_broken:
+            LOGGER.warning("%s depends on %s, which is not a package. It is ignored.", package, name)
+            continue
+        LOGGER.error("%s depends on %s, which is not a package.", package, name)
+        raise KeyError(name)
+
+    errors = index.check()
+    for overlap in errors:
+        (outer_name, outer), (inner_name, inner) = overlap.outer, overlap.inner
+        if overlap.kind == DUPLICATE:
+            LOGGER.error("%s of %s and %s of %s are the same destination.", outer.dst, outer_name, inner.dst, inner_name)
+        else:
+            LOGGER.error("%s of %s is inside %s of %s.", inner.dst, inner_name, outer.dst, outer_name)
+    if errors:
+        raise RuntimeError("%d destinations overlap." % len(errors))
+    topological_order(index.depends())
+    return index
+
+
+def _clone(fsrc: int, fdst: int, size: int) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fdst, FICLONE, fsrc)
+    except OSError:
+        return False
+    return True
+
+
+def _copy_range(fsrc: int, fdst: int, size: int) -> bool:
+    if not hasattr(os, "copy_file_range"):
+        return False
+    offset = 0
+    while offset < size:
+        try:
+            n = os.copy_file_range(fsrc, fdst, min(size - offset, COPY_CHUNK))
+        except OSError as e:
+            if offset == 0 and e.errno in COPY_FALLBACK_ERRNO:
+                return False
+            raise
+        if n == 0:
+            break
+        offset += n
+    return True
+
+
+def _sendfile(fsrc: int, fdst: int, size: int) -> bool:
+    offset = 0
+    while offset < size:
+        try:
+            n = os.sendfile(fdst, fsrc, offset, min(size - offset, COPY_CHUNK))
+        except OSError as e:
+            if offset == 0 and e.errno in COPY_FALLBACK_ERRNO:
+                return False
+            raise
+        if n == 0:
+            break
+        offset += n
+    return True
+
+
+def _buffered(fsrc: int, fdst: int, size: int) -> bool:
+    import shutil
+
+    with open(fsrc, "rb", closefd=False) as reader, open(fdst, "wb", closefd=False) as writer:
+        shutil.copyfileobj(reader, writer, COPY_CHUNK)
+    return True
+
+
+COPY_STRATEGIES = (_clone, _copy_range, _sendfile, _buffered)
+
+
+def copy_file(src: Path, dst: Path) -> int:
+    import shutil
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        for strategy in COPY_STRATEGIES:
+            if strategy(fsrc.fileno(), fdst.fileno(), size):
+                break
+    shutil.copystat(src, dst)
+    return size
+
+
+@dataclass(frozen=True)
+class CopyStats:
+    files: int = 0
+    bytes: int = 0
+
+    def __add__(self, other: "CopyStats") -> "CopyStats":
+        return CopyStats(files=self.files + other.files, bytes=self.bytes + other.bytes)
+
+
+def copy_tree(src: Path, dst: Path, jobs: int = COPY_JOBS) -> CopyStats:
+    import shutil
+    from concurrent.futures import ThreadPoolExecutor
+
+    dirs = []
+    stats = CopyStats()
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = []
+        stack = [(src, dst)]
+        while stack:
+            src_dir, dst_dir = stack.pop()
+            dst_dir.mkdir(parents=True, exist_ok=True)
+            dirs.append((src_dir, dst_dir))
+            with os.scandir(src_dir) as it:
+                for entry in it:
+                    to = dst_dir / entry.name
+                    if entry.is_symlink():
+                        if to.is_symlink() or to.exists():
+                            to.unlink()
+                        to.symlink_to(os.readlink(entry.path))
+                    elif entry.is_dir(follow_symlinks=False):
+                        stack.append((Path(entry.path), to))
+                    elif entry.is_file(follow_symlinks=False):
+                        futures.append(executor.submit(copy_file, Path(entry.path), to))
+                    else:
+                        LOGGER.warning("%s is a special file. Skipped.", entry.path)
+        for future in futures:
+            stats += CopyStats(files=1, bytes=future.result())
+
+    for src_dir, dst_dir in reversed(dirs):
+        shutil.copystat(src_dir, dst_dir)
+    return stats
+
+
+def backup_roots(state: dict[str, json_type]) -> frozenset[str]:
+    return frozenset(normalize_dst(Path(entry["dst"])) for entry in state.get("entries", []))
+
+
+def backup_name(dst: Path, roots: frozenset[str] = frozenset()) -> str:
+    path = normalize_dst(dst)
+    root = path
+    while root not in roots:
+        parent = os.path.dirname(root)
+        if parent == root:
+            return dst.name
+        root = parent
+    return os.path.relpath(path, os.path.dirname(root))
+
+
+@recording(LOGGER)
+def backup_dst(dst: Path, backup_dir: Path, dry_run: bool, state: FileState | None = None,
+               name: str | None = None, ) -> CopyStats:
+    if state is None:
+        state = read_file_state(dst)
+
+    if state.missing:
         LOGGER.debug("%s is not found.", dst)
-        return
+        return CopyStats()
 
-    if dst.is_symlink():
+    if state.is_symlink:
         LOGGER.debug("%s is a symbolic link.", dst)
-        return
+        return CopyStats()
 
+    copy_to = backup_dir / (name or dst.name)
     if not dry_run:
-        backup_dir.mkdir(parents=True, exist_ok=True)
+        copy_to.parent.mkdir(parents=True, exist_ok=True)
 
-    copy_to = backup_dir / dst.name
-    if dst.is_file():
+    stats = CopyStats()
+    if state.is_file:
         LOGGER.debug("%s is a file.", dst)
         if not dry_run:
-            shutil.copy2(dst, copy_to)
+            stats = CopyStats(files=1, bytes=copy_file(dst, copy_to))
         LOGGER.info("Copied: %s -> %s", dst, copy_to)
-        return
-    if dst.is_dir():
+        return stats
+    if state.is_dir:
         LOGGER.debug("%s is a directory.", dst)
         if not dry_run:
-            shutil.copytree(dst, copy_to, dirs_exist_ok=True)
+            stats = copy_tree(dst, copy_to)
         LOGGER.info("Copied: %s -> %s", dst, copy_to)
-        return
+        return stats
 
     LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
     raise RuntimeError("%s is invalid." % dst)
 
 
-@recording(LOGGER)
-def generate_backup_json(configs: list[PathConfig], backup_dir: Path, ) -> list[json_type] | None:
+@recording(LOGGER, compact=True)
+def generate_backup_json(configs: list[PathConfig], backup_dir: Path, snapshot: FileSnapshot | None = None,
+                         roots: frozenset[str] = frozenset(), ) -> list[json_type] | None:
+    if snapshot is None:
+        snapshot = FileSnapshot()
     res = []
     for config in configs:
-        dst = config.dst.resolve()
-        copy_to = backup_dir / dst.name
-        if copy_to.exists():
-            res.append({"is_home": False, "src": copy_to.name, "dst": str(dst)})
+        dst = snapshot.realpath(config.dst)
+        name = backup_name(config.dst, roots)
+        if not snapshot.get(backup_dir / name, follow_symlinks=True).missing:
+            res.append({"is_home": False, "src": name, "dst": str(dst)})
     return res if res else None
 
 
-@recording(LOGGER)
+@recording(LOGGER, compact=True)
 def write_backup_json(json_bk: list[json_type] | None, backup_dir: Path, dry_run: bool) -> None:
     if json_bk is None:
         return
@@ -177,128 +1227,2131 @@ def write_backup_json(json_bk: list[json_type] | None, backup_dir: Path, dry_run
         return
 
     save_to = backup_dir / "path.json"
+    if save_to.exists():
+        dsts = {entry["dst"] for entry in json_bk}
+        json_bk = [entry for entry in normalize_json(json.loads(save_to.read_text())) if entry["dst"] not in dsts] + json_bk
     save_to.write_text(json.dumps(json_bk))
     LOGGER.info("Created: %s", save_to)
 
 
-@recording(LOGGER)
-def cleanup_dst(dst: Path, dry_run: bool):
-    if not dst.exists():
+def hash_file(path: Path) -> str:
+    import hashlib
+
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_path(store_dir: Path, digest: str) -> Path:
+    return store_dir / "objects" / digest[:2] / digest[2:]
+
+
+def store_object(path: Path, st: os.stat_result, store_dir: Path, known: dict[str, json_type]) -> dict[str, json_type]:
+    record = known.get(str(path))
+    if record is not None and [record["size"], record["mtime_ns"], record["ino"]] == [
+            st.st_size, st.st_mtime_ns, st.st_ino]:
+        digest = record["object"]
+    else:
+        digest = hash_file(path)
+
+    stored = 0
+    to = object_path(store_dir, digest)
+    if not to.exists():
+        to.parent.mkdir(parents=True, exist_ok=True)
+        tmp = to.with_name(f"{to.name}.{threading.get_ident()}.tmp")
+        stored = copy_file(path, tmp)
+        os.replace(tmp, to)
+    return {
+        "type": "file",
+        "mode": stat.S_IMODE(st.st_mode),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "ino": st.st_ino,
+        "object": digest,
+        "stored": stored,
+    }
+
+
+def store_tree(root: Path, store_dir: Path, known: dict[str, json_type], jobs: int = COPY_JOBS) -> list[json_type]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    entries = []
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = []
+        stack = [root]
+        while stack:
+            current = stack.pop()
+            with os.scandir(current) as it:
+                for entry in it:
+                    path = Path(entry.path)
+                    rel = str(path.relative_to(root))
+                    st = entry.stat(follow_symlinks=False)
+                    if entry.is_symlink():
+                        entries.append({"path": rel, "type": "symlink", "target": os.readlink(path)})
+                    elif entry.is_dir(follow_symlinks=False):
+                        entries.append({"path": rel, "type": "dir", "mode": stat.S_IMODE(st.st_mode),
+                                        "mtime_ns": st.st_mtime_ns})
+                        stack.append(path)
+                    elif entry.is_file(follow_symlinks=False):
+                        futures.append((rel, executor.submit(store_object, path, st, store_dir, known)))
+                    else:
+                        LOGGER.warning("%s is a special file. Skipped.", path)
+        for rel, future in futures:
+            entries.append({"path": rel, **future.result()})
+    entries.sort(key=lambda e: e["path"])
+    return entries
+
+
+@recording(LOGGER, compact=True)
+def store_dst(dst: Path, store_dir: Path, known: dict[str, json_type],
+              state: FileState | None = None, ) -> dict[str, json_type] | None:
+    if state is None:
+        state = read_file_state(dst)
+    st = state.st
+
+    if state.missing:
         LOGGER.debug("%s is not found.", dst)
-        return
+        return None
 
-    if dst.is_file():
-        if not dry_run:
-            dst.unlink()
-        LOGGER.info("Deleted: %s", dst)
-        return
+    if state.is_symlink:
+        LOGGER.debug("%s is a symbolic link.", dst)
+        return None
+
+    if state.is_file:
+        entry = {"dst": str(dst.absolute()), **store_object(dst, st, store_dir, known)}
+    elif state.is_dir:
+        tree = store_tree(dst, store_dir, known)
+        entry = {"dst": str(dst.absolute()), "type": "dir", "mode": stat.S_IMODE(st.st_mode),
+                 "mtime_ns": st.st_mtime_ns, "tree": tree}
+    else:
+        LOGGER.error("%s is neither a file nor a directory.", dst)
+        raise RuntimeError("%s is invalid." % dst)
+
+    LOGGER.info("Stored: %s -> %s", dst, store_dir)
+    return entry
+
+
+def list_generations(store_dir: Path, package_name: str) -> list[Path]:
+    gen_dir = store_dir / "generations" / package_name
+    if not gen_dir.is_dir():
+        return []
+    return sorted(gen_dir.glob("*.json"))
+
+
+def known_objects(generation: Path) -> dict[str, json_type]:
+    known = {}
+    for entry in json.loads(generation.read_text())["entries"]:
+        if entry["type"] == "file":
+            known[entry["dst"]] = entry
+        for child in entry.get("tree", []):
+            if child["type"] == "file":
+                known[str(Path(entry["dst"]) / child["path"])] = child
+    return known
+
+
+@recording(LOGGER, compact=True)
+def backup_to_store(configs: list[PathConfig], store_dir: Path, package_name: str,
+                    snapshot: FileSnapshot | None = None, ) -> Path | None:
+    if snapshot is None:
+        snapshot = FileSnapshot()
+    generations = list_generations(store_dir, package_name)
+    known = known_objects(generations[-1]) if generations else {}
+
+    entries = [entry for conf in configs
+               if (entry := store_dst(conf.dst, store_dir, known, snapshot.get(conf.dst))) is not None]
+    if not entries:
+        return None
+
+    now = time.time_ns()
+    save_to = store_dir / "generations" / package_name / (
+            time.strftime("%Y%m%dT%H%M%S", time.gmtime(now // 10 ** 9)) + f"{now % 10 ** 9:09d}.json")
+    save_to.parent.mkdir(parents=True, exist_ok=True)
+    tmp = save_to.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"package": package_name, "created_ns": now, "entries": entries}))
+    os.replace(tmp, save_to)
+    LOGGER.info("Created: %s", save_to)
+    return save_to
 
-    if dst.is_dir():
-        if not dry_run:
-            shutil.rmtree(dst)
-        LOGGER.info("Deleted: %s", dst)
-        return
 
-    LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-    raise RuntimeError("%s is invalid." % dst)
+def iter_stored(entries: list[json_type]):
+    for entry in entries:
+        if "stored" in entry:
+            yield entry
+        yield from iter_stored(entry.get("tree", []))
+
+
+def iter_objects(entries: list[json_type]):
+    for entry in entries:
+        if "object" in entry:
+            yield entry["object"]
+        yield from iter_objects(entry.get("tree", []))
+
+
+@recording(LOGGER)
+def prune_store(store_dir: Path, keep: int, keep_days: float | None, dry_run: bool) -> tuple[int, int]:
+    gen_root = store_dir / "generations"
+    package_names = sorted(p.name for p in gen_root.iterdir() if p.is_dir()) if gen_root.is_dir() else []
+    deadline = time.time_ns() - int(keep_days * 86400 * 10 ** 9) if keep_days is not None else None
+
+    removed_generations = 0
+    referenced = set()
+    for name in package_names:
+        generations = list_generations(store_dir, name)
+        for i, generation in enumerate(reversed(generations)):
+            manifest = json.loads(generation.read_text())
+            if i < keep or (deadline is not None and manifest["created_ns"] >= deadline):
+                referenced.update(iter_objects(manifest["entries"]))
+                continue
+            if not dry_run:
+                generation.unlink()
+            removed_generations += 1
+            LOGGER.info("Deleted: %s", generation)
+
+    removed_objects = 0
+    objects_dir = store_dir / "objects"
+    if objects_dir.is_dir():
+        for fan in objects_dir.iterdir():
+            for obj in fan.iterdir():
+                if fan.name + obj.name in referenced:
+                    continue
+                if not dry_run:
+                    obj.unlink()
+                removed_objects += 1
+                LOGGER.debug("Deleted: %s", obj)
+
+    LOGGER.info("Pruned %d generations and %d objects.", removed_generations, removed_objects)
+    return removed_generations, removed_objects
+
+
+@recording(LOGGER, compact=True)
+def archive_members(path: Path, name: str, st: os.stat_result) -> list[tuple[tarfile.TarInfo, Path | None]]:
+    import tarfile
+
+    info = tarfile.TarInfo(name)
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.mtime = st.st_mtime
+    info.uid = st.st_uid
+    info.gid = st.st_gid
+    if stat.S_ISLNK(st.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(path)
+        return [(info, None)]
+    if stat.S_ISREG(st.st_mode):
+        info.size = st.st_size
+        return [(info, path)]
+    if not stat.S_ISDIR(st.st_mode):
+        LOGGER.warning("%s is a special file. Skipped.", path)
+        return []
+
+    info.type = tarfile.DIRTYPE
+    members = [(info, None)]
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        members += archive_members(Path(entry.path), f"{name}/{entry.name}", entry.stat(follow_symlinks=False))
+    return members
+
+
+def iter_archive_chunks(members: list[tuple[tarfile.TarInfo, Path | None]]):
+    import tarfile
+
+    chunk = []
+    size = 0
+    for info, path in members:
+        member_size = tarfile.BLOCKSIZE + info.size
+        if chunk and size + member_size > ARCHIVE_CHUNK:
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append((info, path))
+        size += member_size
+    if chunk:
+        yield chunk
+
+
+def _compressor(backup_format: str):
+    if backup_format == BACKUP_TAR_GZ:
+        import zlib
+
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        import lzma
+    except ImportError:
+        LOGGER.error("lzma module is not available.")
+        raise RuntimeError("%s backup is not supported." % backup_format)
+    return lzma.LZMACompressor(format=lzma.FORMAT_XZ)
+
+
+def _decompress(data: bytes, backup_format: str) -> bytes:
+    if backup_format == BACKUP_TAR_GZ:
+        import zlib
+
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    import lzma
+
+    return lzma.decompress(data, format=lzma.FORMAT_XZ)
+
+
+def compress_chunk(chunk: list[tuple[tarfile.TarInfo, Path | None]], backup_format: str) -> tuple[bytes, list[int]]:
+    import tarfile
+
+    compressor = _compressor(backup_format)
+    out = []
+    offsets = []
+    pos = 0
+    for info, path in chunk:
+        offsets.append(pos)
+        header = info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        out.append(compressor.compress(header))
+        pos += len(header)
+        if path is None:
+            continue
+
+        remaining = info.size
+        with path.open("rb") as f:
+            while remaining and (data := f.read(min(COPY_CHUNK, remaining))):
+                out.append(compressor.compress(data))
+                remaining -= len(data)
+        if remaining:
+            LOGGER.warning("%s was truncated while archived.", path)
+            out.append(compressor.compress(bytes(remaining)))
+        padding = -info.size % tarfile.BLOCKSIZE
+        out.append(compressor.compress(bytes(padding)))
+        pos += info.size + padding
+    out.append(compressor.flush())
+    return b"".join(out), offsets
+
+
+def index_path(archive: Path) -> Path:
+    return archive.with_name(archive.name + ".json")
+
+
+def list_archives(backup_dir: Path) -> list[Path]:
+    if not backup_dir.is_dir():
+        return []
+    return sorted(path for path in backup_dir.iterdir() if path.name.endswith(BACKUP_ARCHIVES))
+
+
+@recording(LOGGER, compact=True)
+def backup_to_archive(configs: list[PathConfig], backup_dir: Path, backup_format: str,
+                      snapshot: FileSnapshot | None = None, jobs: int = COPY_JOBS,
+                      roots: frozenset[str] = frozenset(), ) -> Path | None:
+    import tarfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    if snapshot is None:
+        snapshot = FileSnapshot()
+    entries = []
+    members = []
+    for conf in configs:
+        state = snapshot.get(conf.dst)
+        if not (state.is_file or state.is_dir):
+            LOGGER.debug("%s is neither a file nor a directory.", conf.dst)
+            continue
+        name = backup_name(conf.dst, roots)
+        entries.append({"src": name, "dst": str(snapshot.realpath(conf.dst))})
+        members += archive_members(conf.dst, name, state.st)
+    if not entries:
+        return None
+
+    now = time.time_ns()
+    save_to = backup_dir / (time.strftime("%Y%m%dT%H%M%S", time.gmtime(now // 10 ** 9))
+                            + f"{now % 10 ** 9:09d}.{backup_format}")
+    save_to.parent.mkdir(parents=True, exist_ok=True)
+    tmp = save_to.with_name(save_to.name + ".tmp")
+    index = []
+    with tmp.open("wb") as f, ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        def write(chunk, future):
+            data, offsets = future.result()
+            stream = f.tell()
+            f.write(data)
+            for (info, _), offset in zip(chunk, offsets):
+                index.append({"name": info.name, "size": info.size, "stream": stream, "length": len(data),
+                              "offset": offset})
+
+        pending = deque()
+        for chunk in iter_archive_chunks(members):
+            pending.append((chunk, executor.submit(compress_chunk, chunk, backup_format)))
+            if len(pending) > 2 * max(jobs, 1):
+                write(*pending.popleft())
+        while pending:
+            write(*pending.popleft())
+        compressor = _compressor(backup_format)
+        f.write(compressor.compress(bytes(2 * tarfile.BLOCKSIZE)) + compressor.flush())
+    os.replace(tmp, save_to)
+
+    tmp = index_path(save_to).with_suffix(".tmp")
+    tmp.write_text(json.dumps({"format": backup_format, "entries": entries, "members": index}))
+    os.replace(tmp, index_path(save_to))
+    LOGGER.info("Archived: %s -> %s", ", ".join(entry["dst"] for entry in entries), save_to)
+    return save_to
+
+
+def archived_members(index: json_type, name: str) -> list[json_type]:
+    return [m for m in index["members"] if m["name"] == name or m["name"].startswith(name + "/")]
+
+
+@recording(LOGGER)
+def extract_archived(archive: Path, name: str, to: Path) -> int:
+    import shutil
+    import tarfile
+
+    index = json.loads(index_path(archive).read_text())
+    members = archived_members(index, name)
+    if not members:
+        LOGGER.error("%s is not found in %s.", name, archive)
+        raise KeyError(name)
+
+    modes = []
+    streams = {}
+    with archive.open("rb") as f:
+        for member in members:
+            if member["stream"] not in streams:
+                streams.clear()
+                f.seek(member["stream"])
+                streams[member["stream"]] = _decompress(f.read(member["length"]), index["format"])
+            data = io.BytesIO(streams[member["stream"]])
+            data.seek(member["offset"])
+            with tarfile.open(fileobj=data, mode="r:") as tar:
+                info = tar.next()
+                path = to / info.name[len(name) + 1:] if info.name != name else to
+                if info.isdir():
+                    path.mkdir(parents=True, exist_ok=True)
+                    modes.append((path, info))
+                    continue
+                path.parent.mkdir(parents=True, exist_ok=True)
+                if info.issym():
+                    path.symlink_to(info.linkname)
+                    continue
+                with tar.extractfile(info) as src, path.open("wb") as dst:
+                    shutil.copyfileobj(src, dst, COPY_CHUNK)
+                modes.append((path, info))
+
+    for path, info in reversed(modes):
+        os.chmod(path, info.mode)
+        os.utime(path, (info.mtime, info.mtime))
+    LOGGER.info("Extracted: %s:%s -> %s", archive, name, to)
+    return len(members)
+
+
+def stat_entry(path: Path) -> list:
+    try:
+        return [str(path), os.stat(path).st_mtime_ns, None]
+    except FileNotFoundError:
+        return [str(path), -1, None]
+
+
+def take_fingerprint(package_base: Path) -> dict[str, json_type]:
+    started_ns = time.time_ns()
+    paths = [Path(__file__), package_base, *sorted(iter_package(package_base))]
+    return {"version": FINGERPRINT_VERSION, "package_base": str(package_base), "started_ns": started_ns,
+            "stats": [stat_entry(path) for path in paths]}
+
+
+@recording(LOGGER, compact=True)
+def write_fingerprint(fingerprint: dict[str, json_type], package_base: Path, home_dir: Path,
+                      cache: ConfigCache) -> bool:
+    fingerprint_path = home_dir / ".dotbackup" / FINGERPRINT_FILE
+    stats = list(fingerprint["stats"])
+    packages = {}
+    for package_path in sorted(iter_package(package_base)):
+        confs = cache.configs(package_path, home_dir)
+        stats.extend(cache.fingerprint(package_path))
+        packages[package_path.name] = []
+        for conf in confs:
+            if conf.mode != MODE_LINK or read_file_state(conf.dst).target != str(conf.src):
+                LOGGER.debug("%s needs a full check on every run.", conf.dst)
+                return False
+            packages[package_path.name].append([str(conf.src), str(conf.dst)])
+
+    if any(mtime_ns + CONFIG_CACHE_RACY_NS >= fingerprint["started_ns"] for _, mtime_ns, _ in stats):
+        LOGGER.debug("%s is too new to be fingerprinted.", package_base)
+        return False
+    tmp = fingerprint_path.with_name(fingerprint_path.name + ".tmp")
+    tmp.write_text(json.dumps({**fingerprint, "stats": stats, "packages": packages}))
+    os.replace(tmp, fingerprint_path)
+    LOGGER.info("Saved: %s", fingerprint_path)
+    return True
+
+
+def forget_fingerprint(home_dir: Path) -> None:
+    try:
+        os.unlink(home_dir / ".dotbackup" / FINGERPRINT_FILE)
+    except FileNotFoundError:
+        pass
+
+
+def check_fingerprint(package_base: Path, home_dir: Path) -> dict[str, list[list[str]]] | None:
+    try:
+        fingerprint = json.loads((home_dir / ".dotbackup" / FINGERPRINT_FILE).read_bytes())
+    except (FileNotFoundError, ValueError):
+        return None
+    if fingerprint.get("version") != FINGERPRINT_VERSION or fingerprint["package_base"] != str(package_base):
+        return None
+
+    for path, mtime_ns, size in fingerprint["stats"]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if mtime_ns == -1:
+                continue
+            return None
+        if st.st_mtime_ns != mtime_ns or (size is not None and st.st_size != size):
+            return None
+    for entries in fingerprint["packages"].values():
+        for src, dst in entries:
+            try:
+                if os.readlink(dst) != src:
+                    return None
+            except OSError:
+                return None
+    return fingerprint["packages"]
+
+
+def fingerprint_status(packages: dict[str, list[list[str]]]) -> dict[str, json_type]:
+    report = {"packages": {}, "summary": {status: 0 for status in STATUSES}}
+    for name, entries in packages.items():
+        report["packages"][name] = [{"src": src, "dst": dst, "status": LINKED, "target": src} for src, dst in entries]
+        report["summary"][LINKED] += len(entries)
+    return report
+
+
+def package_state(package_path: Path, digest: str, confs: list[PathConfig]) -> dict[str, json_type]:
+    return {
+        "path": str(package_path),
+        "hash": digest,
+        "entries": [{"src": str(conf.src), "dst": str(conf.dst)} for conf in confs],
+    }
+
+
+class Trash:
+    def __init__(self, trash_dir: Path):
+        self.trash_dir = trash_dir
+        self._queue: queue.Queue[Path] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def put(self, path: Path) -> bool:
+        import uuid
+
+        self.trash_dir.mkdir(parents=True, exist_ok=True)
+        to = self.trash_dir / uuid.uuid4().hex
+        try:
+            os.rename(path, to)
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                LOGGER.debug("%s is on a different filesystem from %s.", path, self.trash_dir)
+                return False
+            raise
+        LOGGER.debug("Moved: %s -> %s", path, to)
+        self._schedule(to)
+        return True
+
+    def purge(self) -> None:
+        if not self.trash_dir.is_dir():
+            return
+        for path in self.trash_dir.iterdir():
+            LOGGER.debug("%s is left from a previous run.", path)
+            self._schedule(path)
+
+    def wait(self) -> None:
+        self._queue.join()
+
+    def _schedule(self, path: Path) -> None:
+        self._queue.put(path)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="dotfiles-trash", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        import shutil
+
+        while True:
+            path = self._queue.get()
+            try:
+                if path.is_dir() and not path.is_symlink():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+                LOGGER.debug("Deleted: %s", path)
+            except OSError as e:
+                LOGGER.warning("Failed to delete %s: %s", path, e)
+            finally:
+                self._queue.task_done()
 
 
 @recording(LOGGER)
-def link_dst_to_src(path_conf: PathConfig, dry_run: bool):
+def swap_link(path_conf: PathConfig, trash: Trash | None = None, snapshot: FileSnapshot | None = None) -> None:
+    import uuid
+
+    if snapshot is None:
+        snapshot = FileSnapshot()
     src = path_conf.src
     dst = path_conf.dst
 
-    if not src.exists():
+    src_state = snapshot.get(src, follow_symlinks=True)
+    if src_state.missing:
         LOGGER.warning("%s is not found. Broken link will be created.", src)
 
-    if src.is_dir():
-        if not dry_run:
-            dst.symlink_to(src, target_is_directory=True)
-        LOGGER.info("Linked: %s <- %s", src, dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}.tmp")
+    tmp.symlink_to(src, target_is_directory=src_state.is_dir)
+    replace_dst(tmp, dst, trash, snapshot)
+    LOGGER.info("Linked: %s <- %s", src, dst)
+
+
+def replace_dst(tmp: Path, dst: Path, trash: Trash | None, snapshot: FileSnapshot) -> None:
+    import shutil
+
+    try:
+        try:
+            os.replace(tmp, dst)
+        except IsADirectoryError:
+            LOGGER.debug("%s is a directory.", dst)
+            if trash is None or not trash.put(dst):
+                shutil.rmtree(dst)
+            snapshot.invalidate(dst, recursive=True)
+            LOGGER.info("Deleted: %s", dst)
+            os.replace(tmp, dst)
+    except BaseException:
+        tmp.unlink()
+        raise
+    finally:
+        snapshot.invalidate(dst)
+
+
+@dataclass(frozen=True)
+class Rendered:
+    content: bytes | None
+    owned: bool
+
+
+@recording(LOGGER, compact=True)
+def host_vars(package_base: Path, home_dir: Path) -> dict[str, str]:
+    uname = os.uname()
+    variables = {"hostname": uname.nodename, "system": uname.sysname, "home": str(home_dir),
+                 "user": os.environ.get("USER") or home_dir.name}
+    try:
+        json_obj = json.loads((package_base / VARS_FILE).read_text())
+    except FileNotFoundError:
+        return variables
+    if not isinstance(json_obj, dict):
+        LOGGER.error("%s must be JSON object. But got %s.", package_base / VARS_FILE, json_obj)
+        raise TypeError("%s is invalid." % json_obj)
+    for section in [json_obj.get("default", {}), json_obj.get("hosts", {}).get(uname.nodename, {})]:
+        variables.update({key: str(value) for key, value in section.items()})
+    return variables
+
+
+def vars_digest(variables: dict[str, str]) -> str:
+    import hashlib
+
+    return hashlib.sha256(json.dumps(variables, sort_keys=True).encode()).hexdigest()
+
+
+def render_template(template: Path, variables: dict[str, str]) -> bytes:
+    try:
+        return Template(template.read_text()).substitute(variables).encode()
+    except KeyError as e:
+        LOGGER.error("%s uses %s, which is not defined.", template, e)
+        raise
+    except ValueError:
+        LOGGER.error("%s has an invalid placeholder.", template)
+        raise
+
+
+@recording(LOGGER, compact=True)
+def check_rendered(path_conf: PathConfig, variables: dict[str, str], digest: str,
+                   cache: ConfigCache | None = None, ) -> Rendered:
+    import hashlib
+
+    src_st = os.stat(path_conf.src)
+    state = read_file_state(path_conf.dst)
+    dst_stat = [state.st.st_mtime_ns, state.st.st_size] if state.is_file else None
+    record = cache.render_record(path_conf.dst) if cache is not None else None
+    if record is not None and record["vars"] == digest and record["src_stat"] == [src_st.st_mtime_ns, src_st.st_size] \
+            and dst_stat is not None and record["dst_stat"] == dst_stat \
+            and max(src_st.st_mtime_ns, state.st.st_mtime_ns) + CONFIG_CACHE_RACY_NS < record["cached_ns"]:
+        LOGGER.debug("%s is unchanged.", path_conf.dst)
+        return Rendered(None, True)
+
+    cached_ns = time.time_ns()
+    template_digest = hash_file(path_conf.src)
+    dst_digest = hash_file(path_conf.dst) if state.is_file else None
+    if record is not None and record["vars"] == digest and record["template"] == template_digest \
+            and dst_digest == record["output"]:
+        LOGGER.debug("%s is touched but unchanged.", path_conf.dst)
+        content = None
+        output = record["output"]
+    else:
+        content = render_template(path_conf.src, variables)
+        output = hashlib.sha256(content).hexdigest()
+        if dst_digest == output:
+            content = None
+    owned = record is not None and dst_digest is not None and dst_digest == record["output"]
+
+    if cache is not None:
+        cache.store_render(path_conf.dst, {
+            "vars": digest, "template": template_digest, "output": output, "cached_ns": cached_ns,
+            "src_stat": [src_st.st_mtime_ns, src_st.st_size], "dst_stat": dst_stat if content is None else None,
+        })
+    return Rendered(content, owned)
+
+
+@recording(LOGGER)
+def render_packages(package_base: Path, packages: list[Path], home_dir: Path, cache: ConfigCache,
+                    jobs: int = COPY_JOBS, ) -> dict[str, Rendered]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    confs = []
+    for package_path in packages:
+        confs.extend(conf for conf in cache.configs(package_path, home_dir) if conf.mode == MODE_TEMPLATE)
+    if not confs:
+        return {}
+
+    variables = host_vars(package_base, home_dir)
+    digest = vars_digest(variables)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(lambda conf: check_rendered(conf, variables, digest, cache), confs))
+    return {str(conf.dst): rendered for conf, rendered in zip(confs, results)}
+
+
+def plan_render(path_conf: PathConfig, rendered: Rendered, snapshot: FileSnapshot | None = None) -> list[Operation]:
+    if rendered.content is None:
+        LOGGER.debug("%s is already rendered.", path_conf.dst)
+        return []
+    state = (snapshot or FileSnapshot()).get(path_conf.dst)
+    if state.missing:
+        return [Operation(RENDER, path_conf)]
+    if state.is_symlink:
+        return [Operation(UNLINK, path_conf), Operation(RENDER, path_conf)]
+    if state.is_file and rendered.owned:
+        return [Operation(RENDER, path_conf)]
+    if state.is_file or state.is_dir:
+        return [Operation(BACKUP, path_conf), Operation(RENDER, path_conf)]
+
+    LOGGER.error("%s is neither a file, a directory nor a symbolic link.", path_conf.dst)
+    raise RuntimeError("%s is invalid." % path_conf.dst)
+
+
+@recording(LOGGER)
+def write_rendered(path_conf: PathConfig, content: bytes, trash: Trash | None = None,
+                   snapshot: FileSnapshot | None = None, ) -> None:
+    import uuid
+
+    if snapshot is None:
+        snapshot = FileSnapshot()
+    dst = path_conf.dst
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp, stat.S_IMODE(os.stat(path_conf.src).st_mode))
+    replace_dst(tmp, dst, trash, snapshot)
+    LOGGER.info("Rendered: %s -> %s", path_conf.src, dst)
+
+
+def fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    def __init__(self, path: Path, batch: int = JOURNAL_BATCH):
+        self.path = path
+        self.batch = batch
+        self.plan: PackagePlan | None = None
+        self.targets: dict[str, str] = {}
+        self.done: dict[tuple[str, str], json_type] = {}
+        self.syncs = 0
+        self._file = None
+        self._pending = 0
+
+    @classmethod
+    def load(cls, path: Path, batch: int = JOURNAL_BATCH) -> "Journal | None":
+        try:
+            lines = path.read_text().splitlines()
+        except FileNotFoundError:
+            return None
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                LOGGER.debug("%s ends with a torn record.", path)
+                break
+        if not records or "operations" not in records[0]:
+            LOGGER.warning("%s has no complete header. Nothing had been changed, so it is ignored.", path)
+            return None
+
+        header = records[0]
+        journal = cls(path, batch)
+        journal.plan = PackagePlan(
+            name=header["package"],
+            backup_dir=Path(header["backup_dir"]),
+            operations=[Operation(op["action"], PathConfig(Path(op["src"]), Path(op["dst"])))
+                        for op in header["operations"]],
+            state=header["state"],
+            backup_format=header["backup_format"],
+        )
+        journal.targets = {op["dst"]: op["target"] for op in header["operations"] if "target" in op}
+        journal.done = {(record["action"], record["dst"]): record for record in records[1:]}
+        return journal
+
+    def begin(self, plan: PackagePlan, snapshot: FileSnapshot) -> None:
+        self.plan = plan
+        self.targets = {str(op.conf.dst): target for op in plan.actions(UNLINK)
+                        if (target := snapshot.get(op.conf.dst).target) is not None}
+        operations = []
+        for op in plan.operations:
+            operation = {"action": op.action, "src": str(op.conf.src), "dst": str(op.conf.dst)}
+            if str(op.conf.dst) in self.targets:
+                operation["target"] = self.targets[str(op.conf.dst)]
+            operations.append(operation)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("w")
+        self._file.write(json.dumps({
+            "package": plan.name,
+            "backup_dir": str(plan.backup_dir),
+            "backup_format": plan.backup_format,
+            "state": plan.state,
+            "operations": operations,
+        }) + "\n")
+        self.sync()
+        fsync_dir(self.path.parent)
+        LOGGER.debug("Created: %s", self.path)
+
+    def resume(self) -> None:
+        self._file = self.path.open("a")
+
+    def remaining(self) -> list[Operation]:
+        return [op for op in self.plan.operations if not self.is_done(op)]
+
+    def is_done(self, op: Operation) -> bool:
+        if op.action in (UNLINK, DELETE):
+            return (LINK, str(op.conf.dst)) in self.done or (RENDER, str(op.conf.dst)) in self.done
+        return (op.action, str(op.conf.dst)) in self.done
+
+    def record(self, op: Operation, **extra) -> None:
+        record = {"action": op.action, "dst": str(op.conf.dst), **extra}
+        self.done[(op.action, str(op.conf.dst))] = record
+        self._file.write(json.dumps(record) + "\n")
+        self._pending += 1
+        if self._pending >= self.batch:
+            self.sync()
+
+    def sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self.syncs += 1
+
+    def commit(self) -> None:
+        self.close()
+        self.path.unlink()
+        LOGGER.debug("Deleted: %s", self.path)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@recording(LOGGER)
+def unfold_link(path_conf: PathConfig, snapshot: FileSnapshot | None = None) -> None:
+    import shutil
+    import uuid
+
+    dst = path_conf.dst
+    target = link_target(dst, os.readlink(dst))
+    tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}.tmp")
+    tmp.mkdir()
+    try:
+        with os.scandir(target) as it:
+            for entry in it:
+                (tmp / entry.name).symlink_to(target / entry.name)
+        dst.unlink()
+        os.rename(tmp, dst)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    finally:
+        if snapshot is not None:
+            snapshot.invalidate(dst, recursive=True)
+    LOGGER.info("Unfolded: %s -> %s", dst, target)
+
+
+@recording(LOGGER)
+def prune_link(path_conf: PathConfig) -> None:
+    dst = path_conf.dst
+    if not dst.is_symlink():
+        LOGGER.debug("%s is not a symbolic link.", dst)
         return
+    dst.unlink()
+    LOGGER.info("Unlinked: %s", dst)
+
+
+class PackageLogBuffer(logging.Filter):
+    def __init__(self, log: logging.Logger):
+        super().__init__()
+        self._log = log
+        self._local = threading.local()
+        self._records: dict[str, list[logging.LogRecord]] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._log.addFilter(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._log.removeFilter(self)
+        with self._lock:
+            names = list(self._records)
+        for name in names:
+            self.flush(name)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        name = getattr(self._local, "package", None)
+        if name is None:
+            return True
+        with self._lock:
+            self._records.setdefault(name, []).append(record)
+        return False
+
+    def run(self, name: str, func, *args, **kwargs):
+        self._local.package = name
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._local.package = None
+
+    def flush(self, name: str) -> None:
+        with self._lock:
+            records = self._records.pop(name, [])
+        for record in records:
+            self._log.handle(record)
+
+
+def run_per_package(func, packages: list[Path], jobs: int, depends: dict[str, list[str]] | None = None,
+                    **kwargs) -> list:
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    by_name = {path.name: path for path in packages}
+    depends = {name: [required for required in (depends or {}).get(name, ()) if required in by_name]
+               for name in by_name}
+    if jobs <= 1 or len(packages) <= 1:
+        results = {name: func(by_name[name], **kwargs) for name in topological_order(depends)}
+        return [results[path.name] for path in packages]
+
+    waiting, dependents = _dependents(depends)
+    ready = sorted(name for name, count in waiting.items() if count == 0)
+    results = {}
+    errors = []
+    completed = set()
+    flushed = 0
+    with PackageLogBuffer(LOGGER) as buffer, ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while ready or running:
+            if not errors:
+                for name in ready:
+                    running[executor.submit(buffer.run, name, func, by_name[name], **kwargs)] = name
+            ready = []
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=running.get):
+                name = running.pop(future)
+                completed.add(name)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                for dependent in dependents.get(name, ()):
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        ready.append(dependent)
+            ready.sort()
+            while flushed < len(packages) and (packages[flushed].name in completed
+                                               or errors and packages[flushed].name not in running.values()):
+                buffer.flush(packages[flushed].name)
+                flushed += 1
+
+    if errors:
+        raise errors[0]
+    return [results[path.name] for path in packages]
 
-    if not dry_run:
-        dst.symlink_to(src)
-    LOGGER.info("Linked: %s <- %s", src, dst)
-    return
+
+@recording(LOGGER)
+def plan_entry(path_conf: PathConfig, snapshot: FileSnapshot | None = None) -> list[Operation]:
+    dst = path_conf.dst
+    state = (snapshot or FileSnapshot()).get(dst)
+    if state.missing:
+        LOGGER.debug("%s is not found.", dst)
+        return [Operation(LINK, path_conf)]
+
+    if state.is_symlink:
+        if state.target == str(path_conf.src):
+            LOGGER.debug("%s is already linked.", dst)
+            return []
+        LOGGER.debug("%s is a symbolic link to elsewhere.", dst)
+        return [Operation(UNLINK, path_conf), Operation(LINK, path_conf)]
+
+    if state.is_file or state.is_dir:
+        return [Operation(BACKUP, path_conf), Operation(DELETE, path_conf), Operation(LINK, path_conf)]
+
+    LOGGER.error("%s is neither a file, a directory nor a symbolic link.", dst)
+    raise RuntimeError("%s is invalid." % dst)
+
+
+def link_target(path: Path, target: str) -> Path:
+    return Path(os.path.normpath(path.parent / target))
+
+
+def scan_dst_dir(path: Path) -> dict[str, tuple[str, str | None]]:
+    children = {}
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_symlink():
+                children[entry.name] = (LINK, os.readlink(entry.path))
+            elif entry.is_dir(follow_symlinks=False):
+                children[entry.name] = (DIR_KIND, None)
+            else:
+                children[entry.name] = (FILE_KIND, None)
+    return children
+
+
+def _plan_node(src: Path, dst: Path, src_is_dir: bool, kind: str | None, target: str | None,
+               operations: list[Operation], reserved: frozenset[str], keep: frozenset[str], ) -> None:
+    conf = PathConfig(src, dst)
+    kept = src_is_dir and bool(keep) and normalize_dst(dst) in keep
+    if kind is None and kept:
+        LOGGER.debug("%s is not found but holds other destinations.", dst)
+        _plan_children(src, dst, {}, operations, reserved, keep)
+    elif kind is None:
+        LOGGER.debug("%s is not found.", dst)
+        operations.append(Operation(LINK, conf))
+    elif kind == LINK and target == str(src) and not kept:
+        LOGGER.debug("%s is already linked.", dst)
+    elif kind == LINK and src_is_dir and link_target(dst, target).is_dir():
+        LOGGER.debug("%s is a symbolic link to a directory.", dst)
+        other = link_target(dst, target)
+        operations.append(Operation(UNFOLD, conf))
+        _plan_children(src, dst, {name: (LINK, str(other / name)) for name in os.listdir(other)}, operations,
+                       reserved, keep)
+    elif kind == LINK:
+        LOGGER.debug("%s is a symbolic link to elsewhere.", dst)
+        operations += [Operation(UNLINK, conf), Operation(LINK, conf)]
+    elif kind == DIR_KIND and src_is_dir:
+        children = scan_dst_dir(dst)
+        if not kept and children and all(
+                kind == LINK and target == str(src / name) for name, (kind, target) in children.items()):
+            LOGGER.debug("%s only holds links to %s.", dst, src)
+            operations += [Operation(DELETE, conf), Operation(LINK, conf)]
+        else:
+            _plan_children(src, dst, children, operations, reserved, keep)
+    else:
+        operations += [Operation(BACKUP, conf), Operation(DELETE, conf), Operation(LINK, conf)]
+
+
+def _plan_children(src: Path, dst: Path, children: dict[str, tuple[str, str | None]],
+                   operations: list[Operation], reserved: frozenset[str], keep: frozenset[str], ) -> None:
+    with os.scandir(src) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if reserved and normalize_dst(dst / entry.name) in reserved:
+            LOGGER.debug("%s is another destination.", dst / entry.name)
+            continue
+        kind, target = children.get(entry.name, (None, None))
+        _plan_node(Path(entry.path), dst / entry.name, entry.is_dir(), kind, target, operations, reserved, keep)
+
+    names = {entry.name for entry in entries}
+    for name, (kind, target) in sorted(children.items()):
+        if kind == LINK and name not in names and link_target(dst / name, target).parent == src:
+            LOGGER.debug("%s is a link to a removed file.", dst / name)
+            operations.append(Operation(PRUNE, PathConfig(src / name, dst / name)))
 
 
 @recording(LOGGER)
-def main_install(package_base: Path, home_dir: Path, is_dry_run: bool) -> None:
+def plan_tree(path_conf: PathConfig, snapshot: FileSnapshot | None = None,
+              reserved: frozenset[str] = frozenset(), ) -> list[Operation]:
+    if snapshot is None:
+        snapshot = FileSnapshot()
+    root = normalize_dst(path_conf.dst)
+    keep = set()
+    for path in reserved:
+        while (path := os.path.dirname(path)) != root and path.startswith(root):
+            keep.add(path)
+        keep.add(root)
+    src = path_conf.src
+    dst = path_conf.dst
+    if not snapshot.get(src, follow_symlinks=True).is_dir:
+        return plan_entry(PathConfig(src, dst), snapshot)
+
+    state = snapshot.get(dst)
+    if state.missing:
+        kind = None
+    elif state.is_symlink:
+        kind = LINK
+    elif state.is_dir:
+        kind = DIR_KIND
+    elif state.is_file:
+        kind = FILE_KIND
+    else:
+        LOGGER.error("%s is neither a file, a directory nor a symbolic link.", dst)
+        raise RuntimeError("%s is invalid." % dst)
+
+    operations = []
+    _plan_node(src, dst, True, kind, state.target, operations, reserved, frozenset(keep))
+    return operations
+
+
+@recording(LOGGER, compact=True)
+def plan_package(package_path: Path, home_dir: Path, cache: ConfigCache | None = None,
+                 backup_format: str = BACKUP_COPY, snapshot: FileSnapshot | None = None,
+                 dst_index: DestinationIndex | None = None, renders: dict[str, Rendered] | None = None,
+                 ) -> PackagePlan:
+    if cache is not None:
+        confs = cache.configs(package_path, home_dir)
+        _, digest = cache.load(package_path / "path.json")
+    else:
+        digest = hash_file(package_path / "path.json")
+        confs = load_check_convert_json(package_path, home_dir)
+
+    if snapshot is None:
+        snapshot = FileSnapshot()
+    if renders is None and any(conf.mode == MODE_TEMPLATE for conf in confs):
+        renders = render_packages(package_path.parent, [package_path], home_dir, cache or ConfigCache())
+    operations = []
+    contents = {}
+    for conf in confs:
+        if conf.mode == MODE_FILES:
+            reserved = dst_index.reserved(conf.dst) if dst_index is not None else frozenset()
+            operations += plan_tree(conf, snapshot, reserved)
+        elif conf.mode == MODE_TEMPLATE:
+            rendered = renders[str(conf.dst)]
+            operations += plan_render(conf, rendered, snapshot)
+            if rendered.content is not None:
+                contents[str(conf.dst)] = rendered.content
+        else:
+            operations += plan_entry(conf, snapshot)
+    operations.sort(key=lambda op: ACTIONS.index(op.action))
+    return PackagePlan(
+        name=package_path.name,
+        backup_dir=home_dir / ".dotbackup" / package_path.name,
+        operations=operations,
+        state=package_state(package_path, digest, confs),
+        backup_format=backup_format,
+        renders=contents,
+    )
+
+
+def format_plan(plan: PackagePlan) -> list[str]:
+    if not plan.operations:
+        return [f"{plan.name}: up to date"]
+
+    lines = [f"{plan.name}:"]
+    roots = backup_roots(plan.state)
+    for op in plan.operations:
+        if op.action == BACKUP and plan.backup_format == BACKUP_STORE:
+            lines.append(f"  {op.action:<7} {op.conf.dst} -> {plan.store_dir}")
+        elif op.action == BACKUP and plan.backup_format in BACKUP_ARCHIVES:
+            lines.append(f"  {op.action:<7} {op.conf.dst} -> {plan.backup_dir / ('*.' + plan.backup_format)}")
+        elif op.action == BACKUP:
+            lines.append(f"  {op.action:<7} {op.conf.dst} -> {plan.backup_dir / backup_name(op.conf.dst, roots)}")
+        elif op.action == LINK:
+            lines.append(f"  {op.action:<7} {op.conf.src} <- {op.conf.dst}")
+        elif op.action in (RENDER, RESTORE):
+            lines.append(f"  {op.action:<7} {op.conf.src} -> {op.conf.dst}")
+        else:
+            lines.append(f"  {op.action:<7} {op.conf.dst}")
+    if plan.actions(BACKUP) and plan.backup_format == BACKUP_STORE:
+        lines.append(f"  {'write':<7} {plan.store_dir / 'generations' / plan.name}")
+    elif plan.backup_format in BACKUP_ARCHIVES:
+        pass
+    elif plan.actions(BACKUP) or plan.actions(RESTORE):
+        lines.append(f"  {'write':<7} {plan.backup_dir / 'path.json'}")
+    return lines
+
+
+@recording(LOGGER, compact=True)
+def apply_plan(plan: PackagePlan, trash: Trash | None = None, snapshot: FileSnapshot | None = None,
+               journal: Journal | None = None, ) -> None:
+    if snapshot is None:
+        snapshot = FileSnapshot()
+
+    def pending(action: str) -> list[Operation]:
+        return [op for op in plan.actions(action) if journal is None or not journal.is_done(op)]
+
+    LOGGER.info("Back upping old dotfiles...")
+    backups = [op.conf for op in plan.actions(BACKUP)]
+    roots = backup_roots(plan.state)
+    with PROFILER.span(f"{plan.name}:backup", "phase", files=0, bytes=0) as phase:
+        if plan.backup_format == BACKUP_STORE:
+            ops = pending(BACKUP)
+            if ops:
+                generation = backup_to_store([op.conf for op in ops], plan.store_dir, plan.name, snapshot)
+                if journal is not None:
+                    for op in ops:
+                        journal.record(op, generation=str(generation) if generation is not None else None)
+                if generation is not None:
+                    entries = json.loads(generation.read_text())["entries"]
+                    phase["files"] = sum(1 for e in iter_stored(entries))
+                    phase["bytes"] = sum(e["stored"] for e in iter_stored(entries))
+            LOGGER.info("...done")
+        elif plan.backup_format in BACKUP_ARCHIVES:
+            ops = pending(BACKUP)
+            if ops:
+                archive = backup_to_archive([op.conf for op in ops], plan.backup_dir, plan.backup_format, snapshot,
+                                            roots=roots)
+                if journal is not None:
+                    for op in ops:
+                        journal.record(op, archive=str(archive) if archive is not None else None)
+                if archive is not None:
+                    phase["files"] = len(json.loads(index_path(archive).read_text())["members"])
+                    phase["bytes"] = archive.stat().st_size
+            LOGGER.info("...done")
+        else:
+            for op in pending(BACKUP):
+                conf = op.conf
+                with PROFILER.span(str(conf.dst), "entry") as entry:
+                    name = backup_name(conf.dst, roots)
+                    stats = backup_dst(dst=conf.dst, backup_dir=plan.backup_dir, dry_run=False,
+                                       state=snapshot.get(conf.dst), name=name)
+                    snapshot.invalidate(plan.backup_dir / name)
+                    entry.update(files=stats.files, bytes=stats.bytes)
+                if journal is not None:
+                    journal.record(op)
+                phase["files"] += stats.files
+                phase["bytes"] += stats.bytes
+            LOGGER.info("...done")
+
+            LOGGER.info("Generating backup json.path...")
+            json_bk = generate_backup_json(backups, plan.backup_dir, snapshot, roots) if backups else None
+            write_backup_json(json_bk=json_bk, backup_dir=plan.backup_dir, dry_run=False)
+            LOGGER.info("...done")
+    if journal is not None:
+        journal.sync()
+
+    LOGGER.info("Replacing old dotfiles with links...")
+    with PROFILER.span(f"{plan.name}:link", "phase", files=0) as phase:
+        for op in pending(UNFOLD):
+            unfold_link(op.conf, snapshot)
+            if journal is not None:
+                journal.record(op)
+        for op in pending(LINK):
+            with PROFILER.span(str(op.conf.dst), "entry", files=1):
+                swap_link(op.conf, trash, snapshot)
+            if journal is not None:
+                journal.record(op)
+            phase["files"] += 1
+        ops = pending(RENDER)
+        if ops and any(str(op.conf.dst) not in plan.renders for op in ops):
+            home_dir = plan.backup_dir.parent.parent
+            variables = host_vars(Path(plan.state["path"]).parent, home_dir)
+            plan = replace(plan, renders={str(op.conf.dst): render_template(op.conf.src, variables) for op in ops})
+        for op in ops:
+            with PROFILER.span(str(op.conf.dst), "entry", files=1):
+                write_rendered(op.conf, plan.renders[str(op.conf.dst)], trash, snapshot)
+            if journal is not None:
+                journal.record(op)
+            phase["files"] += 1
+        for op in pending(PRUNE):
+            prune_link(op.conf)
+            if journal is not None:
+                journal.record(op)
+    LOGGER.info("...done.")
+
+
+@recording(LOGGER, compact=True)
+def install_package(package_path: Path, home_dir: Path, is_dry_run: bool,
+                    cache: ConfigCache | None = None, backup_format: str = BACKUP_COPY,
+                    trash: Trash | None = None, snapshot: FileSnapshot | None = None,
+                    journal_dir: Path | None = None, dst_index: DestinationIndex | None = None,
+                    renders: dict[str, Rendered] | None = None, ) -> PackagePlan:
+    if snapshot is None:
+        snapshot = FileSnapshot()
+    LOGGER.info("Start process for %s", package_path.name)
+
+    journal_path = journal_dir / f"{package_path.name}.jsonl" if journal_dir is not None else None
+    journal = Journal.load(journal_path) if journal_path is not None else None
+    if journal is not None:
+        with PROFILER.span(package_path.name, "package"):
+            plan = resume_package(journal, is_dry_run, trash, snapshot)
+        LOGGER.info("End process for %s", package_path.name)
+        return plan
+
+    with PROFILER.span(package_path.name, "package"):
+        LOGGER.info("Planning...")
+        with PROFILER.span(f"{package_path.name}:plan", "phase"):
+            plan = plan_package(package_path, home_dir, cache, backup_format, snapshot, dst_index, renders)
+        LOGGER.info("...done")
+
+        if not plan.operations:
+            LOGGER.info("%s is up to date.", package_path.name)
+        elif not is_dry_run and journal_path is None:
+            apply_plan(plan, trash, snapshot)
+        elif not is_dry_run:
+            journal = Journal(journal_path)
+            journal.begin(plan, snapshot)
+            try:
+                apply_plan(plan, trash, snapshot, journal)
+            finally:
+                journal.close()
+            journal.commit()
+
+    LOGGER.info("End process for %s", package_path.name)
+    return plan
+
+
+def resume_package(journal: Journal, is_dry_run: bool, trash: Trash | None = None,
+                   snapshot: FileSnapshot | None = None, ) -> PackagePlan:
+    plan = journal.plan
+    remaining = journal.remaining()
+    LOGGER.info("%s was interrupted with %d of %d operations left.", journal.path, len(remaining),
+                len(plan.operations))
+    if is_dry_run:
+        return replace(plan, operations=remaining)
+
+    LOGGER.info("Resuming...")
+    journal.resume()
+    try:
+        apply_plan(plan, trash, snapshot, journal)
+    finally:
+        journal.close()
+    journal.commit()
+    LOGGER.info("...done")
+    return plan
+
+
+@recording(LOGGER)
+def main_install(package_base: Path, home_dir: Path, is_dry_run: bool, jobs: int = 1,
+                 backup_format: str = BACKUP_COPY, cache: ConfigCache | None = None,
+                 trash: Trash | None = None, packages: list[Path] | None = None,
+                 dst_index: DestinationIndex | None = None, ) -> None:
+    journal_dir = home_dir / ".dotbackup" / JOURNAL_DIR
+    if packages is None:
+        packages = sorted(iter_package(package_base))
+        names = {path.name for path in packages}
+        for path in sorted(journal_dir.glob("*.jsonl")):
+            if path.stem not in names:
+                LOGGER.warning("%s is left by an interrupted install of a removed package. Run with --rollback.",
+                               path)
+    if cache is None:
+        cache = ConfigCache.open(home_dir / ".dotbackup" / CONFIG_CACHE_FILE)
+    if dst_index is None:
+        dst_index = build_dst_index(package_base, home_dir, cache)
+    if trash is not None and not is_dry_run:
+        trash.purge()
+    with PROFILER.span("render", "phase"):
+        renders = render_packages(package_base, packages, home_dir, cache)
+    plans = run_per_package(install_package, packages, jobs, depends=dst_index.depends(), home_dir=home_dir,
+                            is_dry_run=is_dry_run, cache=cache, backup_format=backup_format, trash=trash,
+                            snapshot=FileSnapshot(), journal_dir=journal_dir, dst_index=dst_index,
+                            renders=renders, )
+    cache.save(is_dry_run)
     if is_dry_run:
-        LOGGER.warning("Notice that generation of path.json will skipped in dry run.")
-        LOGGER.warning("In other words, the operation will not be informed even if path.json will actually be created.")
+        for plan in plans:
+            print("\n".join(format_plan(plan)))
+
+
+class InotifyWatcher:
+    def __init__(self, package_base: Path):
+        import ctypes
+
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self._names: dict[int, str] = {}
+        self._sources: dict[Path, int] = {}
+        self._add(package_base, "")
+        for path in iter_package(package_base):
+            self._add(path, path.name)
+        self._base = package_base
+
+    def _add(self, path: Path, name: str) -> int:
+        import ctypes
+
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), INOTIFY_MASK)
+        if wd < 0:
+            e = ctypes.get_errno()
+            LOGGER.warning("Failed to watch %s: %s", path, os.strerror(e))
+            return wd
+        self._names[wd] = name
+        return wd
+
+    def watch(self, sources: dict[str, list[PathConfig]]) -> None:
+        dirs = {}
+        for name, confs in sources.items():
+            for conf in confs:
+                if conf.mode == MODE_FILES:
+                    dirs.update((Path(root), name) for root, _, _ in os.walk(conf.src))
+                else:
+                    dirs[conf.src.parent] = name
+            dirs.pop(self._base / name, None)
+
+        for path in self._sources.keys() - dirs.keys():
+            self._libc.inotify_rm_watch(self._fd, self._sources.pop(path))
+        for path, name in dirs.items():
+            if (wd := self._add(path, name)) >= 0:
+                self._sources[path] = wd
+
+    def poll(self, timeout: float) -> set[str]:
+        import select
+        import struct
+
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, INOTIFY_BUFFER)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = struct.unpack_from(INOTIFY_EVENT, data, offset)
+                offset += struct.calcsize(INOTIFY_EVENT)
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_IGNORED:
+                    self._names.pop(wd, None)
+                    continue
+                package = self._names.get(wd)
+                if package is None:
+                    continue
+                if package:
+                    changed.add(package)
+                elif name and not name.startswith((".", "_")):
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        self._add(self._base / name, name)
+                    changed.add(name)
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    def __init__(self, package_base: Path, interval: float = WATCH_INTERVAL):
+        self._base = package_base
+        self.interval = interval
+        self._sources: dict[str, list[PathConfig]] = {}
+        self._signatures = self._scan()
+
+    def watch(self, sources: dict[str, list[PathConfig]]) -> None:
+        self._sources = sources
+        self._signatures = {name: (package, self._stat_sources(name))
+                            for name, (package, _) in self._signatures.items()}
+
+    def _scan(self) -> dict[str, tuple]:
+        signatures = {}
+        for path in iter_package(self._base):
+            try:
+                st = os.stat(path / "path.json")
+                package = (os.stat(path).st_mtime_ns, st.st_mtime_ns, st.st_size, st.st_ino)
+            except FileNotFoundError:
+                package = None
+            signatures[path.name] = (package, self._stat_sources(path.name))
+        return signatures
+
+    def _stat_sources(self, name: str) -> tuple:
+        return tuple(map(self._stat_source, self._sources.get(name, ())))
+
+    @staticmethod
+    def _stat_source(conf: PathConfig) -> tuple | None:
+        if conf.mode == MODE_FILES:
+            return tuple(os.stat(root).st_mtime_ns for root, _, _ in os.walk(conf.src))
+        try:
+            st = os.stat(conf.src)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def poll(self, timeout: float) -> set[str]:
+        time.sleep(min(timeout, self.interval))
+        signatures = self._scan()
+        changed = {name for name in signatures.keys() | self._signatures.keys()
+                   if signatures.get(name, False) != self._signatures.get(name, False)}
+        self._signatures = signatures
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+def open_watcher(package_base: Path) -> "InotifyWatcher | PollingWatcher":
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(package_base)
+        except (OSError, AttributeError) as e:
+            LOGGER.warning("inotify is not available (%s). Polling %s instead.", e, package_base)
+    return PollingWatcher(package_base)
+
+
+def watched_sources(package_base: Path, home_dir: Path, cache: ConfigCache) -> dict[str, list[PathConfig]]:
+    sources = {}
     for path in iter_package(package_base):
-        LOGGER.info("Start process for %s", path.name)
+        if not (path / "path.json").exists():
+            continue
+        try:
+            confs = cache.configs(path, home_dir)
+        except (OSError, ValueError, TypeError, KeyError):
+            continue
+        sources[path.name] = [conf for conf in confs if conf.mode in (MODE_FILES, MODE_TEMPLATE)]
+    return sources
 
-        LOGGER.info("Loading path.json...")
-        confs = load_check_convert_json(path, home_dir)
-        LOGGER.info("...done")
 
-        LOGGER.info("Back upping old dotfiles...")
-        backup_dir = home_dir / ".dotbackup" / path.name
-        for conf in confs:
-            backup_dst(dst=conf.dst, backup_dir=backup_dir, dry_run=is_dry_run)
-        LOGGER.info("...done")
+def wait_changes(watcher, debounce: float, stop: threading.Event, max_delay: float = WATCH_MAX_DELAY) -> set[str]:
+    changed = set()
+    while not changed and not stop.is_set():
+        changed |= watcher.poll(WATCH_INTERVAL)
 
-        LOGGER.info("Generating backup json.path...")
-        json_bk = generate_backup_json(confs, backup_dir)
-        write_backup_json(json_bk=json_bk, backup_dir=backup_dir, dry_run=is_dry_run)
-        LOGGER.info("...done")
+    deadline = time.monotonic() + max_delay
+    while not stop.is_set() and (left := deadline - time.monotonic()) > 0:
+        more = watcher.poll(min(debounce, left))
+        if not more:
+            break
+        changed |= more
+    return changed
 
-        LOGGER.info("Cleaning up old dotfiles...")
-        for conf in confs:
-            cleanup_dst(dst=conf.dst, dry_run=is_dry_run)
-        LOGGER.info("...done")
 
-        LOGGER.info("Linking to new dotfiles...")
-        for conf in confs:
-            link_dst_to_src(path_conf=conf, dry_run=is_dry_run)
-        LOGGER.info("...done.")
+@recording(LOGGER)
+def main_watch(package_base: Path, home_dir: Path, jobs: int = 1, backup_format: str = BACKUP_COPY,
+               cache: ConfigCache | None = None, trash: Trash | None = None, debounce: float = WATCH_DEBOUNCE,
+               stop: threading.Event | None = None, watcher=None, ) -> None:
+    if stop is None:
+        stop = threading.Event()
+    if cache is None:
+        cache = ConfigCache.open(home_dir / ".dotbackup" / CONFIG_CACHE_FILE)
+    if watcher is None:
+        watcher = open_watcher(package_base)
+
+    try:
+        main_install(package_base, home_dir, False, jobs, backup_format, cache, trash)
+        watcher.watch(watched_sources(package_base, home_dir, cache))
+        LOGGER.info("Watching %s...", package_base)
+        while not stop.is_set():
+            changed = wait_changes(watcher, debounce, stop)
+            packages = [path for path in sorted(iter_package(package_base)) if path.name in changed]
+            for name in sorted(changed - {path.name for path in packages}):
+                LOGGER.info("%s is removed. Its links are left as they are.", name)
+            if not packages or stop.is_set():
+                continue
+
+            LOGGER.info("Changed: %s", ", ".join(path.name for path in packages))
+            try:
+                dst_index = build_dst_index(package_base, home_dir, cache, skip_broken=True)
+            except RuntimeError as e:
+                LOGGER.error("Nothing is installed: %s", e)
+                continue
+            order = {name: i for i, name in enumerate(topological_order(dst_index.depends()))}
+            for path in sorted(packages, key=lambda path: order.get(path.name, len(order))):
+                if not (path / "path.json").exists():
+                    LOGGER.info("%s has no path.json yet.", path.name)
+                    continue
+                try:
+                    main_install(package_base, home_dir, False, jobs, backup_format, cache, trash, [path], dst_index)
+                except Exception as e:
+                    LOGGER.error("Failed to install %s: %r", path.name, e)
+            watcher.watch(watched_sources(package_base, home_dir, cache))
+    except KeyboardInterrupt:
+        LOGGER.info("Stopped watching %s.", package_base)
+    finally:
+        watcher.close()
+
+
+def link_status(path_conf: PathConfig, reserved: frozenset[str] = frozenset(),
+                rendered: Rendered | None = None, ) -> dict[str, json_type]:
+    dst = path_conf.dst
+    res = {"src": str(path_conf.src), "dst": str(dst)}
+    if path_conf.mode == MODE_FILES:
+        operations = plan_tree(path_conf, reserved=reserved)
+        if not operations:
+            return {**res, "status": LINKED}
+        first = operations[0].conf
+        status = BROKEN_LINK if operations[0].action == PRUNE else link_status(
+            PathConfig(first.src, first.dst))["status"]
+        return {**res, "status": status, "path": str(first.dst), "pending": len(operations)}
+
+    state = read_file_state(dst)
+    if state.missing:
+        return {**res, "status": MISSING}
+
+    if path_conf.mode == MODE_TEMPLATE and not state.is_symlink:
+        return {**res, "status": LINKED if rendered is not None and rendered.content is None else SHADOWED}
+    if not state.is_symlink:
+        return {**res, "status": SHADOWED}
+
+    target = state.target
+    if target == str(path_conf.src):
+        return {**res, "status": LINKED, "target": target}
+    if not os.path.exists(dst):
+        return {**res, "status": BROKEN_LINK, "target": target}
+    return {**res, "status": WRONG_LINK, "target": target}
+
+
+@recording(LOGGER, compact=True)
+def main_status(package_base: Path, home_dir: Path, jobs: int = 1,
+                cache: ConfigCache | None = None, dst_index: DestinationIndex | None = None, ) -> dict[str, json_type]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    if cache is None:
+        cache = ConfigCache.open(home_dir / ".dotbackup" / CONFIG_CACHE_FILE)
+    if dst_index is None:
+        dst_index = build_dst_index(package_base, home_dir, cache)
+    packages = sorted(iter_package(package_base))
+    confs = []
+    for path in packages:
+        confs.extend((path.name, conf) for conf in cache.configs(path, home_dir))
+    renders = render_packages(package_base, packages, home_dir, cache)
+
+    if jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            statuses = list(executor.map(link_status, [conf for _, conf in confs],
+                                         [dst_index.reserved(conf.dst) for _, conf in confs],
+                                         [renders.get(str(conf.dst)) for _, conf in confs]))
+    else:
+        statuses = [link_status(conf, dst_index.reserved(conf.dst), renders.get(str(conf.dst))) for _, conf in confs]
+
+    report = {"packages": {path.name: [] for path in packages}, "summary": {status: 0 for status in STATUSES}}
+    for (name, _), status in zip(confs, statuses):
+        report["packages"][name].append(status)
+        report["summary"][status["status"]] += 1
+    return report
+
+
+def format_status(report: dict[str, json_type]) -> list[str]:
+    lines = []
+    for name, statuses in report["packages"].items():
+        for status in statuses:
+            line = f"{status['status']:<11} {name}: {status['dst']}"
+            if "pending" in status:
+                line += f" ({status['pending']} operations left, first at {status['path']})"
+            elif status["status"] in (WRONG_LINK, BROKEN_LINK):
+                line += f" -> {status['target']}"
+            lines.append(line)
+    lines.append(", ".join(f"{count} {status}" for status, count in report["summary"].items()))
+    return lines
+
+
+def move_path(src: Path, dst: Path) -> None:
+    import shutil
+
+    try:
+        os.rename(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    LOGGER.debug("%s and %s are on different filesystems.", src, dst)
+    if src.is_dir():
+        copy_tree(src, dst)
+        shutil.rmtree(src)
+    else:
+        copy_file(src, dst)
+        src.unlink()
+
+
+def restore_sources(backup_dir: Path, package_name: str) -> dict[str, json_type]:
+    sources = {}
+    json_path = backup_dir / "path.json"
+    if json_path.exists():
+        for entry in normalize_json(json.loads(json_path.read_text())):
+            sources[entry["dst"]] = {"format": BACKUP_COPY, "src": str(backup_dir / entry["src"])}
+    for archive in list_archives(backup_dir):
+        index = json.loads(index_path(archive).read_text())
+        for entry in index["entries"]:
+            sources[entry["dst"]] = {"format": index["format"], "src": str(archive / entry["src"]),
+                                     "archive": str(archive), "name": entry["src"]}
+    for generation in list_generations(backup_dir.parent / STORE_DIR, package_name):
+        for entry in json.loads(generation.read_text())["entries"]:
+            sources[entry["dst"]] = {"format": BACKUP_STORE, "src": str(generation), "entry": entry}
+    return sources
+
+
+@recording(LOGGER, compact=True)
+def plan_restore(package_path: Path, home_dir: Path) -> PackagePlan:
+    backup_dir = home_dir / ".dotbackup" / package_path.name
+    sources = restore_sources(backup_dir, package_path.name)
+    if not sources:
+        LOGGER.info("No backup of %s is found.", package_path.name)
+        return PackagePlan(name=package_path.name, backup_dir=backup_dir, operations=[], state={})
+
+    unlinks = []
+    restores = []
+    for dst, source in sources.items():
+        conf = PathConfig(src=Path(source["src"]), dst=Path(dst))
+        if source["format"] == BACKUP_COPY and not os.path.lexists(conf.src):
+            LOGGER.warning("%s is not found. %s will not be restored.", conf.src, conf.dst)
+            continue
+        try:
+            st = os.lstat(conf.dst)
+        except FileNotFoundError:
+            restores.append(Operation(RESTORE, conf))
+            continue
+        if stat.S_ISLNK(st.st_mode):
+            unlinks.append(Operation(UNLINK, conf))
+            restores.append(Operation(RESTORE, conf))
+            continue
+        LOGGER.warning("%s already exists and is not a symbolic link. It will not be restored.", conf.dst)
+
+    formats = [source["format"] for source in sources.values()]
+    return PackagePlan(name=package_path.name, backup_dir=backup_dir, operations=unlinks + restores,
+                       state={"sources": sources}, backup_format=BACKUP_COPY if BACKUP_COPY in formats else formats[-1])
+
+
+def remove_path(path: Path) -> None:
+    import shutil
+
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        path.unlink()
+
+
+@recording(LOGGER, compact=True)
+def restore_entry(path_conf: PathConfig, source: dict[str, json_type], store_dir: Path, unlink: bool) -> None:
+    if source["format"] in BACKUP_ARCHIVES:
+        archive = Path(source["archive"])
+        if not archived_members(json.loads(index_path(archive).read_text()), source["name"]):
+            LOGGER.error("%s is not found in %s.", source["name"], archive)
+            raise KeyError(source["name"])
+    elif source["format"] == BACKUP_STORE:
+        for digest in iter_objects([source["entry"]]):
+            if not object_path(store_dir, digest).exists():
+                LOGGER.error("%s is not found.", object_path(store_dir, digest))
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(object_path(store_dir, digest)))
+    elif not os.path.lexists(path_conf.src):
+        LOGGER.error("%s is not found.", path_conf.src)
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(path_conf.src))
+
+    target = os.readlink(path_conf.dst) if unlink else None
+    if unlink:
+        path_conf.dst.unlink()
+        LOGGER.info("Unlinked: %s", path_conf.dst)
+    try:
+        path_conf.dst.parent.mkdir(parents=True, exist_ok=True)
+        if source["format"] in BACKUP_ARCHIVES:
+            extract_archived(Path(source["archive"]), source["name"], path_conf.dst)
+        elif source["format"] == BACKUP_STORE:
+            extract_stored(source["entry"], path_conf.dst, store_dir)
+        else:
+            move_path(path_conf.src, path_conf.dst)
+    except BaseException:
+        if target is not None:
+            remove_path(path_conf.dst)
+            path_conf.dst.symlink_to(target)
+            LOGGER.info("Linked again: %s -> %s", path_conf.dst, target)
+        raise
+    LOGGER.info("Restored: %s -> %s", path_conf.src, path_conf.dst)
+
+
+@recording(LOGGER, compact=True)
+def apply_restore(plan: PackagePlan) -> PackagePlan:
+    sources = plan.state["sources"]
+    unlinks = {str(op.conf.dst) for op in plan.actions(UNLINK)}
+    LOGGER.info("Restoring old dotfiles...")
+    restored = set()
+    for op in plan.actions(RESTORE):
+        source = sources[str(op.conf.dst)]
+        try:
+            with PROFILER.span(str(op.conf.dst), "entry"):
+                restore_entry(op.conf, source, plan.store_dir, str(op.conf.dst) in unlinks)
+        except (OSError, KeyError) as e:
+            LOGGER.error("%s is not restored: %r", op.conf.dst, e)
+            continue
+        restored.add(str(op.conf.dst))
+        if source["format"] == BACKUP_COPY:
+            prune_backup_dirs(op.conf.src, plan.backup_dir)
+            forget_backups(plan.backup_dir, {str(op.conf.dst)})
+    LOGGER.info("...done")
+    return replace(plan, operations=[op for op in plan.operations if str(op.conf.dst) in restored])
 
-        LOGGER.info("End process for %s", path.name)
+
+def prune_backup_dirs(path: Path, backup_dir: Path) -> None:
+    for parent in path.parents:
+        if parent == backup_dir or not parent.is_relative_to(backup_dir):
+            return
+        try:
+            parent.rmdir()
+        except OSError:
+            return
+
+
+def forget_backups(backup_dir: Path, restored: set[str]) -> None:
+    json_path = backup_dir / "path.json"
+    remains = [entry for entry in json.loads(json_path.read_text()) if entry["dst"] not in restored]
+    if remains:
+        json_path.write_text(json.dumps(remains))
+        LOGGER.info("Updated: %s", json_path)
+    else:
+        json_path.unlink()
+        LOGGER.info("Deleted: %s", json_path)
+        if not any(backup_dir.iterdir()):
+            backup_dir.rmdir()
 
 
 @recording(LOGGER)
-def main_restore(package_base: Path, home_dir: Path, is_dry_run: bool) -> None:
-    for path in iter_package(package_base):
-        LOGGER.info("Start process for %s", path.name)
+def restore_package(package_path: Path, home_dir: Path, is_dry_run: bool) -> PackagePlan:
+    LOGGER.info("Start process for %s", package_path.name)
 
-        LOGGER.info("Loading path.json...")
-        confs = load_check_convert_json(path, home_dir)
+    with PROFILER.span(package_path.name, "package"):
+        LOGGER.info("Planning...")
+        plan = plan_restore(package_path, home_dir)
         LOGGER.info("...done")
 
+        if plan.operations and not is_dry_run:
+            plan = apply_restore(plan)
+
+    LOGGER.info("End process for %s", package_path.name)
+    return plan
+
 
 @recording(LOGGER)
-def main(package_base: Path, home_dir: Path, is_restore: bool = False, is_dry_run: bool = False, ):
+def main_restore(package_base: Path, home_dir: Path, is_dry_run: bool, jobs: int = 1) -> None:
+    packages = sorted(iter_package(package_base))
+    plans = run_per_package(restore_package, packages, jobs, home_dir=home_dir, is_dry_run=is_dry_run)
     if is_dry_run:
-        handle = logging.StreamHandler(sys.stdout)
-        handle.setLevel(logging.INFO)
-        handle.setFormatter(logging.Formatter("DRY-RUN: %(message)s"))
-        LOGGER.addHandler(handle)
+        for plan in plans:
+            print("\n".join(format_plan(plan)) if plan.operations else f"{plan.name}: nothing to restore")
 
-    LOGGER.info("Checking each path.json...")
-    for path in iter_package(package_base):
-        json_path = path / "path.json"
-        json_obj = cache_load_json(json_path)
-        check_json(json_obj)
+
+def extract_stored(entry: dict[str, json_type], to: Path, store_dir: Path) -> None:
+    if entry["type"] == "file":
+        copy_file(object_path(store_dir, entry["object"]), to)
+        os.chmod(to, entry["mode"])
+        os.utime(to, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        return
+
+    to.mkdir(parents=True, exist_ok=True)
+    dirs = [(to, entry)]
+    for child in entry["tree"]:
+        path = to / child["path"]
+        if child["type"] == "symlink":
+            path.symlink_to(child["target"])
+        elif child["type"] == "dir":
+            path.mkdir(parents=True, exist_ok=True)
+            dirs.append((path, child))
+        else:
+            extract_stored(child, path, store_dir)
+    for path, child in reversed(dirs):
+        os.chmod(path, child["mode"])
+        os.utime(path, ns=(child["mtime_ns"], child["mtime_ns"]))
+
+
+@recording(LOGGER, compact=True)
+def plan_rollback(journal: Journal) -> PackagePlan:
+    plan = journal.plan
+    backups = {str(op.conf.dst): op for op in plan.actions(BACKUP)}
+    roots = backup_roots(plan.state)
+    sources = {}
+    manifests = {}
+    unlinks = []
+    restores = []
+    for op in reversed([op for op in plan.operations if op.action in (LINK, RENDER)]):
+        dst = op.conf.dst
+        if op.action == RENDER:
+            linked = (RENDER, str(dst)) in journal.done
+        else:
+            try:
+                linked = os.readlink(dst) == str(op.conf.src)
+            except OSError:
+                linked = False
+        if not linked:
+            LOGGER.debug("%s is not linked yet.", dst)
+            continue
+
+        if str(dst) in journal.targets:
+            restores.append(Operation(LINK, PathConfig(Path(journal.targets[str(dst)]), dst)))
+            continue
+        if str(dst) not in backups:
+            unlinks.append(Operation(UNLINK, op.conf))
+            continue
+        if plan.backup_format == BACKUP_STORE:
+            generation = journal.done.get((BACKUP, str(dst)), {}).get("generation")
+            if generation is None:
+                LOGGER.warning("%s has no stored backup. It will not be rolled back.", dst)
+                continue
+            if generation not in manifests:
+                manifests[generation] = {e["dst"]: e for e in json.loads(Path(generation).read_text())["entries"]}
+            sources[str(dst)] = {"format": BACKUP_STORE, "src": generation,
+                                 "entry": manifests[generation][str(dst.absolute())]}
+        elif plan.backup_format in BACKUP_ARCHIVES:
+            archive = journal.done.get((BACKUP, str(dst)), {}).get("archive")
+            if archive is None:
+                LOGGER.warning("%s has no archived backup. It will not be rolled back.", dst)
+                continue
+            name = backup_name(dst, roots)
+            sources[str(dst)] = {"format": plan.backup_format, "src": str(Path(archive) / name),
+                                 "archive": archive, "name": name}
+        else:
+            sources[str(dst)] = {"format": BACKUP_COPY, "src": str(plan.backup_dir / backup_name(dst, roots))}
+        unlinks.append(Operation(UNLINK, op.conf))
+        restores.append(Operation(RESTORE, PathConfig(Path(sources[str(dst)]["src"]), dst)))
+
+    return replace(plan, operations=unlinks + restores, state={**plan.state, "sources": sources})
+
+
+@recording(LOGGER, compact=True)
+def apply_rollback(plan: PackagePlan) -> None:
+    sources = plan.state["sources"]
+    LOGGER.info("Removing links...")
+    for op in plan.actions(UNLINK):
+        if str(op.conf.dst) in sources:
+            continue
+        op.conf.dst.unlink()
+        LOGGER.info("Unlinked: %s", op.conf.dst)
     LOGGER.info("...done")
 
-    if not is_restore:
-        main_install(package_base, home_dir, is_dry_run)
-    else:
-        main_restore(package_base, home_dir, is_dry_run)
+    LOGGER.info("Restoring old dotfiles...")
+    restored = set()
+    for op in plan.actions(RESTORE):
+        source = sources[str(op.conf.dst)]
+        restore_entry(op.conf, source, plan.store_dir, True)
+        if source["format"] == BACKUP_COPY:
+            prune_backup_dirs(op.conf.src, plan.backup_dir)
+            restored.add(str(op.conf.dst.parent.resolve() / op.conf.dst.name))
+    for op in plan.actions(LINK):
+        swap_link(op.conf)
+    LOGGER.info("...done")
+
+    if restored:
+        forget_backups(plan.backup_dir, restored)
+
+
+@recording(LOGGER)
+def main_rollback(home_dir: Path, is_dry_run: bool) -> None:
+    journal_dir = home_dir / ".dotbackup" / JOURNAL_DIR
+    rolled_back = set()
+    for path in sorted(journal_dir.glob("*.jsonl")):
+        journal = Journal.load(path)
+        if journal is None:
+            if not is_dry_run:
+                path.unlink()
+            continue
+
+        plan = plan_rollback(journal)
+        if is_dry_run:
+            print("\n".join(format_plan(plan)) if plan.operations else f"{plan.name}: nothing to roll back")
+            continue
+        apply_rollback(plan)
+        journal.commit()
+        rolled_back.add(plan.name)
+        LOGGER.info("Rolled back: %s", plan.name)
+
+    if not rolled_back:
+        LOGGER.info("Nothing to roll back.")
+
+
+def install_home(package_base: Path, home_dir: Path, is_restore: bool, is_dry_run: bool, jobs: int,
+                 backup_format: str, records: dict[str, json_type], ) -> dict[str, json_type]:
+    result = {"home": str(home_dir), "ok": True, "error": None, "output": ""}
+    start = time.perf_counter()
+    out = io.StringIO()
+    try:
+        with redirect_stdout(out):
+            if is_restore:
+                main_restore(package_base, home_dir, is_dry_run, jobs)
+            else:
+                trash = Trash(home_dir / ".dotbackup" / TRASH_DIR)
+                main_install(package_base, home_dir, is_dry_run, jobs, backup_format, ConfigCache(None, records), trash)
+    except Exception as e:
+        LOGGER.error("%s failed: %r", home_dir, e)
+        result.update(ok=False, error=f"{type(e).__name__}: {e}")
+    result.update(output=out.getvalue(), seconds=time.perf_counter() - start)
+    return result
+
+
+def read_homes(path: Path) -> list[Path]:
+    homes = []
+    for line in path.read_text().splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line:
+            homes.append(Path(line).expanduser())
+    return homes
+
+
+@recording(LOGGER)
+def main_fleet(package_base: Path, homes: list[Path], cache: ConfigCache, is_restore: bool = False,
+               is_dry_run: bool = False, jobs: int = 1, backup_format: str = BACKUP_COPY,
+               processes: int | None = None, log_queue=None, ) -> dict[str, json_type]:
+    from concurrent.futures import as_completed
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    homes = list(dict.fromkeys(home.absolute() for home in homes))
+    records = cache.records()
+    results = {}
+    initializer = (attach_log_queue, (log_queue, LOGGER.level)) if log_queue is not None else (None, ())
+    with ProcessPoolExecutor(max_workers=processes, initializer=initializer[0], initargs=initializer[1]) as executor:
+        futures = {executor.submit(install_home, package_base, home, is_restore, is_dry_run, jobs, backup_format,
+                                   records): home for home in homes}
+        for future in as_completed(futures):
+            home = futures[future]
+            try:
+                results[home] = future.result()
+            except Exception as e:
+                LOGGER.error("%s failed: %r", home, e)
+                results[home] = {"home": str(home), "ok": False, "error": f"{type(e).__name__}: {e}", "output": ""}
+            LOGGER.info("%s: %s", home, "done" if results[home]["ok"] else results[home]["error"])
+
+    targets = [results[home] for home in homes]
+    return {
+        "targets": targets,
+        "summary": {"ok": sum(t["ok"] for t in targets), "failed": sum(not t["ok"] for t in targets)},
+    }
+
+
+def format_fleet(report: dict[str, json_type]) -> list[str]:
+    lines = []
+    for target in report["targets"]:
+        if target["ok"]:
+            lines.append(f"{'ok':<7} {target['home']} ({target['seconds']:.2f}s)")
+        else:
+            lines.append(f"{'failed':<7} {target['home']}: {target['error']}")
+        lines += ["  " + line for line in target["output"].splitlines()]
+    summary = report["summary"]
+    lines.append(f"{summary['ok']} succeeded, {summary['failed']} failed")
+    return lines
+
+
+@recording(LOGGER)
+def main(package_base: Path, home_dir: Path, is_restore: bool = False, is_dry_run: bool = False, jobs: int = 1,
+         backup_format: str = BACKUP_COPY, prune: bool = False, keep: int = 5, keep_days: float | None = None,
+         profile: Path | None = None, status: bool = False, rollback: bool = False,
+         homes: list[Path] | None = None, processes: int | None = None, watch: bool = False,
+         debounce: float = WATCH_DEBOUNCE, log_queue=None, ):
+    if prune:
+        prune_store(home_dir / ".dotbackup" / STORE_DIR, keep, keep_days, is_dry_run)
+        return
+
+    if not status and not is_dry_run and not homes:
+        forget_fingerprint(home_dir)
+
+    if rollback:
+        main_rollback(home_dir, is_dry_run)
+        return
+
+    if profile is not None:
+        PROFILER.enable()
+
+    try:
+        fingerprint = take_fingerprint(package_base)
+        LOGGER.info("Checking each path.json...")
+        cache = ConfigCache() if homes else ConfigCache.open(home_dir / ".dotbackup" / CONFIG_CACHE_FILE)
+        with PROFILER.span("check", "phase"):
+            for path in iter_package(package_base):
+                with PROFILER.span(f"{path.name}:check", "phase"):
+                    cache.load(path / "path.json")
+            dst_index = build_dst_index(package_base, home_dir, cache) if not homes else None
+        LOGGER.info("...done")
+
+        if status:
+            report = main_status(package_base, home_dir, jobs, cache, dst_index)
+            cache.save(is_dry_run)
+            return report
+
+        if homes:
+            return main_fleet(package_base, homes, cache, is_restore, is_dry_run, jobs, backup_format, processes,
+                              log_queue)
+
+        with PROFILER.span("restore" if is_restore else "install", "phase"):
+            if not is_restore:
+                trash = Trash(home_dir / ".dotbackup" / TRASH_DIR)
+                if watch and not is_dry_run:
+                    main_watch(package_base, home_dir, jobs, backup_format, cache, trash, debounce)
+                else:
+                    main_install(package_base, home_dir, is_dry_run, jobs, backup_format, cache, trash,
+                                 dst_index=dst_index)
+                    if not is_dry_run:
+                        write_fingerprint(fingerprint, package_base, home_dir, cache)
+            else:
+                main_restore(package_base, home_dir, is_dry_run, jobs)
+    finally:
+        if profile is not None:
+            PROFILER.write(profile)
+            print("\n".join(PROFILER.summary()))
 
 
 if __name__ == '__main__':
+    from argparse import ArgumentParser
+
     parser = ArgumentParser()
     parser.add_argument("--restore", action="store_true", help="Restore dotfiles from backup.")
     parser.add_argument("--dry-run", action="store_true", help="Test run without actual file operations.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of packages processed concurrently.")
+    parser.add_argument("--backup-format", choices=BACKUP_FORMATS, default=BACKUP_COPY,
+                        help="How old dotfiles are backed up.")
+    parser.add_argument("--prune", action="store_true", help="Delete old generations from the backup store.")
+    parser.add_argument("--keep", type=int, default=5, help="Number of generations per package kept by --prune.")
+    parser.add_argument("--keep-days", type=float, default=None, help="Also keep generations newer than this by --prune.")
+    parser.add_argument("--rollback", action="store_true",
+                        help="Undo installs interrupted before they finished instead of installing.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and install packages again when their path.json, files source trees or "
+                             "templates change.")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE,
+                        help="Seconds without changes before --watch installs changed packages.")
+    parser.add_argument("--homes", type=Path, nargs="+", default=None,
+                        help="Install into each of these home directories instead of the current user's.")
+    parser.add_argument("--homes-file", type=Path, default=None,
+                        help="File listing home directories for --homes, one per line.")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Number of homes processed concurrently with --homes (default: number of CPUs).")
+    parser.add_argument("--status", action="store_true",
+                        help="Report whether each destination is linked correctly instead of installing.")
+    parser.add_argument("--json", action="store_true", help="Print --status report as JSON.")
+    parser.add_argument("--profile", type=Path, default=None,
+                        help="Write Chrome trace-event JSON of each package, phase and entry to this file.")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="DEBUG",
+                        help="Level of messages written to dotfiles.log.")
+    parser.add_argument("--log-format", choices=LOG_FORMATS, default=LOG_TEXT,
+                        help="Write dotfiles.log as plain text or as one JSON object per line.")
+    parser.add_argument("--log-max-bytes", type=int, default=LOG_MAX_BYTES,
+                        help="Size at which dotfiles.log is rotated.")
+    parser.add_argument("--log-backups", type=int, default=LOG_BACKUPS,
+                        help="Number of rotated dotfiles.log files kept.")
     args = parser.parse_args()
 
-    handle = logging.FileHandler(Path(__file__).parent / 'dotfiles.log')
-    handle.setLevel(logging.DEBUG)
-    handle.setFormatter(logging.Formatter("%(asctime)s [%(levelname)-8s]: %(message)s"))
-    LOGGER.addHandler(handle)
-
-    main(package_base=Path.cwd(), home_dir=Path.home(), is_restore=args.restore, is_dry_run=args.dry_run, )
+    LOGGER.setLevel(args.log_level)
+    homes = (args.homes or []) + (read_homes(args.homes_file) if args.homes_file is not None else [])
+    if not (args.restore or args.prune or args.rollback or args.watch or homes or args.profile):
+        packages = check_fingerprint(Path.cwd(), Path.home())
+        if packages is not None:
+            if args.status:
+                report = fingerprint_status(packages)
+                print(json.dumps(report, indent=2) if args.json else "\n".join(format_status(report)))
+            elif args.dry_run:
+                print("\n".join(f"{name}: up to date" for name in packages))
+            sys.exit(0)
+
+    log_queue = None
+    if homes:
+        from multiprocessing import Queue
+
+        log_queue = Queue()
+    with log_pipeline(Path(__file__).parent / LOG_FILE, args.log_level, args.log_format, args.log_max_bytes,
+                      args.log_backups, log_queue) as log_queue:
+        report = main(package_base=Path.cwd(), home_dir=Path.home(), is_restore=args.restore,
+                      is_dry_run=args.dry_run, jobs=args.jobs, backup_format=args.backup_format, prune=args.prune,
+                      keep=args.keep, keep_days=args.keep_days, profile=args.profile, status=args.status,
+                      rollback=args.rollback, homes=homes or None, processes=args.processes, watch=args.watch,
+                      debounce=args.debounce, log_queue=log_queue, )
+    if args.status:
+        print(json.dumps(report, indent=2) if args.json else "\n".join(format_status(report)))
+        sys.exit(0 if report["summary"][LINKED] == sum(report["summary"].values()) else 1)
+    if homes:
+        print(json.dumps(report, indent=2) if args.json else "\n".join(format_fleet(report)))
+        sys.exit(0 if report["summary"]["failed"] == 0 else 1)